@@ -6,12 +6,13 @@ Notionデータベースの設定を確認するスクリプト
 
 import os
 import sys
-import json
-import urllib.request
-import urllib.error
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+import sync_affiling_articles as aff
+from utils.database_registry import revalidate_on_failure
+from utils.notion_client import NotionAPIError, notion_request
 
-NOTION_API_BASE = "https://api.notion.com/v1"
-NOTION_VERSION = "2022-06-28"
 
 def get_env_var(name: str) -> str:
     value = os.environ.get(name)
@@ -20,41 +21,10 @@ def get_env_var(name: str) -> str:
         sys.exit(1)
     return value
 
-def notion_request(method: str, path: str, token: str, payload=None):
-    url = f"{NOTION_API_BASE}{path}"
-    data = None
-    if payload is not None:
-        data = json.dumps(payload).encode("utf-8")
-
-    req = urllib.request.Request(url=url, data=data, method=method)
-    req.add_header("Authorization", f"Bearer {token}")
-    req.add_header("Notion-Version", NOTION_VERSION)
-    if data:
-        req.add_header("Content-Type", "application/json")
-
-    try:
-        with urllib.request.urlopen(req) as response:
-            body = response.read().decode("utf-8")
-            if not body:
-                return {}
-            return json.loads(body)
-    except urllib.error.HTTPError as error:
-        error_body = error.read().decode("utf-8")
-        print(f"[ERROR] Notion API 呼び出しに失敗しました: {error.code} {error.reason}", file=sys.stderr)
-        if error_body:
-            try:
-                error_data = json.loads(error_body)
-                print(f"[ERROR] エラー詳細: {error_data}", file=sys.stderr)
-            except:
-                print(f"[ERROR] エラーレスポンス: {error_body}", file=sys.stderr)
-        sys.exit(1)
-
 def check_database():
     token = get_env_var("NOTION_API_TOKEN")
     
     # データベースを検索
-    sys.path.insert(0, 'scripts')
-    import sync_affiling_articles as aff
     db_id, _ = aff.ensure_database(token)
     
     print(f"\n{'='*60}")
@@ -168,6 +138,14 @@ def check_database():
     
     print(f"\n{'='*60}")
 
+def main():
+    try:
+        # 保存済みのデータベースIDが無効な場合は、同期スクリプトと同じく再検索してやり直す
+        revalidate_on_failure(aff.DATABASE_NAME)(check_database)()
+    except NotionAPIError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        sys.exit(1)
+
 if __name__ == "__main__":
-    check_database()
+    main()
 
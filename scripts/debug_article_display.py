@@ -7,12 +7,13 @@ Notionからフロントエンドまで全てを確認します
 import os
 import sys
 import json
-import urllib.request
-import urllib.error
 from pathlib import Path
 
-NOTION_API_BASE = "https://api.notion.com/v1"
-NOTION_VERSION = "2022-06-28"
+sys.path.insert(0, str(Path(__file__).parent))
+import sync_affiling_articles as aff
+from utils.database_registry import is_stale_database_error, revalidate_on_failure
+from utils.notion_client import NotionAPIError, notion_request
+
 
 def get_env_var(name: str) -> str:
     value = os.environ.get(name)
@@ -21,35 +22,6 @@ def get_env_var(name: str) -> str:
         sys.exit(1)
     return value
 
-def notion_request(method: str, path: str, token: str, payload=None):
-    url = f"{NOTION_API_BASE}{path}"
-    data = None
-    if payload is not None:
-        data = json.dumps(payload).encode("utf-8")
-
-    req = urllib.request.Request(url=url, data=data, method=method)
-    req.add_header("Authorization", f"Bearer {token}")
-    req.add_header("Notion-Version", NOTION_VERSION)
-    if data:
-        req.add_header("Content-Type", "application/json")
-
-    try:
-        with urllib.request.urlopen(req) as response:
-            body = response.read().decode("utf-8")
-            if not body:
-                return {}
-            return json.loads(body)
-    except urllib.error.HTTPError as error:
-        error_body = error.read().decode("utf-8")
-        print(f"[ERROR] Notion API 呼び出しに失敗しました: {error.code} {error.reason}", file=sys.stderr)
-        if error_body:
-            try:
-                error_data = json.loads(error_body)
-                print(f"[ERROR] エラー詳細: {error_data}", file=sys.stderr)
-            except:
-                print(f"[ERROR] エラーレスポンス: {error_body}", file=sys.stderr)
-        return None
-
 def debug_all():
     print("="*60)
     print("記事表示問題のデバッグ")
@@ -69,8 +41,6 @@ def debug_all():
     # 2. Notionデータベースの確認
     print("\n2. Notionデータベースの確認")
     print("-"*60)
-    sys.path.insert(0, 'scripts')
-    import sync_affiling_articles as aff
     db_id, _ = aff.ensure_database(token)
     print(f"データベースID: {db_id}")
     
@@ -80,7 +50,13 @@ def debug_all():
             "select": {"equals": "Published"}
         }
     }
-    response = notion_request("POST", f"/databases/{db_id}/query", token, query_payload)
+    try:
+        response = notion_request("POST", f"/databases/{db_id}/query", token, query_payload)
+    except NotionAPIError as e:
+        # 保存済みのIDが無効な場合は、main の revalidate_on_failure で再検索する
+        if is_stale_database_error(e, db_id):
+            raise
+        response = None
     if not response:
         print("❌ データベースのクエリに失敗しました")
         return
@@ -100,10 +76,10 @@ def debug_all():
         
         # ページ本文を確認
         try:
-            blocks = aff.fetch_page_blocks(page["id"], token)
+            blocks = aff.fetch_block_tree(page["id"], token)
             print(f"   ページブロック数: {len(blocks)}個")
             if len(blocks) > 0:
-                html_content = aff.blocks_to_html(blocks, token)
+                html_content = aff.blocks_to_html(blocks)
                 print(f"   ✅ ページ本文からHTMLを生成: {len(html_content)}文字")
             else:
                 print(f"   ⚠️ ページ本文が空です")
@@ -197,6 +173,10 @@ def debug_all():
             if empty_count > 0:
                 print(f"- ⚠️ コンテンツなし: {empty_count}件")
 
+def main():
+    # 保存済みのデータベースIDが無効な場合は、同期スクリプトと同じく再検索してやり直す
+    revalidate_on_failure(aff.DATABASE_NAME)(debug_all)()
+
 if __name__ == "__main__":
-    debug_all()
+    main()
 
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+データセットをまたいで画像を重複排除し、参照を1つの永続URLに揃える
+data/ 以下のJSON（グリッド画像・プロジェクト画像・記事のアイキャッチと本文の<img>）から
+画像の参照を集め、異なる画像ごとに1回だけアップロードしてから、すべての参照を書き換えます。
+- Notionの一時URL: 画像キャッシュにあれば再利用し、なければダウンロードしてアップロード
+  （--upload-by-url の場合はURLを渡してCloudflare側で取得させる）
+- Cloudflare ImagesのURL: 同じ画像が別のURLでアップロード済みなら、最初のURLに揃える
+- ローカル画像（image/...）: --include-local を付けた場合のみアップロード
+URLを書き換えた画像に srcset があれば、新しいURLのバリアントで作り直します。
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).parent))
+from utils.cloudflare_images import (
+    DEFAULT_IMAGE_UPLOAD_CONCURRENCY,
+    enable_upload_by_url,
+    is_cloudflare_url,
+    is_permanent_url,
+)
+from utils.image_cache import IMAGE_CACHE
+from utils.image_dedup import DEDUP_STATS, enable_perceptual_hash
+from utils.image_preprocess import enable_preprocessing
+from utils.image_refs import iter_image_refs, rewrite_refs
+from utils.image_resolver import IMAGE_RESOLVER, print_resolver_stats
+from utils.upload_manifest import manifest_key, upload_local_files
+
+
+PROJECT_ROOT = Path(__file__).parent.parent
+DATA_DIR = PROJECT_ROOT / "data"
+DATASET_FILES = [
+    "sns_grids.json",
+    "ec_projects.json",
+    "dev_projects.json",
+    "affiling_articles.json",
+    "note_articles.json",
+    "writing_articles.json",
+]
+LOCAL_IMAGE_PREFIX = "image/"
+
+
+def upload_local_images(paths: List[str], concurrency: int) -> Dict[str, str]:
+    files: Dict[Path, Optional[str]] = {}
+    for path in paths:
+        local_path = PROJECT_ROOT / path
+        if not local_path.is_file():
+            print(f"[WARNING] ローカル画像が見つかりません: {path}", file=sys.stderr)
+            continue
+        files[local_path] = None
+    # マニフェストに記録済みで変更のないファイルは読み込まずに永続URLを使う
+    result = upload_local_files(files, concurrency=concurrency)
+    print(f"[INFO] ローカル画像: {result.summary()}", file=sys.stderr)
+    return {manifest_key(path): url for path, url in result.urls.items()}
+
+
+def resolve_refs(refs: List[str], include_local: bool, concurrency: int) -> Dict[str, str]:
+    """参照ごとの置き換え先URLを決める（異なる画像ごとに1回だけダウンロード・アップロード）"""
+    mapping: Dict[str, str] = {}
+    temporary: Dict[str, Optional[str]] = {}
+    local: List[str] = []
+    for url in dict.fromkeys(refs):
+        if is_cloudflare_url(url):
+            mapping[url] = IMAGE_CACHE.canonical_url(url)
+        elif url.startswith(LOCAL_IMAGE_PREFIX):
+            if include_local:
+                local.append(url)
+        elif not is_permanent_url(url):
+            temporary[url] = None
+
+    if temporary:
+        mapping.update(IMAGE_RESOLVER.resolve_many(temporary, concurrency=concurrency))
+    if local:
+        mapping.update(upload_local_images(local, concurrency))
+    return mapping
+
+
+def dedupe_datasets(
+    paths: List[Path],
+    include_local: bool = False,
+    dry_run: bool = False,
+    concurrency: int = DEFAULT_IMAGE_UPLOAD_CONCURRENCY,
+) -> Dict[str, int]:
+    datasets = {}
+    refs: List[str] = []
+    for path in paths:
+        if not path.exists():
+            continue
+        with path.open("r", encoding="utf-8") as fp:
+            datasets[path] = json.load(fp)
+        refs.extend(iter_image_refs(datasets[path]))
+
+    mapping = resolve_refs(refs, include_local, concurrency)
+
+    rewritten: Dict[str, int] = {}
+    for path, data in datasets.items():
+        data, count = rewrite_refs(data, mapping)
+        rewritten[path.name] = count
+        if count and not dry_run:
+            tmp_path = path.with_suffix(".tmp")
+            with tmp_path.open("w", encoding="utf-8") as fp:
+                json.dump(data, fp, ensure_ascii=False, indent=2)
+            tmp_path.replace(path)
+
+    print(f"[INFO] 画像の参照 {len(refs)} 件（異なるURL {len(set(refs))} 件）を確認しました", file=sys.stderr)
+    for name, count in rewritten.items():
+        if count:
+            print(f"[INFO] {name}: {count} 件の参照を書き換え{'（dry-run のため保存なし）' if dry_run else 'ました'}", file=sys.stderr)
+    return rewritten
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="データセットをまたいで画像を重複排除し、参照を1つの永続URLに揃えます。")
+    parser.add_argument("files", nargs="*", type=Path, help=f"対象のJSON（既定: data/ 以下の {len(DATASET_FILES)} ファイル）")
+    parser.add_argument("--include-local", action="store_true", help="ローカル画像（image/...）もアップロードして置き換えます。")
+    parser.add_argument("--perceptual", action="store_true", help="知覚ハッシュで見た目が同じ画像の候補を集計します（参照は書き換えません。Pillow が必要）。")
+    parser.add_argument(
+        "--preprocess",
+        action="store_true",
+        help="アップロード前に縮小・メタデータ削除・WebP/AVIFへの再エンコードを行います（Pillow が必要）。",
+    )
+    parser.add_argument(
+        "--upload-by-url",
+        action="store_true",
+        help="Notionの一時URLをCloudflare Imagesに渡して取得させます（失敗した場合はダウンロードしてアップロード）。",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="書き換える件数だけを表示し、JSONは保存しません。")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_IMAGE_UPLOAD_CONCURRENCY,
+        help=f"画像のダウンロード・アップロードの同時実行数（既定: {DEFAULT_IMAGE_UPLOAD_CONCURRENCY}）",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if args.perceptual:
+        enable_perceptual_hash()
+    if args.preprocess:
+        enable_preprocessing()
+    if args.upload_by_url:
+        enable_upload_by_url()
+    paths = args.files or [DATA_DIR / name for name in DATASET_FILES]
+    dedupe_datasets(paths, include_local=args.include_local, dry_run=args.dry_run, concurrency=args.concurrency)
+    print_resolver_stats()
+    print(f"[DONE] {DEDUP_STATS.summary()}")
+
+
+if __name__ == "__main__":
+    main()
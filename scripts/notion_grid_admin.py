@@ -1,11 +1,17 @@
 import json
 import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from http import HTTPStatus
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from typing import Dict, Iterable, List, Tuple
-from urllib.parse import parse_qs
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
 
 import sync_notion_grids as sns_sync
 import sync_writing_articles as writing_sync
@@ -13,11 +19,20 @@ import sync_note_articles as note_sync
 import sync_ec_projects as ec_sync
 import sync_app_development as dev_sync
 import sync_affiling_articles as affiling_sync
+from utils.database_registry import revalidate_on_failure
+from utils.image_resolver import IMAGE_RESOLVER
+from utils.notion_client import forget_property_ids
+from utils.jobs import Job, JobCancelled, JobRunner
 
 
 HOST = "127.0.0.1"
 PORT = 8765
 
+# pull / push はリクエストハンドラから切り離してバックグラウンドで実行する
+JOB_RUNNER = JobRunner()
+# ステータス（Notion件数・ローカル件数）のキャッシュ有効期間
+STATUS_CACHE_TTL_SECONDS = 60
+
 
 @dataclass(frozen=True)
 class DatasetConfig:
@@ -125,9 +140,15 @@ def get_static_dataset_length(config: DatasetConfig) -> int:
 
 
 def ensure_dataset_status(token: str, config: DatasetConfig) -> Dict:
+    # 保存済みのデータベースIDが無効になっていた場合は再検索してやり直す
+    return revalidate_on_failure(config.module.DATABASE_NAME)(collect_dataset_status)(token, config)
+
+
+def collect_dataset_status(token: str, config: DatasetConfig) -> Dict:
     module = config.module
     database_id, _ = module.ensure_database(token)
-    notion_records = module.fetch_existing_pages(database_id, token)
+    # 件数だけが必要なため、タイトル以外のプロパティは取得しない
+    notion_records = module.fetch_existing_pages(database_id, token, properties=[])
     local_records = load_local_json(module.DEFAULT_EXPORT_PATH)
     return {
         "key": config.key,
@@ -142,22 +163,204 @@ def ensure_dataset_status(token: str, config: DatasetConfig) -> Dict:
     }
 
 
-def perform_pull(token: str, configs: Iterable[DatasetConfig]) -> None:
-    for config in configs:
+def error_status(config: DatasetConfig, error: Exception) -> Dict:
+    """ステータスを取得できなかったデータセットの行（キャッシュしない）"""
+    module = config.module
+    return {
+        "key": config.key,
+        "label": config.label,
+        "description": config.description,
+        "database_id": "—",
+        "notion_count": "—",
+        "local_count": "—",
+        "static_count": get_static_dataset_length(config),
+        "export_path": str(module.DEFAULT_EXPORT_PATH),
+        "notes": list(config.notes),
+        "error": str(error),
+    }
+
+
+class StatusCache:
+    """
+    データセットのステータスをTTL付きでキャッシュする
+    期限切れのエントリは古い値をそのまま返しつつ、バックグラウンドで再取得します
+    （stale-while-revalidate）。pull / push の完了時には invalidate() で破棄します。
+    invalidate() はデータセットごとの世代を進め、それより前に始まった取得の結果は保存しません。
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[str, Tuple[Dict, float]] = {}
+        self._refreshing: set = set()
+        self._generations: Dict[str, int] = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def _generation(self, key: str) -> Tuple[int, int]:
+        return self._epoch, self._generations.get(key, 0)
+
+    def _store(self, key: str, status: Dict, generation: Tuple[int, int]) -> bool:
+        """取得を始めた後に invalidate() されていなければ保存する（self._lock を保持して呼ぶ）"""
+        if self._generation(key) != generation:
+            return False
+        self._entries[key] = (status, time.monotonic())
+        return True
+
+    def get_all(self, token: str, configs: Iterable[DatasetConfig]) -> List[Dict]:
+        configs = list(configs)
+        now = time.monotonic()
+        results: Dict[str, Dict] = {}
+        missing: List[Tuple[DatasetConfig, Tuple[int, int]]] = []
+        stale: List[Tuple[DatasetConfig, Tuple[int, int]]] = []
+
+        with self._lock:
+            for config in configs:
+                entry = self._entries.get(config.key)
+                if entry is None:
+                    missing.append((config, self._generation(config.key)))
+                    continue
+                results[config.key] = entry[0]
+                if now - entry[1] >= self.ttl_seconds and config.key not in self._refreshing:
+                    self._refreshing.add(config.key)
+                    stale.append((config, self._generation(config.key)))
+
+        for config, generation in stale:
+            threading.Thread(target=self._refresh, args=(token, config, generation), daemon=True).start()
+
+        def fetch(config: DatasetConfig) -> Tuple[Dict, bool]:
+            # 1つのデータセットの失敗でページ全体を失敗させず、その行にエラーを表示する
+            try:
+                return ensure_dataset_status(token, config), True
+            except Exception as e:
+                print(f"[WARNING] {config.label} のステータス取得に失敗しました: {e}", file=sys.stderr)
+                return error_status(config, e), False
+
+        # キャッシュがないデータセットはその場で（並列に）取得する
+        if missing:
+            with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+                fetched = list(executor.map(lambda item: fetch(item[0]), missing))
+            with self._lock:
+                for (config, generation), (status, ok) in zip(missing, fetched):
+                    if ok:
+                        self._store(config.key, status, generation)
+                    results[config.key] = status
+
+        return [results[config.key] for config in configs]
+
+    def _refresh(self, token: str, config: DatasetConfig, generation: Tuple[int, int]) -> None:
         try:
-            module = config.module
-            result = module.export_notion_to_json(token, module.DEFAULT_EXPORT_PATH)
-            print(f"[PULL] {config.label}: {result.get('notion_count', 0)}件をエクスポートしました -> {result.get('file', '')}")
+            status = ensure_dataset_status(token, config)
+            with self._lock:
+                # 取得中に pull / push が終わっていた場合は、古い件数なので保存しない
+                self._store(config.key, status, generation)
         except Exception as e:
-            print(f"[ERROR] {config.label} の同期に失敗しました: {e}", file=sys.stderr)
-            import traceback
-            traceback.print_exc()
+            print(f"[WARNING] {config.label} のステータス更新に失敗しました: {e}", file=sys.stderr)
+        finally:
+            with self._lock:
+                self._refreshing.discard(config.key)
+
+    def invalidate(self, keys: Optional[Iterable[str]] = None) -> None:
+        with self._lock:
+            if keys is None:
+                self._entries.clear()
+                self._epoch += 1
+            else:
+                for key in keys:
+                    self._entries.pop(key, None)
+                    self._generations[key] = self._generations.get(key, 0) + 1
+
+
+STATUS_CACHE = StatusCache(STATUS_CACHE_TTL_SECONDS)
+
+
+def _run_dataset(config: DatasetConfig, run: Callable[[Optional[Callable[[int], None]]], Dict], job: Optional[Job]) -> Dict:
+    """1データセット分の処理を実行し、所要時間と結果を返す（ジョブがあれば進捗も更新）"""
+    progress = job.page_progress(config.key) if job else None
+    if job:
+        job.check_cancelled()
+        job.update_dataset(config.key, status="running")
+
+    started_at = time.monotonic()
+    try:
+        result = run(progress)
+    except JobCancelled:
+        if job:
+            job.update_dataset(config.key, status="cancelled", seconds=time.monotonic() - started_at)
+        raise
+    except Exception as e:
+        elapsed = time.monotonic() - started_at
+        print(f"[ERROR] {config.label} の同期に失敗しました: {e}", file=sys.stderr)
+        traceback.print_exc()
+        if job:
+            job.update_dataset(config.key, status="failed", seconds=elapsed, error=str(e))
+        return {
+            "key": config.key,
+            "label": config.label,
+            "ok": False,
+            "error": str(e),
+            "seconds": elapsed,
+        }
+
+    elapsed = time.monotonic() - started_at
+    if job:
+        job.update_dataset(config.key, status="succeeded", seconds=elapsed)
+    return {"key": config.key, "label": config.label, "ok": True, "seconds": elapsed, **(result or {})}
+
+
+def pull_dataset(token: str, config: DatasetConfig, job: Optional[Job] = None) -> Dict:
+    """1データセット分の pull を実行し、所要時間と結果を返す"""
+    module = config.module
+
+    def run(progress):
+        return module.export_notion_to_json(token, module.DEFAULT_EXPORT_PATH, progress=progress)
+
+    result = _run_dataset(config, run, job)
+    if result["ok"]:
+        print(f"[PULL] {config.label}: {result.get('notion_count', 0)}件をエクスポートしました -> {result.get('file', '')} ({result['seconds']:.1f}秒)")
+    return result
+
+
+def perform_pull(token: str, configs: Iterable[DatasetConfig], job: Optional[Job] = None) -> List[Dict]:
+    """
+    データセットごとの pull を並列に実行する
+    各データセットは独立したデータベースのため同時に取得し、
+    Notion へのリクエストは utils.notion_client の共有レート制限で全体の送信ペースを抑えます。
+    """
+    configs = list(configs)
+    if not configs:
+        return []
+
+    started_at = time.monotonic()
+    with ThreadPoolExecutor(max_workers=len(configs)) as executor:
+        futures = [executor.submit(pull_dataset, token, config, job) for config in configs]
+        results = []
+        for config, future in zip(configs, futures):
+            try:
+                results.append(future.result())
+            except JobCancelled:
+                results.append({"key": config.key, "label": config.label, "ok": False, "error": "cancelled"})
 
+    succeeded = sum(1 for result in results if result["ok"])
+    print(f"[PULL] {succeeded}/{len(results)} 件のデータセットを取得しました（合計 {time.monotonic() - started_at:.1f}秒）")
+    return results
 
-def perform_push(token: str, configs: Iterable[DatasetConfig], reset: bool) -> None:
+
+def perform_push(token: str, configs: Iterable[DatasetConfig], reset: bool, job: Optional[Job] = None) -> List[Dict]:
+    results = []
     for config in configs:
         module = config.module
-        module.sync_to_notion(token, reset=reset)
+
+        def run(progress, module=module):
+            return module.sync_to_notion(token, reset=reset, progress=progress)
+
+        result = _run_dataset(config, run, job)
+        if result["ok"]:
+            print(
+                f"[PUSH] {config.label}: 作成 {result.get('created', 0)} / 更新 {result.get('updated', 0)} / "
+                f"変更なし {result.get('unchanged', 0)} ({result['seconds']:.1f}秒)"
+            )
+        results.append(result)
+    return results
 
 
 class AdminHandler(BaseHTTPRequestHandler):
@@ -165,10 +368,19 @@ class AdminHandler(BaseHTTPRequestHandler):
     datasets: Dict[str, DatasetConfig] = {cfg.key: cfg for cfg in DATASET_CONFIGS}
 
     def do_GET(self):
-        if self.path in ("/", "/admin"):
+        path = urlsplit(self.path).path
+        if path in ("/", "/admin"):
             self.render_admin_page()
-        elif self.path == "/status":
+        elif path == "/status":
             self.render_status_json()
+        elif path == "/jobs":
+            self.send_json([job.to_dict() for job in JOB_RUNNER.list()])
+        elif path.startswith("/jobs/"):
+            job = JOB_RUNNER.get(path[len("/jobs/"):])
+            if job is None:
+                self.send_error(HTTPStatus.NOT_FOUND, "Unknown job")
+                return
+            self.send_json(job.to_dict())
         else:
             self.send_error(HTTPStatus.NOT_FOUND, "Not Found")
 
@@ -177,6 +389,15 @@ class AdminHandler(BaseHTTPRequestHandler):
         body = self.rfile.read(length).decode("utf-8")
         params = parse_qs(body)
 
+        path = urlsplit(self.path).path
+        if path.startswith("/jobs/") and path.endswith("/cancel"):
+            job = JOB_RUNNER.cancel(path[len("/jobs/"):-len("/cancel")])
+            if job is None:
+                self.send_error(HTTPStatus.NOT_FOUND, "Unknown job")
+                return
+            self.redirect("/")
+            return
+
         action = params.get("action", [""])[0]
         dataset_key = params.get("dataset", [""])[0]
         reset = params.get("reset", ["off"])[0] == "on"
@@ -187,32 +408,87 @@ class AdminHandler(BaseHTTPRequestHandler):
 
         try:
             if dataset_key == "all":
-                configs = self.datasets.values()
+                configs = list(self.datasets.values())
             else:
                 configs = [self.datasets[dataset_key]]
         except KeyError:
             self.send_error(HTTPStatus.BAD_REQUEST, "Unknown dataset")
             return
 
-        if action == "pull":
-            perform_pull(self.token, configs)
-        elif action == "push":
-            perform_push(self.token, configs, reset=reset)
+        token = self.token
+        dataset_keys = [config.key for config in configs]
+
+        def run_job(job: Job) -> None:
+            # 前のジョブで解決した一時URLの結果やプロパティIDを持ち越さない（ジョブは1件ずつ実行される）
+            IMAGE_RESOLVER.reset()
+            forget_property_ids()
+            try:
+                if action == "pull":
+                    perform_pull(token, configs, job=job)
+                else:
+                    perform_push(token, configs, reset=reset, job=job)
+            finally:
+                # 件数が変わっているため、対象データセットのステータスを破棄する
+                STATUS_CACHE.invalidate(dataset_keys)
+
+        JOB_RUNNER.submit(action, dataset_keys, run_job)
 
         self.redirect("/")
 
     # -- helpers ---------------------------------------------------------
-    def render_status_json(self):
-        payload = [ensure_dataset_status(self.token, cfg) for cfg in DATASET_CONFIGS]
+    def send_json(self, payload, status: HTTPStatus = HTTPStatus.OK):
         encoded = json.dumps(payload, ensure_ascii=False).encode("utf-8")
-        self.send_response(HTTPStatus.OK)
+        self.send_response(status)
         self.send_header("Content-Type", "application/json; charset=utf-8")
         self.send_header("Content-Length", str(len(encoded)))
         self.end_headers()
         self.wfile.write(encoded)
 
+    def render_status_json(self):
+        payload = STATUS_CACHE.get_all(self.token, DATASET_CONFIGS)
+        self.send_json(payload)
+
+    def render_jobs_html(self) -> str:
+        jobs = JOB_RUNNER.list()[:5]
+        if not jobs:
+            return ""
+
+        rows_html = ""
+        for job in jobs:
+            info = job.to_dict()
+            datasets_html = " / ".join(
+                f"{key}: {progress['status']} ({progress['pages']} 件)"
+                for key, progress in info["datasets"].items()
+            )
+            cancel_html = ""
+            if not job.finished and not info["cancel_requested"]:
+                cancel_html = f"""
+        <form method="post" action="/jobs/{info["id"]}/cancel">
+          <button type="submit">キャンセル</button>
+        </form>"""
+            rows_html += f"""
+      <li>
+        <a href="/jobs/{info["id"]}">{info["id"]}</a> {info["action"]} — {info["status"]}
+        <div class="job-datasets">{datasets_html}</div>{cancel_html}
+      </li>"""
+
+        return f"""
+  <section class="card jobs">
+    <header>
+      <h2>ジョブ</h2>
+    </header>
+    <ul>{rows_html}
+    </ul>
+  </section>
+"""
+
     def render_admin_page(self):
-        statuses = [ensure_dataset_status(self.token, cfg) for cfg in DATASET_CONFIGS]
+        statuses = STATUS_CACHE.get_all(self.token, DATASET_CONFIGS)
+        jobs_html = self.render_jobs_html()
+        # 実行中のジョブがあれば進捗を表示するため定期的に再読み込みする
+        refresh_html = ""
+        if any(not job.finished for job in JOB_RUNNER.list()):
+            refresh_html = '\n  <meta http-equiv="refresh" content="5">'
 
         sections_html = ""
         for status in statuses:
@@ -220,6 +496,12 @@ class AdminHandler(BaseHTTPRequestHandler):
             if status["notes"]:
                 notes_html = "    <ul class=\"notes\">\n" + "\n".join(f"      <li>{note}</li>" for note in status["notes"]) + "\n    </ul>\n"
 
+            error_html = ""
+            if status.get("error"):
+                error_html = f"""
+      <dt>エラー</dt>
+      <dd class="error">{escape(status["error"])}</dd>"""
+
             sections_html += f"""
   <section class="card">
     <header>
@@ -235,7 +517,7 @@ class AdminHandler(BaseHTTPRequestHandler):
       <dt>静的データセット</dt>
       <dd>{status["static_count"]} 件</dd>
       <dt>ローカル JSON</dt>
-      <dd>{status["local_count"]} 件 ({status["export_path"]})</dd>
+      <dd>{status["local_count"]} 件 ({status["export_path"]})</dd>{error_html}
     </dl>
     <div class="actions">
       <form method="post" action="/action">
@@ -259,7 +541,7 @@ class AdminHandler(BaseHTTPRequestHandler):
         html = f"""<!DOCTYPE html>
 <html lang="ja">
 <head>
-  <meta charset="UTF-8">
+  <meta charset="UTF-8">{refresh_html}
   <title>Synthera Project Admin</title>
   <style>
     body {{
@@ -355,6 +637,9 @@ class AdminHandler(BaseHTTPRequestHandler):
       margin: 0;
       color: #dfdfdf;
     }}
+    dd.error {{
+      color: #ff7b7b;
+    }}
     .actions {{
       display: flex;
       flex-wrap: wrap;
@@ -365,6 +650,18 @@ class AdminHandler(BaseHTTPRequestHandler):
       align-items: center;
       gap: 10px;
     }}
+    .jobs ul {{
+      margin: 0;
+      padding-left: 20px;
+      line-height: 1.8;
+    }}
+    .jobs a {{
+      color: #7ddaff;
+    }}
+    .job-datasets {{
+      color: #b5b5b5;
+      font-size: 13px;
+    }}
   </style>
 </head>
 <body>
@@ -386,7 +683,7 @@ class AdminHandler(BaseHTTPRequestHandler):
     </form>
   </div>
   <div class="grid">
-{sections_html}
+{jobs_html}{sections_html}
   </div>
 </body>
 </html>"""
@@ -407,7 +704,8 @@ def run_server():
     token = get_env_value("NOTION_API_TOKEN")
     AdminHandler.token = token
 
-    with HTTPServer((HOST, PORT), AdminHandler) as httpd:
+    # ジョブ実行中も /status やジョブ進捗を返せるよう、リクエストごとにスレッドで処理する
+    with ThreadingHTTPServer((HOST, PORT), AdminHandler) as httpd:
         print(f"[ADMIN] ブラウザで http://{HOST}:{PORT}/ を開いてください。Ctrl+C で終了します。")
         httpd.serve_forever()
 
@@ -1,20 +1,40 @@
 import argparse
 import json
 import os
+import re
 import sys
-import urllib.error
-import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
 # Cloudflare Images統合
 sys.path.insert(0, str(Path(__file__).parent))
-from utils.cloudflare_images import upload_image_from_url
+from utils.block_cache import BLOCK_CACHE
+from utils.cloudflare_images import DEFAULT_IMAGE_UPLOAD_CONCURRENCY, is_cloudflare_url
+from utils import html_nodes
+from utils.html_nodes import (
+    Element,
+    Fragment,
+    Node,
+    Raw,
+    add_lazy_loading,
+    collapse_blank_lines,
+    is_tracking_pixel,
+    iter_raw,
+    serialize,
+    trim_paragraph,
+)
+from utils.html_stream import IMG_TAG_PATTERN, RemoveTrackingPixels, SubImgTags, transform
+from utils.http_pool import print_connection_stats
+from utils.image_cache import IMAGE_CACHE, source_key
+from utils.image_resolver import IMAGE_RESOLVER, print_resolver_stats
+from utils.database_registry import lookup_database_id, remember_database_id, revalidate_on_failure
+from utils.notion_client import iter_titled_pages, notion_request, query_database
+from utils.notion_upsert import UpsertResult, archive_pages, upsert_records, written_properties
+from utils.responsive_images import ARTICLE_IMAGE_SIZES, build_srcset, image_size, responsive_attrs
+from utils.sync_state import IncrementalExport
 
 
-NOTION_API_BASE = "https://api.notion.com/v1"
-NOTION_VERSION = "2022-06-28"
-
 AFFILING_ARTICLE_DATA: List[Dict] = [
     {
         "title": "【2024年版】おすすめノートPC比較ランキング TOP5",
@@ -32,7 +52,25 @@ AFFILING_ARTICLE_DATA: List[Dict] = [
 
 ROOT_PAGE_NAME = "synthera database"
 DATABASE_NAME = "Affiling Articles Manager"
+TITLE_PROPERTY = "Title"
+# pull で読み込むプロパティ（使わない Content / Comment などの大きなプロパティは取得しない）
+ARTICLE_PROPERTIES = [
+    TITLE_PROPERTY,
+    "Excerpt",
+    "Category",
+    "Date",
+    "Image",
+    "Read Time",
+    "Product Count",
+    "Tags",
+    "Status",
+]
 DEFAULT_EXPORT_PATH = Path("data/affiling_articles.json")
+# 記事本文を並列取得する際の既定ワーカー数（1 = 逐次処理）
+# リクエストは utils.notion_client のレート制限を共有するため、並列化しても制限を超えない
+DEFAULT_PULL_CONCURRENCY = 4
+# ブロックツリーの同じ階層の子ブロックを並列取得する際のワーカー数（記事ごと）
+DEFAULT_BLOCK_FETCH_CONCURRENCY = 4
 
 
 def get_env_value(key: str) -> str:
@@ -43,31 +81,6 @@ def get_env_value(key: str) -> str:
     return value
 
 
-def notion_request(method: str, path: str, token: str, payload: Optional[Dict]) -> Dict:
-    url = f"{NOTION_API_BASE}{path}"
-    data = None
-    if payload is not None:
-        data = json.dumps(payload).encode("utf-8")
-
-    req = urllib.request.Request(url=url, data=data, method=method)
-    req.add_header("Authorization", f"Bearer {token}")
-    req.add_header("Notion-Version", NOTION_VERSION)
-    req.add_header("Content-Type", "application/json")
-
-    try:
-        with urllib.request.urlopen(req) as response:
-            body = response.read().decode("utf-8")
-            if not body:
-                return {}
-            return json.loads(body)
-    except urllib.error.HTTPError as error:
-        error_body = error.read().decode("utf-8")
-        print(f"[ERROR] Notion API 呼び出しに失敗しました: {error.code} {error.reason}", file=sys.stderr)
-        if error_body:
-            print(error_body, file=sys.stderr)
-        sys.exit(1)
-
-
 def notion_search(token: str, query: str, object_type: str) -> List[Dict]:
     payload = {"query": query, "filter": {"value": object_type, "property": "object"}}
     response = notion_request("POST", "/search", token, payload)
@@ -84,11 +97,18 @@ def _resolve_root_page(token: str) -> Optional[str]:
 
 
 def ensure_database(token: str) -> Tuple[str, bool]:
+    # 解決済みのIDがあれば /search を省略（無効なIDは revalidate_on_failure が破棄する）
+    cached_id = lookup_database_id(DATABASE_NAME)
+    if cached_id:
+        return cached_id, False
+
     database_results = notion_search(token, DATABASE_NAME, "database")
     for result in database_results:
         title_property = result.get("title", [])
         if title_property and title_property[0].get("plain_text", "") == DATABASE_NAME:
-            return result["id"].replace("-", ""), False
+            database_id = result["id"].replace("-", "")
+            remember_database_id(DATABASE_NAME, database_id)
+            return database_id, False
 
     parent_page_id = _resolve_root_page(token)
     if not parent_page_id:
@@ -129,36 +149,14 @@ def ensure_database(token: str) -> Tuple[str, bool]:
     }
 
     created_database = notion_request("POST", "/databases", token, database_payload)
-    return created_database["id"].replace("-", ""), True
+    database_id = created_database["id"].replace("-", "")
+    remember_database_id(DATABASE_NAME, database_id)
+    return database_id, True
 
 
-def fetch_existing_pages(database_id: str, token: str) -> Dict[str, Dict]:
-    existing_pages: Dict[str, Dict] = {}
-    cursor = None
-
-    while True:
-        payload = {}
-        if cursor:
-            payload["start_cursor"] = cursor
-        response = notion_request("POST", f"/databases/{database_id}/query", token, payload)
-
-        for page in response.get("results", []):
-            properties = page.get("properties", {})
-            title_prop = properties.get("Title", {})
-            title = ""
-            title_items = title_prop.get("title", [])
-            if title_items:
-                title = title_items[0].get("plain_text", "").strip()
-
-            if title:
-                existing_pages[title] = page
-
-        next_cursor = response.get("next_cursor")
-        if not next_cursor:
-            break
-        cursor = next_cursor
-
-    return existing_pages
+def fetch_existing_pages(database_id: str, token: str, properties: Optional[Iterable[str]] = None) -> Dict[str, Dict]:
+    """タイトル → ページ（properties を指定した場合は、タイトルとそのプロパティだけを取得）"""
+    return dict(iter_titled_pages(database_id, token, TITLE_PROPERTY, properties=properties))
 
 
 # ContentとCommentプロパティは使用しません。記事内容はページ本文（ブロック）に保存されます。
@@ -299,127 +297,175 @@ def extract_comment_content(comment_prop: Dict) -> str:
     return "\n".join(html_parts) if html_parts else html_content
 
 
-def optimize_article_content(html_content: str, page_id: Optional[str] = None) -> str:
-    """記事コンテンツを最適化する（不要な要素の削除、HTMLの整理など）
-    
-    Args:
-        html_content: 最適化するHTMLコンテンツ
-        page_id: ページID（画像ID生成用、オプション）
-    """
-    import re
-    
-    if not html_content:
-        return html_content
-    
-    # 0. UlikeAirのランキング部分にバナーコードを追加
-    # 「5位 Ulike Air10」の下にバナーを挿入
-    # 既にバナーが存在しない場合のみ追加
-    if 'data-aid="251127250835"' not in html_content:
-        ulike_banner = '<amp-ad width="100" height="60" type="a8" data-aid="251127250835" data-wid="002" data-eno="01" data-mid="s00000026764001003000" data-mat="45IJ0Y-DT4ZOA-5QIG-5YZ75" data-type="static"></amp-ad>\n'
-        
-        # パターン: 「5位 Ulike Air10」を含む段落の直後に「（最新価格...）」がある場合
-        # <strong>タグなどが含まれる場合も対応
-        ulike_air_pattern = r'(<p>5位 Ulike Air10.*?</p>\s*)(<p>（最新価格は各販売ページでご確認ください）</p>)'
-        
-        if re.search(ulike_air_pattern, html_content, re.DOTALL):
-            html_content = re.sub(
-                ulike_air_pattern,
-                r'\1' + ulike_banner + r'\2',
-                html_content,
-                count=1,
-                flags=re.DOTALL
-            )
+# UlikeAirのランキング部分に挿入するバナー
+ULIKE_BANNER_AID = "251127250835"
+ULIKE_BANNER_HTML = '<amp-ad width="100" height="60" type="a8" data-aid="251127250835" data-wid="002" data-eno="01" data-mid="s00000026764001003000" data-mat="45IJ0Y-DT4ZOA-5QIG-5YZ75" data-type="static"></amp-ad>'
+ULIKE_RANKING_PREFIX = "5位 Ulike Air10"
+PRICE_NOTE_TEXT = "（最新価格は各販売ページでご確認ください）"
+
+
+def _paragraph_html(node: Node) -> Optional[str]:
+    """本文が1つのHTML断片だけの段落なら、その断片を返す"""
+    if isinstance(node, Element) and node.tag == "p" and len(node.children) == 1 and isinstance(node.children[0], Raw):
+        return node.children[0].html
+    return None
+
+
+def insert_ulike_banner(nodes: List[Node]) -> bool:
+    """「5位 Ulike Air10」の段落以降で、段落の直後にある最初の「（最新価格...）」段落の直前にバナーを挿入"""
+    after_ranking = False
+    for index, node in enumerate(nodes):
+        if isinstance(node, Raw):
+            continue
+        paragraph = _paragraph_html(node)
+        if paragraph is None:
+            if insert_ulike_banner(node.children):
+                return True
+        elif not after_ranking:
+            after_ranking = paragraph.startswith(ULIKE_RANKING_PREFIX)
+        elif paragraph == PRICE_NOTE_TEXT and isinstance(nodes[index - 1], Element) and nodes[index - 1].tag == "p":
+            nodes.insert(index, Raw(ULIKE_BANNER_HTML))
             print(f"[INFO] UlikeAirランキング部分にバナーコードを追加しました", file=sys.stderr)
-    
-    # 1. トラッキング画像（1x1透明画像）を削除
-    # width="1" height="1" のimgタグを削除
-    html_content = re.sub(
-        r'<img[^>]+width=["\']1["\'][^>]+height=["\']1["\'][^>]*>',
-        '',
-        html_content,
-        flags=re.IGNORECASE
-    )
-    # srcに0.gifを含むimgタグを削除
-    html_content = re.sub(
-        r'<img[^>]+src=["\'][^"\']*0\.gif[^"\']*["\'][^>]*>',
-        '',
-        html_content,
-        flags=re.IGNORECASE
-    )
-    
-    # 2. 重複する<hr>タグを1つにまとめる（連続する<hr>を1つに）
-    html_content = re.sub(r'(<hr>\s*)+', '<hr>\n', html_content)
-    
-    # 3. 連続する空行を1つにまとめる
-    html_content = re.sub(r'\n\s*\n\s*\n+', '\n\n', html_content)
-    
-    # 4. HTMLコンテンツ内のすべての画像URLをCloudflare Imagesにアップロード
-    def replace_image_url(match):
-        img_tag = match.group(0)
-        # src属性からURLを抽出
-        src_match = re.search(r'src=["\']([^"\']+)["\']', img_tag)
-        if not src_match:
-            return img_tag
-        
-        original_url = src_match.group(1)
-        
+            return True
+    return False
+
+
+IMG_SRC_PATTERN = re.compile(r'src=["\']([^"\']+)["\']')
+
+
+class ArticleImages:
+    """
+    記事（ページ）内の画像URLを先に集め、まとめて並列にアップロードしてから永続URLに置き換える
+    アップロードは IMAGE_RESOLVER を通すため、並列に処理している別の記事と同じ画像は1回だけ処理されます。
+    アップロードに失敗した画像は元のURLのまま残ります。
+    本文の<img>には、置き換え後の画像の width / height と srcset / sizes を付けます。
+    """
+
+    def __init__(self, page_id: Optional[str] = None):
+        self.page_id = page_id
+        # 元のURL → 画像ID（同じURLは1回だけアップロードする）
+        self.image_ids: Dict[str, Optional[str]] = {}
+        self.elements: List[Element] = []
+        self.fragments: List[Raw] = []
+        self.resolved: Dict[str, str] = {}
+
+    def _html_image_id(self) -> str:
+        if self.page_id:
+            return f"affiling-page-{self.page_id[:16]}-img"
+        return "affiling-html-img"
+
+    def add_url(self, url: str, image_id: Optional[str] = None) -> None:
         # 既にCloudflare ImagesのURLの場合はそのまま
-        if 'imagedelivery.net' in original_url or 'cloudflare.com' in original_url:
+        if url and not is_cloudflare_url(url):
+            self.image_ids.setdefault(url, image_id)
+
+    def add_element(self, image: Element) -> None:
+        block_id = image.meta.get("block_id")
+        image_id = f"affiling-block-{block_id.replace('-', '')[:16]}" if block_id else self._html_image_id()
+        self.add_url(image.attrs.get("src") or "", image_id)
+        self.elements.append(image)
+
+    def add_fragment(self, fragment: Raw) -> None:
+        """HTML断片（HTMLコードブロックの中身など）に含まれる<img>のURLを集める"""
+        for img_tag in IMG_TAG_PATTERN.findall(fragment.html):
+            src_match = IMG_SRC_PATTERN.search(img_tag)
+            if src_match:
+                self.add_url(src_match.group(1), self._html_image_id())
+        self.fragments.append(fragment)
+
+    def url_for(self, url: str) -> str:
+        return self.resolved.get(url, url)
+
+    def resolve(self, concurrency: int = DEFAULT_IMAGE_UPLOAD_CONCURRENCY) -> None:
+        """集めた画像をアップロードし、ノードとHTML断片のURLを置き換える"""
+        if self.image_ids:
+            self.resolved = IMAGE_RESOLVER.resolve_many(self.image_ids, concurrency=concurrency)
+
+        for image in self.elements:
+            if image.attrs.get("src"):
+                image.attrs["src"] = self.url_for(image.attrs["src"])
+                # 画像のサイズに合わせた srcset と、レイアウトのずれを防ぐ width / height
+                for name, value in responsive_attrs(image.attrs["src"], ARTICLE_IMAGE_SIZES).items():
+                    image.attrs.setdefault(name, value)
+
+        if not self.resolved:
+            return
+
+        def replace_image_url(match: "re.Match") -> str:
+            img_tag = match.group(0)
+            src_match = IMG_SRC_PATTERN.search(img_tag)
+            if not src_match:
+                return img_tag
+            original_url = src_match.group(1)
+            permanent_url = self.url_for(original_url)
+            if permanent_url != original_url:
+                return img_tag.replace(original_url, permanent_url)
             return img_tag
-        
-        # Notionの一時URLをCloudflare Imagesにアップロード
-        try:
-            # 画像IDを生成
-            image_id_suffix = "html-img"
-            if page_id:
-                image_id_suffix = f"page-{page_id[:16]}-img"
-            
-            permanent_url = upload_image_from_url(original_url, image_id=f"affiling-{image_id_suffix}")
-            if permanent_url and permanent_url != original_url:
-                # URLを置き換え
-                new_img_tag = img_tag.replace(original_url, permanent_url)
-                return new_img_tag
-        except Exception as e:
-            print(f"[WARNING] HTML内の画像URLアップロードに失敗しました: {e}", file=sys.stderr)
-        
-        return img_tag
-    
-    html_content = re.sub(r'<img[^>]+>', replace_image_url, html_content, flags=re.IGNORECASE)
-    
-    # 5. コードブロックを一時的に保護
-    code_blocks = []
-    def replace_code(match):
-        code_blocks.append(match.group(0))
-        return f"__CODE_BLOCK_{len(code_blocks)-1}__"
-    
-    html_content = re.sub(
-        r'<pre><code[^>]*>.*?</code></pre>',
-        replace_code,
-        html_content,
-        flags=re.DOTALL
-    )
-    
-    # 6. <p>タグ内の不要な空白を削除
-    html_content = re.sub(r'<p>\s+', '<p>', html_content)
-    html_content = re.sub(r'\s+</p>', '</p>', html_content)
-    
-    # 7. 画像に遅延読み込み属性を追加（既にない場合）
-    def add_loading_attr(match):
-        img_tag = match.group(0)
-        if 'loading=' not in img_tag.lower():
-            return img_tag.replace('>', ' loading="lazy">')
-        return img_tag
-    
-    html_content = re.sub(r'<img[^>]+>', add_loading_attr, html_content, flags=re.IGNORECASE)
-    
-    # 7. コードブロックを復元
-    for i, code_block in enumerate(code_blocks):
-        html_content = html_content.replace(f"__CODE_BLOCK_{i}__", code_block)
-    
-    # 8. 先頭・末尾の不要な空白を削除
-    html_content = html_content.strip()
-    
-    return html_content
+
+        rules = [SubImgTags(IMG_TAG_PATTERN, replace_image_url)]
+        for fragment in self.fragments:
+            fragment.html = transform(fragment.html, rules)
+
+
+def optimize_article_nodes(nodes: List[Node], images: Optional[ArticleImages] = None) -> List[Node]:
+    """記事のノードを最適化する（不要な要素の削除、HTMLの整理など）
+
+    Args:
+        nodes: blocks_to_nodes で描画したノード
+        images: 画像の収集先。渡した場合は images.resolve() でまとめてCloudflare Imagesに置き換える
+    """
+    # 0. UlikeAirのランキング部分にバナーコードを追加（既にバナーが存在しない場合のみ）
+    if not any(f'data-aid="{ULIKE_BANNER_AID}"' in raw.html for raw in iter_raw(nodes)):
+        insert_ulike_banner(nodes)
+
+    # HTMLコードブロックの中身など、HTML断片に含まれるトラッキング画像を削除するルール
+    fragment_rules = [RemoveTrackingPixels()]
+
+    def optimize(children: List[Node], in_code: bool) -> List[Node]:
+        optimized: List[Node] = []
+        for node in children:
+            if isinstance(node, Raw):
+                # 連続する空行を1つにまとめる
+                collapse_blank_lines(node)
+                if "<img" in node.html.lower():
+                    node.html = transform(node.html, fragment_rules)
+                    if images is not None:
+                        images.add_fragment(node)
+                optimized.append(node)
+                continue
+
+            if isinstance(node, Element):
+                # トラッキング画像（1x1透明画像・0.gif）を削除
+                if is_tracking_pixel(node):
+                    continue
+                # 重複する<hr>を1つにまとめる
+                previous = optimized[-1] if optimized else None
+                if node.tag == "hr" and isinstance(previous, Element) and previous.tag == "hr":
+                    continue
+                if node.tag == "img":
+                    # アップロード対象として集め、遅延読み込み属性を追加（コードブロック内は対象外）
+                    if images is not None:
+                        images.add_element(node)
+                    if not in_code:
+                        add_lazy_loading(node)
+                node.children = optimize(node.children, in_code or node.tag == "pre")
+                if not in_code:
+                    # <p>タグ内の不要な空白を削除
+                    trim_paragraph(node)
+            else:
+                node.children = optimize(node.children, in_code)
+            optimized.append(node)
+        return optimized
+
+    return optimize(nodes, False)
+
+
+def render_article_content(blocks: List[Dict], page_id: Optional[str] = None) -> str:
+    """ページ本文のブロックを最適化済みのHTMLにする（ノード上で最適化してから1回だけ文字列化）"""
+    images = ArticleImages(page_id)
+    nodes = optimize_article_nodes(blocks_to_nodes(blocks), images)
+    images.resolve()
+    return serialize(nodes).strip()
 
 
 def fetch_page_blocks(page_id: str, token: str) -> List[Dict]:
@@ -445,6 +491,27 @@ def fetch_page_blocks(page_id: str, token: str) -> List[Dict]:
     return blocks
 
 
+def fetch_block_tree(page_id: str, token: str, concurrency: int = DEFAULT_BLOCK_FETCH_CONCURRENCY) -> List[Dict]:
+    """
+    Notionページのブロックツリーを階層ごとに取得
+    同じ深さの has_children ブロックの子を並列に取得し、各ブロックの "children" に格納します。
+    リクエスト数はブロック数のままですが、直列の往復回数はツリーの深さ分で済みます。
+    """
+    blocks = fetch_page_blocks(page_id, token)
+    level = [block for block in blocks if block.get("has_children")]
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        while level:
+            children_list = list(executor.map(lambda block: fetch_page_blocks(block["id"], token), level))
+            next_level = []
+            for block, children in zip(level, children_list):
+                block["children"] = children
+                next_level.extend(child for child in children if child.get("has_children"))
+            level = next_level
+
+    return blocks
+
+
 def rich_text_to_html(rich_text: List[Dict]) -> str:
     """Notion rich_textをHTMLに変換（リンク、スタイルなどを処理）"""
     html_parts = []
@@ -495,9 +562,38 @@ def rich_text_to_html(rich_text: List[Dict]) -> str:
     return "".join(html_parts)
 
 
-def blocks_to_html(blocks: List[Dict], token: str) -> str:
-    """NotionブロックをHTMLに変換"""
-    html_parts = []
+def _remove_code_tracking_pixels(code_text: str) -> str:
+    """HTMLコードブロック内の不要なトラッキング画像を削除"""
+    import re
+    # パターン1: width="1" height="1" または width='1' height='1' の画像タグ
+    # パターン2: 0.gifというファイル名のトラッキング画像
+    # パターン3: width="1"とheight="1"が別々の属性として存在する場合
+    code_text = re.sub(
+        r'<img[^>]*(?:width\s*=\s*["\']?\s*1\s*["\']?[^>]*height\s*=\s*["\']?\s*1\s*["\']?|height\s*=\s*["\']?\s*1\s*["\']?[^>]*width\s*=\s*["\']?\s*1\s*["\']?)[^>]*>',
+        '',
+        code_text,
+        flags=re.IGNORECASE | re.DOTALL
+    )
+    # 0.gifというファイル名のトラッキング画像も削除
+    code_text = re.sub(
+        r'<img[^>]*src=["\'][^"\']*0\.gif[^"\']*["\'][^>]*>',
+        '',
+        code_text,
+        flags=re.IGNORECASE | re.DOTALL
+    )
+    # 空行を削除（連続する改行を整理）
+    code_text = re.sub(r'\n\s*\n\s*\n+', '\n\n', code_text)
+    return code_text.strip()
+
+
+def _link_paragraph(url: str, label: List[Node]) -> Element:
+    link = Element("a", {"href": url, "target": "_blank", "rel": "nofollow noopener"}, label)
+    return Element("p", children=[link])
+
+
+def blocks_to_nodes(blocks: List[Dict]) -> List[Node]:
+    """Notionブロックを中間ノードに変換（子ブロックは fetch_block_tree で取得済みの "children" を使用）"""
+    nodes: List[Node] = []
     i = 0
     
     while i < len(blocks):
@@ -505,58 +601,24 @@ def blocks_to_html(blocks: List[Dict], token: str) -> str:
         block_type = block.get("type", "")
         block_data = block.get(block_type, {})
         
-        if block_type == "paragraph":
-            rich_text = block_data.get("rich_text", [])
-            text = rich_text_to_html(rich_text)
+        if block_type in ("paragraph", "heading_1", "heading_2", "heading_3"):
+            text = rich_text_to_html(block_data.get("rich_text", []))
             if text.strip():
-                html_parts.append(f"<p>{text}</p>")
+                tag = "p" if block_type == "paragraph" else f"h{block_type[-1]}"
+                nodes.append(Element(tag, children=[Raw(text)]))
         
-        elif block_type == "heading_1":
-            rich_text = block_data.get("rich_text", [])
-            text = rich_text_to_html(rich_text)
-            if text.strip():
-                html_parts.append(f"<h1>{text}</h1>")
-        
-        elif block_type == "heading_2":
-            rich_text = block_data.get("rich_text", [])
-            text = rich_text_to_html(rich_text)
-            if text.strip():
-                html_parts.append(f"<h2>{text}</h2>")
-        
-        elif block_type == "heading_3":
-            rich_text = block_data.get("rich_text", [])
-            text = rich_text_to_html(rich_text)
-            if text.strip():
-                html_parts.append(f"<h3>{text}</h3>")
-        
-        elif block_type == "bulleted_list_item":
-            # 連続するbulleted_list_itemを1つの<ul>にまとめる
+        elif block_type in ("bulleted_list_item", "numbered_list_item"):
+            # 連続するリスト項目を1つの<ul>/<ol>にまとめる
             list_items = []
             j = i
-            while j < len(blocks) and blocks[j].get("type") == "bulleted_list_item":
-                item_data = blocks[j].get("bulleted_list_item", {})
-                rich_text = item_data.get("rich_text", [])
-                text = rich_text_to_html(rich_text)
+            while j < len(blocks) and blocks[j].get("type") == block_type:
+                item_data = blocks[j].get(block_type, {})
+                text = rich_text_to_html(item_data.get("rich_text", []))
                 if text.strip():
-                    list_items.append(f"<li>{text}</li>")
+                    list_items.append(Element("li", children=[Raw(text)]))
                 j += 1
             if list_items:
-                html_parts.append(f"<ul>{''.join(list_items)}</ul>")
-            i = j - 1  # ループでiがインクリメントされるので-1
-        
-        elif block_type == "numbered_list_item":
-            # 連続するnumbered_list_itemを1つの<ol>にまとめる
-            list_items = []
-            j = i
-            while j < len(blocks) and blocks[j].get("type") == "numbered_list_item":
-                item_data = blocks[j].get("numbered_list_item", {})
-                rich_text = item_data.get("rich_text", [])
-                text = rich_text_to_html(rich_text)
-                if text.strip():
-                    list_items.append(f"<li>{text}</li>")
-                j += 1
-            if list_items:
-                html_parts.append(f"<ol>{''.join(list_items)}</ol>")
+                nodes.append(Element("ul" if block_type == "bulleted_list_item" else "ol", children=list_items))
             i = j - 1  # ループでiがインクリメントされるので-1
         
         elif block_type == "image":
@@ -566,17 +628,8 @@ def blocks_to_html(blocks: List[Dict], token: str) -> str:
                 caption = block_data.get("caption", [])
                 caption_text = "".join(item.get("plain_text", "") for item in caption)
                 if url:
-                    # Cloudflare Imagesにアップロードして永続URLに変換
-                    try:
-                        block_id = block.get("id", "").replace("-", "")[:16]
-                        permanent_url = upload_image_from_url(url, image_id=f"affiling-block-{block_id}")
-                        if permanent_url:
-                            url = permanent_url
-                    except Exception as e:
-                        # アップロードに失敗した場合は元のURLを使用
-                        block_id_str = block.get("id", "unknown")[:16]
-                        print(f"[WARNING] 画像ブロックのアップロードに失敗しました（ブロックID: {block_id_str}）: {e}", file=sys.stderr)
-                    html_parts.append(f'<img src="{url}" alt="{caption_text}">')
+                    # Cloudflare Imagesへのアップロードは optimize_article_nodes で行う
+                    nodes.append(Element("img", {"src": url, "alt": caption_text}, meta={"block_id": block.get("id", "")}))
         
         elif block_type == "code":
             # コードブロックを処理（HTMLコードブロックの場合はそのまま出力）
@@ -584,151 +637,101 @@ def blocks_to_html(blocks: List[Dict], token: str) -> str:
             code_text = "".join(item.get("plain_text", "") for item in rich_text)
             if code_text.strip():
                 language = block_data.get("language", "")
-                # HTML/XMLコードブロックの場合は、不要なトラッキング画像を削除
                 if language in ["html", "xml"]:
-                    # 1x1ピクセルのトラッキング画像を削除
-                    import re
-                    # パターン1: width="1" height="1" または width='1' height='1' の画像タグ
-                    # パターン2: 0.gifというファイル名のトラッキング画像
-                    # パターン3: width="1"とheight="1"が別々の属性として存在する場合
-                    code_text = re.sub(
-                        r'<img[^>]*(?:width\s*=\s*["\']?\s*1\s*["\']?[^>]*height\s*=\s*["\']?\s*1\s*["\']?|height\s*=\s*["\']?\s*1\s*["\']?[^>]*width\s*=\s*["\']?\s*1\s*["\']?)[^>]*>',
-                        '',
-                        code_text,
-                        flags=re.IGNORECASE | re.DOTALL
-                    )
-                    # 0.gifというファイル名のトラッキング画像も削除
-                    code_text = re.sub(
-                        r'<img[^>]*src=["\'][^"\']*0\.gif[^"\']*["\'][^>]*>',
-                        '',
-                        code_text,
-                        flags=re.IGNORECASE | re.DOTALL
-                    )
-                    # 空行を削除（連続する改行を整理）
-                    code_text = re.sub(r'\n\s*\n\s*\n+', '\n\n', code_text)
-                    code_text = code_text.strip()
-                    
-                    if language:
-                        html_parts.append(f'<pre><code class="language-{language}">{code_text}</code></pre>')
-                    else:
-                        html_parts.append(f'<pre><code>{code_text}</code></pre>')
+                    code = Raw(_remove_code_tracking_pixels(code_text))
                 else:
                     # その他の言語はエスケープ
-                    import html
-                    escaped_code = html.escape(code_text)
-                    if language:
-                        html_parts.append(f'<pre><code class="language-{language}">{escaped_code}</code></pre>')
-                    else:
-                        html_parts.append(f'<pre><code>{escaped_code}</code></pre>')
+                    code = html_nodes.text(code_text)
+                code_attrs = {"class": f"language-{language}"} if language else {}
+                nodes.append(Element("pre", children=[Element("code", code_attrs, [code])]))
         
         elif block_type == "callout":
-            rich_text = block_data.get("rich_text", [])
-            text = rich_text_to_html(rich_text)
+            text = rich_text_to_html(block_data.get("rich_text", []))
             if text.strip():
-                html_parts.append(f"<div class='callout'><p>{text}</p></div>")
+                paragraph = Element("p", children=[Raw(text)])
+                nodes.append(Element("div", {"class": "callout"}, [paragraph]))
         
         elif block_type == "divider":
-            html_parts.append("<hr>")
+            nodes.append(Element("hr"))
         
         elif block_type == "table_of_contents":
             # 目次はスキップ（フロントエンドで自動生成）
             pass
         
         elif block_type == "quote":
-            rich_text = block_data.get("rich_text", [])
-            text = rich_text_to_html(rich_text)
+            text = rich_text_to_html(block_data.get("rich_text", []))
             if text.strip():
-                html_parts.append(f"<blockquote><p>{text}</p></blockquote>")
+                paragraph = Element("p", children=[Raw(text)])
+                nodes.append(Element("blockquote", children=[paragraph]))
         
         elif block_type == "to_do":
             rich_text = block_data.get("rich_text", [])
             text = rich_text_to_html(rich_text)
-            checked = block_data.get("checked", False)
-            checked_attr = 'checked' if checked else ''
+            checkbox_attrs = {"type": "checkbox", "checked": None, "disabled": None}
+            if not block_data.get("checked", False):
+                del checkbox_attrs["checked"]
             if text.strip():
-                html_parts.append(f"<p><input type='checkbox' {checked_attr} disabled> {text}</p>")
+                nodes.append(Element("p", children=[Element("input", checkbox_attrs), Raw(f" {text}")]))
         
         elif block_type == "toggle":
-            rich_text = block_data.get("rich_text", [])
-            text = rich_text_to_html(rich_text)
+            text = rich_text_to_html(block_data.get("rich_text", []))
             if text.strip():
                 # トグルの子ブロックを取得
-                has_children = block.get("has_children", False)
-                child_html = ""
-                if has_children:
-                    child_block_id = block.get("id", "")
-                    child_blocks = fetch_page_blocks(child_block_id, token)
-                    child_html = blocks_to_html(child_blocks, token)
-                
-                html_parts.append(f"<details><summary>{text}</summary>{child_html}</details>")
-                continue  # 子ブロックは既に処理済み
+                children: List[Node] = [Element("summary", children=[Raw(text)])]
+                if block.get("has_children", False):
+                    children.append(Fragment(blocks_to_nodes(block.get("children", []))))
+                nodes.append(Element("details", children=children))
         
         elif block_type == "table":
             # テーブルブロックの処理
-            has_children = block.get("has_children", False)
-            if has_children:
-                child_block_id = block.get("id", "")
-                child_blocks = fetch_page_blocks(child_block_id, token)
-                # テーブル行を処理
+            if block.get("has_children", False):
                 table_rows = []
-                for row_block in child_blocks:
+                for row_block in block.get("children", []):
                     if row_block.get("type") == "table_row":
-                        row_data = row_block.get("table_row", {})
-                        cells = row_data.get("cells", [])
-                        cell_htmls = []
-                        for cell in cells:
-                            cell_text = rich_text_to_html(cell)
-                            cell_htmls.append(f"<td>{cell_text}</td>")
-                        if cell_htmls:
-                            table_rows.append(f"<tr>{''.join(cell_htmls)}</tr>")
+                        cells = row_block.get("table_row", {}).get("cells", [])
+                        if cells:
+                            table_rows.append(Element("tr", children=[Element("td", children=[Raw(rich_text_to_html(cell))]) for cell in cells]))
                 if table_rows:
-                    html_parts.append(f"<table><tbody>{''.join(table_rows)}</tbody></table>")
-                continue  # 子ブロックは既に処理済み
+                    nodes.append(Element("table", children=[Element("tbody", children=table_rows)]))
         
         elif block_type == "column_list":
             # カラムリストの処理（ネストされたカラムを含む）
-            has_children = block.get("has_children", False)
-            if has_children:
-                child_block_id = block.get("id", "")
-                child_blocks = fetch_page_blocks(child_block_id, token)
-                columns_html = []
-                for col_block in child_blocks:
+            if block.get("has_children", False):
+                columns = []
+                for col_block in block.get("children", []):
                     if col_block.get("type") == "column":
-                        col_has_children = col_block.get("has_children", False)
-                        col_content = ""
-                        if col_has_children:
-                            col_child_id = col_block.get("id", "")
-                            col_child_blocks = fetch_page_blocks(col_child_id, token)
-                            col_content = blocks_to_html(col_child_blocks, token)
-                        columns_html.append(f"<div class='column'>{col_content}</div>")
-                if columns_html:
-                    html_parts.append(f"<div class='columns'>{''.join(columns_html)}</div>")
-                continue  # 子ブロックは既に処理済み
+                        col_content: List[Node] = []
+                        if col_block.get("has_children", False):
+                            col_content = [Fragment(blocks_to_nodes(col_block.get("children", [])))]
+                        columns.append(Element("div", {"class": "column"}, col_content))
+                if columns:
+                    nodes.append(Element("div", {"class": "columns"}, columns))
         
         elif block_type == "bookmark":
             url = block_data.get("url", "")
             caption = block_data.get("caption", [])
-            caption_text = rich_text_to_html(caption)
+            caption_html = rich_text_to_html(caption)
             if url:
-                html_parts.append(f'<p><a href="{url}" target="_blank" rel="nofollow noopener">{caption_text or url}</a></p>')
+                nodes.append(_link_paragraph(url, [Raw(caption_html) if caption_html else html_nodes.text(url)]))
         
         elif block_type == "link_preview" or block_type == "embed":
             url = block_data.get("url", "")
             if url:
-                html_parts.append(f'<p><a href="{url}" target="_blank" rel="nofollow noopener">{url}</a></p>')
+                nodes.append(_link_paragraph(url, [html_nodes.text(url)]))
         
         # 子ブロックを再帰的に処理（toggle、table、column_list以外）
         has_children = block.get("has_children", False)
         if has_children and block_type not in ["toggle", "table", "column_list"]:
-            child_block_id = block.get("id", "")
-            child_blocks = fetch_page_blocks(child_block_id, token)
-            child_html = blocks_to_html(child_blocks, token)
-            if child_html:
-                html_parts.append(child_html)
+            nodes.extend(blocks_to_nodes(block.get("children", [])))
         
         i += 1
     
-    return "\n".join(html_parts)
+    return nodes
+
+
+def blocks_to_html(blocks: List[Dict]) -> str:
+    """NotionブロックをHTMLに変換（最適化なし。確認用）"""
+    return serialize(blocks_to_nodes(blocks))
 
 
 def extract_date(date_prop: Dict) -> Optional[str]:
@@ -820,89 +823,168 @@ def build_property_payload(title: str, data: Dict) -> Dict:
     return payload
 
 
-def pull_from_notion(database_id: str, token: str, output_path: Path):
-    articles = []
-    cursor = None
+def _iter_tree(blocks: List[Dict]):
+    for block in blocks:
+        yield block
+        yield from _iter_tree(block.get("children", []))
 
-    while True:
-        payload = {}
-        if cursor:
-            payload["start_cursor"] = cursor
 
-        # Filter for Published articles only
-        payload["filter"] = {
-            "property": "Status",
-            "select": {"equals": "Published"},
-        }
+def refresh_file_images(blocks: List[Dict], token: str) -> int:
+    """
+    キャッシュしたツリーの画像ブロック（Notionにアップロードされた file 型）の署名付きURLを取り直す
+    署名付きURLは1時間ほどで期限が切れるため、画像キャッシュに永続URLがない画像
+    （アップロードに失敗した・キャッシュを消したなど）はブロックを取得し直してからアップロードします。
+    取得し直したブロックの数を返します。
+    """
+    refreshed = 0
+    for block in _iter_tree(blocks):
+        image = block.get("image") if block.get("type") == "image" else None
+        if not image or image.get("type") != "file":
+            continue
+        if IMAGE_CACHE.lookup_source(source_key(image.get("file", {}).get("url", ""))):
+            continue
+        block["image"] = notion_request("GET", f"/blocks/{block['id']}", token, None).get("image", image)
+        refreshed += 1
+    return refreshed
+
+
+def load_block_tree(page: Dict, token: str, use_block_cache: bool = True) -> List[Dict]:
+    """ページのブロックツリーを取得（last_edited_time が変わっていなければローカルキャッシュを使用）"""
+    last_edited_time = page.get("last_edited_time")
+    if use_block_cache:
+        cached = BLOCK_CACHE.get(page["id"], last_edited_time)
+        if cached is not None:
+            refresh_file_images(cached, token)
+            return cached
+
+    blocks = fetch_block_tree(page["id"], token)
+    if use_block_cache:
+        BLOCK_CACHE.put(page["id"], last_edited_time, blocks)
+    return blocks
 
-        response = notion_request("POST", f"/databases/{database_id}/query", token, payload)
 
-        for page in response.get("results", []):
-            properties = page.get("properties", {})
-            page_id = page["id"].replace("-", "")
+def page_to_article(page: Dict, token: str, use_block_cache: bool = True) -> Optional[Dict]:
+    """データベースのページ1件を記事データに変換（本文ブロックの取得・HTML化を含む）"""
+    properties = page.get("properties", {})
+    page_id = page["id"].replace("-", "")
 
-            title_prop = properties.get("Title", {})
-            title_items = title_prop.get("title", [])
-            title = title_items[0].get("plain_text", "") if title_items else ""
+    title_prop = properties.get("Title", {})
+    title_items = title_prop.get("title", [])
+    title = title_items[0].get("plain_text", "") if title_items else ""
 
-            if not title:
-                continue
+    if not title:
+        return None
 
-            excerpt = extract_rich_text(properties.get("Excerpt", {}))
-            category = extract_select(properties.get("Category", {}))
-            date = extract_date(properties.get("Date", {}))
-            image = extract_files(properties.get("Image", {}))
-            
-            # 画像をCloudflare Imagesにアップロード（一時URLの場合は永続URLに変換）
-            if image:
-                try:
-                    permanent_image_url = upload_image_from_url(image, image_id=f"affiling-{page_id}")
-                    if permanent_image_url:
-                        image = permanent_image_url
-                except Exception as e:
-                    # 画像アップロードに失敗しても処理を継続
-                    print(f"[WARNING] 画像アップロードに失敗しました（記事: {title}）: {e}", file=sys.stderr)
-                    # 元のURLを使用して継続
-            
-            read_time = extract_number(properties.get("Read Time", {}))
-            product_count = extract_number(properties.get("Product Count", {}))
-            
-            # 記事内容はページの本文（ブロック）から取得
-            content = None
-            
-            try:
-                page_blocks = fetch_page_blocks(page["id"], token)
-                content = blocks_to_html(page_blocks, token)
-                if content:
-                    print(f"[INFO] ページ本文から記事内容を取得しました: {title[:50]}... (長さ: {len(content)}文字)", file=sys.stderr)
-            except Exception as e:
-                print(f"[WARNING] ページ本文の取得に失敗しました（記事: {title[:50]}...）: {e}", file=sys.stderr)
-            
-            # HTMLコンテンツから不要なトラッキング画像を削除し、最適化
-            if content:
-                content = optimize_article_content(content, page_id=page_id)
-            
-            tags = extract_multi_select(properties.get("Tags", {}))
-
-            article = {
-                "id": page_id,
-                "title": title,
-                "excerpt": excerpt,
-                "category": category or "guide",
-                "date": date or "",
-                "image": image,
-                "readTime": read_time or 0,
-                "productCount": product_count,
-                "content": content,
-                "tags": tags,
-            }
-
-            articles.append(article)
+    excerpt = extract_rich_text(properties.get("Excerpt", {}))
+    category = extract_select(properties.get("Category", {}))
+    date = extract_date(properties.get("Date", {}))
+    image = extract_files(properties.get("Image", {}))
+    
+    read_time = extract_number(properties.get("Read Time", {}))
+    product_count = extract_number(properties.get("Product Count", {}))
+    
+    # アイキャッチ画像と本文中の画像は先に集め、本文の描画後にまとめて並列でアップロードする
+    images = ArticleImages(page_id)
+    if image:
+        images.add_url(image, image_id=f"affiling-{page_id}")
+    
+    # 記事内容はページの本文（ブロック）から取得
+    content_nodes = None
+    
+    try:
+        page_blocks = load_block_tree(page, token, use_block_cache=use_block_cache)
+        content_nodes = optimize_article_nodes(blocks_to_nodes(page_blocks), images)
+    except Exception as e:
+        print(f"[WARNING] ページ本文の取得に失敗しました（記事: {title[:50]}...）: {e}", file=sys.stderr)
+    
+    # 画像をCloudflare Imagesにアップロード（一時URLの場合は永続URLに変換。失敗した画像は元のURLを使用）
+    images.resolve()
+    image_width = image_height = image_srcset = None
+    if image:
+        image = images.url_for(image)
+        dimensions = image_size(image)
+        if dimensions:
+            image_width, image_height = dimensions
+            image_srcset = build_srcset(image, image_width)
+    
+    content = serialize(content_nodes).strip() if content_nodes is not None else None
+    if content:
+        print(f"[INFO] ページ本文から記事内容を取得しました: {title[:50]}... (長さ: {len(content)}文字)", file=sys.stderr)
+    
+    tags = extract_multi_select(properties.get("Tags", {}))
+
+    return {
+        "id": page_id,
+        "title": title,
+        "excerpt": excerpt,
+        "category": category or "guide",
+        "date": date or "",
+        "image": image,
+        "imageWidth": image_width,
+        "imageHeight": image_height,
+        "imageSrcset": image_srcset,
+        "readTime": read_time or 0,
+        "productCount": product_count,
+        "content": content,
+        "tags": tags,
+    }
 
-        next_cursor = response.get("next_cursor")
-        if not next_cursor:
-            break
-        cursor = next_cursor
+
+def pull_from_notion(
+    database_id: str,
+    token: str,
+    output_path: Path,
+    concurrency: int = DEFAULT_PULL_CONCURRENCY,
+    incremental: bool = False,
+    progress: Optional[Callable[[int], None]] = None,
+    use_block_cache: bool = True,
+):
+    """公開中の記事をNotionから取得してJSONに書き出す
+
+    Args:
+        concurrency: 記事本文の取得・変換を並列に行うワーカー数（1なら逐次処理）
+        incremental: 前回以降に編集された記事だけを再生成し、既存のJSONにマージする
+        use_block_cache: 編集されていない記事の本文ブロックを data/.sync/blocks から読み込む
+        progress: 記事1件の処理が終わるたびに呼ばれるコールバック（例外を送出すると中断）
+    """
+    sync = IncrementalExport(output_path, incremental, key_field="id")
+    edited_filter = sync.query_filter()
+
+    # 記事ごとの処理はクエリ結果の順序でFutureに積み、最後に同じ順序で回収する
+    # 公開対象外のページは Future の代わりに None を積む（差分モードでJSONから取り除くため）
+    pending: List[Tuple[str, Optional[Future]]] = []
+    if edited_filter:
+        # 差分モードでは非公開に変わった記事も検出するため、Statusでは絞り込まない
+        query_filter = edited_filter
+    else:
+        # Filter for Published articles only
+        query_filter = {
+            "property": "Status",
+            "select": {"equals": "Published"},
+        }
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        for page in query_database(database_id, token, query_filter=query_filter, properties=ARTICLE_PROPERTIES):
+            status = extract_select(page.get("properties", {}).get("Status", {}))
+            if status == "Published":
+                pending.append((page["id"], executor.submit(page_to_article, page, token, use_block_cache)))
+            else:
+                pending.append((page["id"], None))
+
+        changes = []
+        try:
+            for page_id, future in pending:
+                changes.append((page_id, future.result() if future else None))
+                if progress:
+                    progress(1)
+        except BaseException:
+            # 中断時は未着手の記事を破棄してすぐに抜ける
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    articles = sync.merge(changes)
+    if not sync.full:
+        print(f"[INFO] 差分同期: {len(changes)}件の更新を反映しました。", file=sys.stderr)
 
     # Sort by date (newest first)
     articles.sort(key=lambda x: x.get("date", ""), reverse=True)
@@ -910,94 +992,94 @@ def pull_from_notion(database_id: str, token: str, output_path: Path):
     output_path.parent.mkdir(parents=True, exist_ok=True)
     with output_path.open("w", encoding="utf-8") as fp:
         json.dump(articles, fp, ensure_ascii=False, indent=2)
+    sync.commit()
 
     print(f"✅ {len(articles)}件の記事を {output_path} にエクスポートしました。")
 
 
-def push_to_notion(database_id: str, token: str, archive_existing: bool):
-    existing_pages = fetch_existing_pages(database_id, token)
+ARCHIVED_STATUS_PAYLOAD = {"properties": {"Status": {"select": {"name": "Archived"}}}}
+PUSH_RESULT_LABELS = {"created": "作成", "updated": "更新", "unchanged": "変更なし"}
 
-    if archive_existing:
-        for title, page in existing_pages.items():
-            page_id = page["id"].replace("-", "")
-            notion_request(
-                "PATCH",
-                f"/pages/{page_id}",
-                token,
-                {"properties": {"Status": {"select": {"name": "Archived"}}}},
-            )
-        print(f"✅ 既存の{len(existing_pages)}件をアーカイブしました。")
-        existing_pages = {}
-
-    created_count = 0
-    updated_count = 0
 
+def push_to_notion(
+    database_id: str,
+    token: str,
+    archive_existing: bool,
+    progress: Optional[Callable[[int], None]] = None,
+) -> UpsertResult:
+    records = []
     for article in AFFILING_ARTICLE_DATA:
         title = article.get("title", "").strip()
-        if not title:
-            continue
+        if title:
+            records.append((title, build_property_payload(title, article)))
 
-        payload = build_property_payload(title, article)
+    # 差分の比較には書き込むプロパティだけ、アーカイブには Status だけが必要
+    properties = written_properties(records) + list(ARCHIVED_STATUS_PAYLOAD["properties"])
+    existing_pages = fetch_existing_pages(database_id, token, properties=properties)
 
-        if title in existing_pages:
-            page_id = existing_pages[title]["id"].replace("-", "")
-            notion_request("PATCH", f"/pages/{page_id}", token, {"properties": payload})
-            updated_count += 1
-            print(f"✅ 更新: {title}")
-        else:
-            notion_request(
-                "POST",
-                "/pages",
-                token,
-                {
-                    "parent": {"type": "database_id", "database_id": database_id},
-                    "properties": payload,
-                },
-            )
-            created_count += 1
-            print(f"✅ 作成: {title}")
+    archived_count = 0
+    if archive_existing:
+        archived_count = archive_pages(token, existing_pages.values(), payload=ARCHIVED_STATUS_PAYLOAD)
+        print(f"✅ 既存の{archived_count}件をアーカイブしました。")
+        existing_pages = {}
+
+    result = upsert_records(
+        database_id,
+        token,
+        records,
+        existing_pages,
+        progress=progress,
+        report=lambda action, title: print(f"✅ {PUSH_RESULT_LABELS[action]}: {title}"),
+    )
+    result.archived = archived_count
 
-    print(f"\n✅ 完了: {created_count}件作成、{updated_count}件更新")
+    print(f"\n✅ 完了: {result.created}件作成、{result.updated}件更新、{result.unchanged}件変更なし")
+    return result
 
 
 # 統一インターフェース関数（管理者ページ用）
-def export_notion_to_json(token: str, output_path: Path) -> Dict[str, int]:
-    """管理者ページ用の統一インターフェース関数"""
-    try:
-        database_id, _ = ensure_database(token)
-        pull_from_notion(database_id, token, output_path)
-        # ファイルから件数を取得
-        if output_path.exists():
-            with output_path.open("r", encoding="utf-8") as fp:
-                data = json.load(fp)
-                count = len(data) if isinstance(data, list) else 0
-                return {"notion_count": count, "file": str(output_path)}
-        return {"notion_count": 0, "file": str(output_path)}
-    except Exception as e:
-        print(f"[ERROR] Affiling記事のエクスポートに失敗しました: {e}", file=sys.stderr)
-        import traceback
-        traceback.print_exc()
-        raise
+@revalidate_on_failure(DATABASE_NAME)
+def export_notion_to_json(
+    token: str,
+    output_path: Path,
+    concurrency: int = DEFAULT_PULL_CONCURRENCY,
+    incremental: bool = False,
+    progress: Optional[Callable[[int], None]] = None,
+    use_block_cache: bool = True,
+) -> Dict[str, int]:
+    """管理者ページ用の統一インターフェース関数（失敗・キャンセルの報告はジョブ側で行う）"""
+    database_id, _ = ensure_database(token)
+    pull_from_notion(
+        database_id,
+        token,
+        output_path,
+        concurrency=concurrency,
+        incremental=incremental,
+        progress=progress,
+        use_block_cache=use_block_cache,
+    )
+    # ファイルから件数を取得
+    if output_path.exists():
+        with output_path.open("r", encoding="utf-8") as fp:
+            data = json.load(fp)
+            count = len(data) if isinstance(data, list) else 0
+            return {"notion_count": count, "file": str(output_path)}
+    return {"notion_count": 0, "file": str(output_path)}
 
 
-def sync_to_notion(token: str, reset: bool = False) -> None:
+@revalidate_on_failure(DATABASE_NAME)
+def sync_to_notion(token: str, reset: bool = False, progress: Optional[Callable[[int], None]] = None) -> Dict[str, int]:
     """管理者ページ用の統一インターフェース関数"""
     database_id, created = ensure_database(token)
     if created:
         print(f"[CREATE] Notion データベース '{DATABASE_NAME}' を作成しました。")
     else:
         print(f"[INFO] 既存データベース '{DATABASE_NAME}' を使用します。")
-    push_to_notion(database_id, token, archive_existing=reset)
+    return push_to_notion(database_id, token, archive_existing=reset, progress=progress).to_dict()
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Affiling Articles Notion同期スクリプト")
-    parser.add_argument("action", choices=["pull", "push"], help="pull: Notion→JSON, push: JSON→Notion")
-    parser.add_argument("--archive", action="store_true", help="push時に既存の記事をアーカイブ")
-    parser.add_argument("--output", type=Path, default=DEFAULT_EXPORT_PATH, help="出力パス（pull時）")
-    args = parser.parse_args()
-
-    token = get_env_value("NOTION_API_TOKEN")
+@revalidate_on_failure(DATABASE_NAME)
+def run_action(token: str, args: argparse.Namespace) -> None:
     database_id, created = ensure_database(token)
 
     if created:
@@ -1006,11 +1088,45 @@ def main():
         print(f"⚠️  データベースをインテグレーションに共有してください。")
 
     if args.action == "pull":
-        pull_from_notion(database_id, token, args.output)
+        pull_from_notion(
+            database_id,
+            token,
+            args.output,
+            concurrency=args.concurrency,
+            incremental=args.incremental,
+            use_block_cache=args.use_block_cache,
+        )
     elif args.action == "push":
         push_to_notion(database_id, token, args.archive)
 
 
+
+def main():
+    parser = argparse.ArgumentParser(description="Affiling Articles Notion同期スクリプト")
+    parser.add_argument("action", choices=["pull", "push"], help="pull: Notion→JSON, push: JSON→Notion")
+    parser.add_argument("--archive", action="store_true", help="push時に既存の記事をアーカイブ")
+    parser.add_argument("--output", type=Path, default=DEFAULT_EXPORT_PATH, help="出力パス（pull時）")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_PULL_CONCURRENCY,
+        help=f"pull時に記事本文を並列取得するワーカー数（既定: {DEFAULT_PULL_CONCURRENCY}）",
+    )
+    parser.add_argument("--incremental", action="store_true", help="pull時に前回以降に編集された記事だけを取得してマージ")
+    parser.add_argument(
+        "--no-block-cache",
+        dest="use_block_cache",
+        action="store_false",
+        help="pull時にブロックキャッシュ（data/.sync/blocks）を使わず、本文ブロックをすべて取得し直す",
+    )
+    args = parser.parse_args()
+
+    token = get_env_value("NOTION_API_TOKEN")
+    run_action(token, args)
+    print_resolver_stats()
+    print_connection_stats()
+
+
 if __name__ == "__main__":
     main()
 
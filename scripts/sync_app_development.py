@@ -2,19 +2,19 @@ import argparse
 import json
 import os
 import sys
-import urllib.error
-import urllib.request
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
 # Cloudflare Images統合
 sys.path.insert(0, str(Path(__file__).parent))
-from utils.cloudflare_images import upload_image_from_url
+from utils.image_resolver import IMAGE_RESOLVER, print_resolver_stats
+from utils.database_registry import lookup_database_id, remember_database_id, revalidate_on_failure
+from utils.notion_client import iter_titled_pages, notion_request
+from utils.notion_upsert import UpsertResult, archive_pages, upsert_records, written_properties
+from utils.responsive_images import responsive_image_entry
+from utils.sync_state import IncrementalExport
 
 
-NOTION_API_BASE = "https://api.notion.com/v1"
-NOTION_VERSION = "2022-06-28"
-
 APP_PROJECT_DATA: List[Dict[str, str]] = [
     {
         "project_name": "ToDoアプリ",
@@ -60,6 +60,7 @@ APP_PROJECT_DATA: List[Dict[str, str]] = [
 
 ROOT_PAGE_NAME = "App Development"
 DATABASE_NAME = "App Development Manager"
+TITLE_PROPERTY = "Project Name"
 DEFAULT_EXPORT_PATH = Path("data/dev_projects.json")
 
 
@@ -71,31 +72,6 @@ def get_env_value(key: str) -> str:
     return value
 
 
-def notion_request(method: str, path: str, token: str, payload: Optional[Dict]) -> Dict:
-    url = f"{NOTION_API_BASE}{path}"
-    data = None
-    if payload is not None:
-        data = json.dumps(payload).encode("utf-8")
-
-    req = urllib.request.Request(url=url, data=data, method=method)
-    req.add_header("Authorization", f"Bearer {token}")
-    req.add_header("Notion-Version", NOTION_VERSION)
-    req.add_header("Content-Type", "application/json")
-
-    try:
-        with urllib.request.urlopen(req) as response:
-            body = response.read().decode("utf-8")
-            if not body:
-                return {}
-            return json.loads(body)
-    except urllib.error.HTTPError as error:
-        error_body = error.read().decode("utf-8")
-        print(f"[ERROR] Notion API 呼び出しに失敗しました: {error.code} {error.reason}", file=sys.stderr)
-        if error_body:
-            print(error_body, file=sys.stderr)
-        sys.exit(1)
-
-
 def notion_search(token: str, query: str, object_type: str) -> List[Dict]:
     payload = {"query": query, "filter": {"value": object_type, "property": "object"}}
     response = notion_request("POST", "/search", token, payload)
@@ -112,11 +88,18 @@ def _resolve_root_page(token: str) -> Optional[str]:
 
 
 def ensure_database(token: str) -> Tuple[str, bool]:
+    # 解決済みのIDがあれば /search を省略（無効なIDは revalidate_on_failure が破棄する）
+    cached_id = lookup_database_id(DATABASE_NAME)
+    if cached_id:
+        return cached_id, False
+
     database_results = notion_search(token, DATABASE_NAME, "database")
     for result in database_results:
         title_property = result.get("title", [])
         if title_property and title_property[0].get("plain_text", "") == DATABASE_NAME:
-            return result["id"].replace("-", ""), False
+            database_id = result["id"].replace("-", "")
+            remember_database_id(DATABASE_NAME, database_id)
+            return database_id, False
 
     parent_page_id = _resolve_root_page(token)
     if not parent_page_id:
@@ -167,38 +150,19 @@ def ensure_database(token: str) -> Tuple[str, bool]:
     }
 
     created_database = notion_request("POST", "/databases", token, database_payload)
-    return created_database["id"].replace("-", ""), True
-
-
-def fetch_existing_pages(database_id: str, token: str) -> Dict[str, Dict]:
-    existing_pages: Dict[str, Dict] = {}
-    cursor = None
-
-    while True:
-        payload = {}
-        if cursor:
-            payload["start_cursor"] = cursor
-        response = notion_request("POST", f"/databases/{database_id}/query", token, payload)
+    database_id = created_database["id"].replace("-", "")
+    remember_database_id(DATABASE_NAME, database_id)
+    return database_id, True
 
-        for page in response.get("results", []):
-            properties = page.get("properties", {})
-            title_prop = properties.get("Project Name", {})
-            title = ""
-            title_items = title_prop.get("title", [])
-            if title_items:
-                title = title_items[0].get("plain_text", "").strip()
 
-            if title:
-                existing_pages[title] = page
-
-        if not response.get("has_more"):
-            break
-
-        cursor = response.get("next_cursor")
-        if not cursor:
-            break
-
-    return existing_pages
+def fetch_existing_pages(
+    database_id: str,
+    token: str,
+    query_filter: Optional[Dict] = None,
+    properties: Optional[Iterable[str]] = None,
+) -> Dict[str, Dict]:
+    """タイトル → ページ（properties を指定した場合は、タイトルとそのプロパティだけを取得）"""
+    return dict(iter_titled_pages(database_id, token, TITLE_PROPERTY, query_filter=query_filter, properties=properties))
 
 
 def build_property_payload(entry: Dict[str, str]) -> Dict:
@@ -223,51 +187,47 @@ def build_property_payload(entry: Dict[str, str]) -> Dict:
 
 
 def delete_all_pages(database_id: str, token: str) -> int:
-    existing_pages = fetch_existing_pages(database_id, token)
-    count = 0
-    for page in existing_pages.values():
-        page_id = page["id"]
-        notion_request("PATCH", f"/pages/{page_id}", token, {"archived": True})
-        count += 1
-    return count
-
-
-def upsert_pages(database_id: str, token: str, data: List[Dict[str, str]]) -> Tuple[int, int]:
-    existing_pages = fetch_existing_pages(database_id, token)
-    created = 0
-    updated = 0
-
-    for entry in data:
-        properties = build_property_payload(entry)
-        project_name = entry["project_name"]
-
-        if project_name in existing_pages:
-            page_id = existing_pages[project_name]["id"]
-            notion_request("PATCH", f"/pages/{page_id}", token, {"properties": properties, "archived": False})
-            updated += 1
-            print(f"[UPDATE] {project_name}")
-        else:
-            payload = {"parent": {"database_id": database_id}, "properties": properties}
-            notion_request("POST", "/pages", token, payload)
-            created += 1
-            print(f"[CREATE] {project_name}")
-
-    return created, updated
-
-
-def sync_to_notion(token: str, reset: bool = False) -> None:
+    # アーカイブにはページIDだけが必要なため、タイトル以外のプロパティは取得しない
+    existing_pages = fetch_existing_pages(database_id, token, properties=[])
+    return archive_pages(token, existing_pages.values())
+
+
+def upsert_pages(
+    database_id: str,
+    token: str,
+    data: List[Dict[str, str]],
+    progress: Optional[Callable[[int], None]] = None,
+) -> UpsertResult:
+    records = [(entry["project_name"], build_property_payload(entry)) for entry in data]
+    # 差分の比較には書き込むプロパティだけが必要
+    existing_pages = fetch_existing_pages(database_id, token, properties=written_properties(records))
+    return upsert_records(
+        database_id,
+        token,
+        records,
+        existing_pages,
+        update_fields={"archived": False},
+        progress=progress,
+    )
+
+
+@revalidate_on_failure(DATABASE_NAME)
+def sync_to_notion(token: str, reset: bool = False, progress: Optional[Callable[[int], None]] = None) -> Dict[str, int]:
     database_id, created = ensure_database(token)
     if created:
         print(f"[CREATE] Notion データベース '{DATABASE_NAME}' を作成しました。")
     else:
         print(f"[INFO] 既存データベース '{DATABASE_NAME}' を使用します。")
 
+    deleted = 0
     if reset:
         deleted = delete_all_pages(database_id, token)
         print(f"[RESET] 既存レコード {deleted} 件をアーカイブしました。")
 
-    created_count, updated_count = upsert_pages(database_id, token, APP_PROJECT_DATA)
-    print(f"[DONE] {created_count} 件を新規作成、{updated_count} 件を更新しました。")
+    result = upsert_pages(database_id, token, APP_PROJECT_DATA, progress=progress)
+    result.archived = deleted
+    print(f"[DONE] {result.summary()}")
+    return result.to_dict()
 
 
 def notion_page_to_dict(page: Dict) -> Dict[str, Optional[str]]:
@@ -297,13 +257,16 @@ def notion_page_to_dict(page: Dict) -> Dict[str, Optional[str]]:
             if file_obj.get("type") == "external":
                 original_url = file_obj.get("external", {}).get("url", "")
                 # Cloudflare Imagesにアップロード（一時URLの場合は永続URLに変換）
-                permanent_url = upload_image_from_url(original_url, image_id=f"dev-{file_obj.get('name', '')}")
+                permanent_url = IMAGE_RESOLVER.resolve(original_url, image_id=f"dev-{file_obj.get('name', '')}")
                 normalized.append({"name": file_obj.get("name", ""), "url": permanent_url if permanent_url else original_url})
             elif file_obj.get("type") == "file":
                 original_url = file_obj.get("file", {}).get("url", "")
                 # Cloudflare Imagesにアップロード（一時URLの場合は永続URLに変換）
-                permanent_url = upload_image_from_url(original_url, image_id=f"dev-{file_obj.get('name', '')}")
+                permanent_url = IMAGE_RESOLVER.resolve(original_url, image_id=f"dev-{file_obj.get('name', '')}")
                 normalized.append({"name": file_obj.get("name", ""), "url": permanent_url if permanent_url else original_url})
+        # 表示サイズに合わせて読み込めるよう、幅・高さと srcset を付ける
+        for item in normalized:
+            item.update(responsive_image_entry(item["url"]))
         return normalized
 
     return {
@@ -319,15 +282,29 @@ def notion_page_to_dict(page: Dict) -> Dict[str, Optional[str]]:
     }
 
 
-def export_notion_to_json(token: str, output_path: Path) -> Dict[str, int]:
+@revalidate_on_failure(DATABASE_NAME)
+def export_notion_to_json(
+    token: str,
+    output_path: Path,
+    incremental: bool = False,
+    progress: Optional[Callable[[int], None]] = None,
+) -> Dict[str, int]:
     database_id, _ = ensure_database(token)
-    existing = fetch_existing_pages(database_id, token)
-    records = [notion_page_to_dict(page) for page in existing.values()]
+    sync = IncrementalExport(output_path, incremental, key_field="project_name")
+    # 同じタイトルのページは後のものを使う（fetch_existing_pages と同じ）
+    changes: Dict[str, Tuple[str, Optional[Dict]]] = {}
+    # 一覧の次のページを先読みしている間に、取得済みのページを変換する（画像のアップロードなど）
+    for title, page in iter_titled_pages(database_id, token, TITLE_PROPERTY, query_filter=sync.query_filter()):
+        changes[title] = (page["id"], notion_page_to_dict(page))
+        if progress:
+            progress(1)
+    records = sync.merge(changes.values())
     records.sort(key=lambda item: item["project_name"])
 
     output_path.parent.mkdir(parents=True, exist_ok=True)
     with output_path.open("w", encoding="utf-8") as fp:
         json.dump(records, fp, ensure_ascii=False, indent=2)
+    sync.commit()
 
     return {"notion_count": len(records), "file": str(output_path)}
 
@@ -346,6 +323,11 @@ def parse_args() -> argparse.Namespace:
         default=DEFAULT_EXPORT_PATH,
         help=f"エクスポート先のパス（既定: {DEFAULT_EXPORT_PATH}）",
     )
+    pull_parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="前回以降に編集されたレコードだけを取得して既存のJSONにマージします。",
+    )
 
     return parser.parse_args()
 
@@ -357,8 +339,9 @@ def main() -> None:
     if args.command == "push":
         sync_to_notion(token, reset=args.reset)
     elif args.command == "pull":
-        result = export_notion_to_json(token, args.output)
+        result = export_notion_to_json(token, args.output, incremental=args.incremental)
         print(f"[EXPORT] Notion から {result['notion_count']} 件を取得し、{result['file']} に保存しました。")
+        print_resolver_stats()
 
 
 if __name__ == "__main__":
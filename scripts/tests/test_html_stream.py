@@ -0,0 +1,75 @@
+"""utils.html_stream.transform のテスト"""
+import re
+import sys
+import unittest
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils.html_stream import IMG_TAG_PATTERN, RemoveTrackingPixels, Rule, SubImgTags, transform
+
+
+def replace_src(old: str, new: str) -> SubImgTags:
+    return SubImgTags(IMG_TAG_PATTERN, lambda match: match.group(0).replace(old, new))
+
+
+class UppercaseHr(Rule):
+    tag_pattern = r"<hr>"
+
+    def tag(self, tag: str) -> Optional[str]:
+        return "<HR>" if tag == "<hr>" else tag
+
+
+class TransformTest(unittest.TestCase):
+    def test_no_rules_returns_input(self):
+        html = "<p>本文<img src=\"a.png\"></p>"
+        self.assertEqual(transform(html, []), html)
+
+    def test_text_outside_tags_is_untouched(self):
+        html = "<p>a.png と書いた本文</p>\n<img src=\"a.png\">"
+        self.assertEqual(
+            transform(html, [replace_src("a.png", "b.png")]),
+            "<p>a.png と書いた本文</p>\n<img src=\"b.png\">",
+        )
+
+    def test_img_tag_is_case_insensitive(self):
+        self.assertEqual(transform('<IMG SRC="a.png">', [replace_src("a.png", "b.png")]), '<IMG SRC="b.png">')
+
+    def test_rules_with_different_tag_patterns(self):
+        html = '<hr><p>本文</p><img src="a.png"><hr>'
+        self.assertEqual(
+            transform(html, [UppercaseHr(), replace_src("a.png", "b.png")]),
+            '<HR><p>本文</p><img src="b.png"><HR>',
+        )
+
+    def test_removes_tracking_pixels(self):
+        html = '前<img width="1" height="1" src="https://t.example.com/p">後<img src="https://example.com/0.gif">末'
+        self.assertEqual(transform(html, [RemoveTrackingPixels()]), "前後末")
+
+    def test_keeps_regular_images(self):
+        html = '<img src="https://example.com/a.png" width="100" height="100">'
+        self.assertEqual(transform(html, [RemoveTrackingPixels()]), html)
+
+    def test_rules_apply_in_order_and_stop_after_removal(self):
+        seen = []
+
+        class Record(Rule):
+            tag_pattern = r"<[iI][mM][gG][^>]*>"
+
+            def tag(self, tag: str) -> Optional[str]:
+                seen.append(tag)
+                return tag
+
+        html = '<img src="a.png"><img width="1" height="1" src="t.gif">'
+        self.assertEqual(transform(html, [replace_src("a.png", "b.png"), RemoveTrackingPixels(), Record()]), '<img src="b.png">')
+        self.assertEqual(seen, ['<img src="b.png">'])
+
+    def test_matches_regex_chain(self):
+        html = '<p>x</p><img src="a.png"><img width="1" height="1" src="t"><img src="c.png" alt="a.png">'
+        expected = re.sub(r'<img[^>]+width=["\']1["\'][^>]+height=["\']1["\'][^>]*>', "", html)
+        expected = IMG_TAG_PATTERN.sub(lambda match: match.group(0).replace("a.png", "b.png"), expected)
+        self.assertEqual(transform(html, [RemoveTrackingPixels(), replace_src("a.png", "b.png")]), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
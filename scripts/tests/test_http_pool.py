@@ -0,0 +1,149 @@
+"""utils.http_pool の接続の再利用と本文の送り直しのテスト（ローカルのHTTPサーバーを使う）"""
+import sys
+import threading
+import time
+import unittest
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils.http_pool import ConnectionPool, RequestError
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: bytes, headers=None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        if self.path == "/drop":
+            # Keep-Alive のまま応答してから切断する（アイドル中にサーバー側で切られた接続を再現）
+            self._reply(200, b"dropped")
+            self.close_connection = True
+        elif self.path == "/redirect":
+            self._reply(302, b"", {"Location": "/hello"})
+        elif self.path == "/missing":
+            self._reply(404, b"not found")
+        elif self.path == "/slow":
+            self.server.slow_requests += 1
+            time.sleep(0.5)
+            self._reply(200, b"slow")
+        else:
+            self._reply(200, b"hello")
+
+    def do_POST(self):
+        self.server.connections.add(self.client_address)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self._reply(200, b"echo:" + body)
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        cls.server.daemon_threads = True
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.netloc = f"127.0.0.1:{cls.server.server_address[1]}"
+        cls.base = f"http://{cls.netloc}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.connections = set()
+        self.server.slow_requests = 0
+        self.pool = ConnectionPool()
+
+    def tearDown(self):
+        self.pool.close()
+
+    def stats(self):
+        return self.pool.stats()[self.netloc]
+
+    def drop_idle_connection(self):
+        self.assertEqual(self.pool.request("GET", f"{self.base}/drop").body, b"dropped")
+        # サーバー側の切断が終わるのを待つ
+        time.sleep(0.1)
+
+    def test_reuses_connection(self):
+        for _ in range(3):
+            self.assertEqual(self.pool.request("GET", f"{self.base}/hello").body, b"hello")
+        self.assertEqual(self.stats(), {"new": 1, "reused": 2})
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_streamed_response_returns_connection_after_full_read(self):
+        with self.pool.stream("GET", f"{self.base}/hello") as response:
+            self.assertEqual(b"".join(response.iter_chunks(2)), b"hello")
+        self.pool.request("GET", f"{self.base}/hello")
+        self.assertEqual(self.stats(), {"new": 1, "reused": 1})
+
+    def test_closed_stream_discards_connection(self):
+        response = self.pool.stream("GET", f"{self.base}/hello")
+        response.close()
+        self.pool.request("GET", f"{self.base}/hello")
+        self.assertEqual(self.stats(), {"new": 2, "reused": 0})
+
+    def test_replays_bytes_body_on_stale_connection(self):
+        self.drop_idle_connection()
+        response = self.pool.request("POST", f"{self.base}/echo", body=b"payload")
+        self.assertEqual(response.body, b"echo:payload")
+        # 切断済みの接続を試してから、新しい接続で送り直している
+        self.assertEqual(self.stats(), {"new": 2, "reused": 1})
+
+    def test_replays_list_body_on_stale_connection(self):
+        self.drop_idle_connection()
+        response = self.pool.request("POST", f"{self.base}/echo", body=[b"pay", b"load"], headers={"Content-Length": "7"})
+        self.assertEqual(response.body, b"echo:payload")
+        self.assertEqual(self.stats(), {"new": 2, "reused": 1})
+
+    def test_iterator_body_skips_idle_connections(self):
+        self.drop_idle_connection()
+        chunks = iter([b"pay", b"load"])
+        response = self.pool.request("POST", f"{self.base}/echo", body=chunks, headers={"Content-Length": "7"})
+        self.assertEqual(response.body, b"echo:payload")
+        # 送り直せない本文は、切断されている可能性のあるアイドル接続に送らない
+        self.assertEqual(self.stats(), {"new": 2, "reused": 0})
+
+    def test_timeout_on_reused_connection_is_not_replayed(self):
+        self.pool.request("GET", f"{self.base}/hello")
+        with self.assertRaises(RequestError) as raised:
+            self.pool.request("GET", f"{self.base}/slow", timeout=0.1)
+        # 送信済みのリクエストは送り直さず、呼び出し元に判断を任せる
+        self.assertTrue(raised.exception.sent)
+        self.assertEqual(self.stats(), {"new": 1, "reused": 1})
+        time.sleep(0.6)
+        self.assertEqual(self.server.slow_requests, 1)
+
+    def test_follows_redirect(self):
+        response = self.pool.request("GET", f"{self.base}/redirect")
+        self.assertEqual(response.body, b"hello")
+        self.assertEqual(response.url, f"{self.base}/hello")
+
+    def test_raises_http_error(self):
+        with self.assertRaises(urllib.error.HTTPError) as raised:
+            self.pool.request("GET", f"{self.base}/missing")
+        self.assertEqual(raised.exception.code, 404)
+        self.assertEqual(raised.exception.read(), b"not found")
+
+    def test_raises_url_error_on_connection_failure(self):
+        with self.assertRaises(urllib.error.URLError) as raised:
+            self.pool.request("GET", "http://127.0.0.1:1/hello", timeout=5)
+        self.assertFalse(raised.exception.sent)
+
+
+if __name__ == "__main__":
+    unittest.main()
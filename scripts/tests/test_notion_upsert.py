@@ -0,0 +1,174 @@
+"""utils.notion_upsert の比較と件数集計のテスト"""
+import sys
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils import notion_upsert
+from utils.notion_upsert import archive_pages, normalize_property, properties_changed, upsert_records
+
+
+def rich_text_payload(text):
+    return {"rich_text": [{"type": "text", "text": {"content": text}}]}
+
+
+def rich_text_page(text, **annotations):
+    item = {"type": "text", "plain_text": text, "href": None, "text": {"content": text, "link": None}}
+    item["annotations"] = {**notion_upsert._DEFAULT_ANNOTATIONS, **annotations}
+    return {"id": "abc", "type": "rich_text", "rich_text": [item]}
+
+
+class FakeNotion:
+    """notion_request の代わりに呼び出しを記録する"""
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, method, path, token, payload):
+        with self._lock:
+            self.calls.append((method, path, payload))
+        return {}
+
+
+class NormalizePropertyTest(unittest.TestCase):
+    def test_rich_text_payload_matches_fetched_page(self):
+        self.assertEqual(normalize_property(rich_text_payload("本文")), normalize_property(rich_text_page("本文")))
+
+    def test_rich_text_joins_segments(self):
+        prop = {"rich_text": [{"text": {"content": "前半"}}, {"text": {"content": "後半"}}]}
+        self.assertEqual(normalize_property(prop), ("rich_text", ("前半後半", False)))
+
+    def test_rich_text_formatting_counts_as_difference(self):
+        self.assertNotEqual(normalize_property(rich_text_payload("本文")), normalize_property(rich_text_page("本文", bold=True)))
+
+    def test_rich_text_link_counts_as_difference(self):
+        page = rich_text_page("本文")
+        page["rich_text"][0]["href"] = "https://example.com"
+        self.assertEqual(normalize_property(page), ("rich_text", ("本文", True)))
+
+    def test_title(self):
+        payload = {"title": [{"text": {"content": "記事"}}]}
+        page = {"id": "title", "type": "title", "title": [{"plain_text": "記事", "text": {"content": "記事"}}]}
+        self.assertEqual(normalize_property(payload), ("title", ("記事", False)))
+        self.assertEqual(normalize_property(payload), normalize_property(page))
+
+    def test_select(self):
+        self.assertEqual(normalize_property({"select": {"name": "Published"}}), ("select", "Published"))
+        page = {"id": "s", "type": "select", "select": {"id": "1", "name": "Published", "color": "green"}}
+        self.assertEqual(normalize_property(page), ("select", "Published"))
+        self.assertEqual(normalize_property({"select": None}), ("select", None))
+
+    def test_multi_select_keeps_order(self):
+        payload = {"multi_select": [{"name": "A"}, {"name": "B"}]}
+        page = {"id": "m", "type": "multi_select", "multi_select": [{"id": "1", "name": "A"}, {"id": "2", "name": "B"}]}
+        self.assertEqual(normalize_property(payload), ("multi_select", ("A", "B")))
+        self.assertEqual(normalize_property(payload), normalize_property(page))
+        self.assertNotEqual(normalize_property(payload), normalize_property({"multi_select": [{"name": "B"}, {"name": "A"}]}))
+
+    def test_url_treats_empty_as_none(self):
+        self.assertEqual(normalize_property({"url": "https://example.com"}), ("url", "https://example.com"))
+        self.assertEqual(normalize_property({"url": ""}), normalize_property({"id": "u", "type": "url", "url": None}))
+
+    def test_date(self):
+        payload = {"date": {"start": "2024-01-01"}}
+        page = {"id": "d", "type": "date", "date": {"start": "2024-01-01", "end": None, "time_zone": None}}
+        self.assertEqual(normalize_property(payload), ("date", ("2024-01-01", None)))
+        self.assertEqual(normalize_property(payload), normalize_property(page))
+        self.assertEqual(normalize_property({"date": None}), ("date", None))
+
+    def test_number_ignores_int_float_difference(self):
+        self.assertEqual(normalize_property({"number": 3}), normalize_property({"id": "n", "type": "number", "number": 3.0}))
+
+    def test_unknown_type_is_not_comparable(self):
+        self.assertIsNone(normalize_property({"relation": [{"id": "x"}]}))
+
+
+class PropertiesChangedTest(unittest.TestCase):
+    def setUp(self):
+        self.existing = {
+            "Title": {"id": "title", "type": "title", "title": [{"plain_text": "記事", "text": {"content": "記事"}}]},
+            "Status": {"id": "s", "type": "select", "select": {"name": "Published"}},
+        }
+
+    def test_same_values(self):
+        desired = {"Title": {"title": [{"text": {"content": "記事"}}]}, "Status": {"select": {"name": "Published"}}}
+        self.assertFalse(properties_changed(desired, self.existing))
+
+    def test_changed_value(self):
+        self.assertTrue(properties_changed({"Status": {"select": {"name": "Draft"}}}, self.existing))
+
+    def test_missing_property(self):
+        self.assertTrue(properties_changed({"Tags": {"multi_select": []}}, self.existing))
+
+    def test_properties_only_on_page_are_ignored(self):
+        self.assertFalse(properties_changed({"Status": {"select": {"name": "Published"}}}, self.existing))
+
+    def test_uncomparable_type_is_always_changed(self):
+        existing = {"Links": {"id": "r", "type": "relation", "relation": [{"id": "x"}]}}
+        self.assertTrue(properties_changed({"Links": {"relation": [{"id": "x"}]}}, existing))
+
+
+class UpsertRecordsTest(unittest.TestCase):
+    def test_counts(self):
+        existing_pages = {
+            "same": {"id": "page-same", "properties": {"Status": {"type": "select", "select": {"name": "Published"}}}},
+            "changed": {"id": "page-changed", "properties": {"Status": {"type": "select", "select": {"name": "Draft"}}}},
+        }
+        records = [
+            ("same", {"Status": {"select": {"name": "Published"}}}),
+            ("changed", {"Status": {"select": {"name": "Published"}}}),
+            ("new", {"Status": {"select": {"name": "Published"}}}),
+        ]
+        fake = FakeNotion()
+        reported = []
+        progressed = []
+        with mock.patch.object(notion_upsert, "notion_request", fake):
+            result = upsert_records(
+                "db", "token", records, existing_pages,
+                update_fields={"archived": False},
+                progress=progressed.append,
+                report=lambda action, key: reported.append((action, key)),
+            )
+
+        self.assertEqual((result.created, result.updated, result.unchanged, result.archived), (1, 1, 1, 0))
+        self.assertEqual(sorted(reported), [("created", "new"), ("unchanged", "same"), ("updated", "changed")])
+        self.assertEqual(sum(progressed), 3)
+        calls = {(method, path): payload for method, path, payload in fake.calls}
+        self.assertEqual(set(calls), {("POST", "/pages"), ("PATCH", "/pages/page-changed")})
+        self.assertEqual(calls[("POST", "/pages")]["parent"], {"database_id": "db"})
+        self.assertIs(calls[("PATCH", "/pages/page-changed")]["archived"], False)
+
+    def test_nothing_to_write(self):
+        fake = FakeNotion()
+        with mock.patch.object(notion_upsert, "notion_request", fake):
+            result = upsert_records("db", "token", [], {}, report=lambda action, key: None)
+        self.assertEqual(result.to_dict(), {"created": 0, "updated": 0, "unchanged": 0, "archived": 0})
+        self.assertEqual(fake.calls, [])
+
+
+class ArchivePagesTest(unittest.TestCase):
+    def test_archives_every_page_by_default(self):
+        fake = FakeNotion()
+        with mock.patch.object(notion_upsert, "notion_request", fake):
+            archived = archive_pages("token", [{"id": "a"}, {"id": "b"}])
+        self.assertEqual(archived, 2)
+        self.assertEqual(sorted(path for _, path, _ in fake.calls), ["/pages/a", "/pages/b"])
+        self.assertTrue(all(payload == {"archived": True} for _, _, payload in fake.calls))
+
+    def test_skips_pages_already_in_target_state(self):
+        pages = [
+            {"id": "a", "properties": {"Status": {"type": "select", "select": {"name": "Archived"}}}},
+            {"id": "b", "properties": {"Status": {"type": "select", "select": {"name": "Published"}}}},
+        ]
+        fake = FakeNotion()
+        with mock.patch.object(notion_upsert, "notion_request", fake):
+            archived = archive_pages("token", pages, payload={"properties": {"Status": {"select": {"name": "Archived"}}}})
+        self.assertEqual(archived, 1)
+        self.assertEqual([path for _, path, _ in fake.calls], ["/pages/b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
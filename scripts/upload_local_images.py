@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+ローカル画像をまとめてCloudflare Imagesにアップロードし、データセットの参照を永続URLに書き換える
+ディレクトリ内の画像を並列にアップロードし、データセットのJSONにある image/... の参照
+（画像リストの url・アイキャッチ・本文の<img>）を永続URLに置き換えます。
+アップロードの結果は data/.sync/upload_manifest.jsonl に記録され、再実行時は
+変更のないファイルをスキップします（中断した場合も続きから再開できます）。
+
+例: python3 scripts/upload_local_images.py image data/sns_grids.json
+"""
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from utils.cloudflare_images import DEFAULT_IMAGE_UPLOAD_CONCURRENCY
+from utils.image_dedup import DEDUP_STATS
+from utils.image_preprocess import enable_preprocessing
+from utils.image_refs import rewrite_refs
+from utils.upload_manifest import UPLOAD_MANIFEST, UploadManifest, iter_local_images, manifest_key, upload_local_files
+
+
+def upload_directory(
+    image_dir: Path,
+    dataset_path: Path,
+    recursive: bool = False,
+    concurrency: int = DEFAULT_IMAGE_UPLOAD_CONCURRENCY,
+    dry_run: bool = False,
+    manifest: UploadManifest = UPLOAD_MANIFEST,
+) -> int:
+    """ディレクトリ内の画像をアップロードし、データセットの参照を書き換えた件数を返す"""
+    with dataset_path.open("r", encoding="utf-8") as fp:
+        dataset = json.load(fp)
+
+    images = iter_local_images(image_dir, recursive=recursive)
+    print(f"[INFO] 画像ファイル {len(images)} 件をアップロードします（同時実行数: {concurrency}）", file=sys.stderr)
+    result = upload_local_files({path: None for path in images}, concurrency=concurrency, manifest=manifest)
+    print(f"[INFO] {result.summary()}", file=sys.stderr)
+
+    # image/... の参照を永続URLに置き換える（srcset があれば作り直す）
+    mapping = {manifest_key(path): url for path, url in result.urls.items()}
+    dataset, count = rewrite_refs(dataset, mapping)
+    if count and not dry_run:
+        tmp_path = dataset_path.with_suffix(".tmp")
+        with tmp_path.open("w", encoding="utf-8") as fp:
+            json.dump(dataset, fp, ensure_ascii=False, indent=2)
+        tmp_path.replace(dataset_path)
+    print(
+        f"[INFO] {dataset_path.name}: {count} 件の参照を書き換え{'（dry-run のため保存なし）' if dry_run else 'ました'}",
+        file=sys.stderr,
+    )
+    return count
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="ローカル画像を並列にCloudflare Imagesへアップロードし、データセットの参照を永続URLに書き換えます。"
+    )
+    parser.add_argument("image_dir", type=Path, help="画像のディレクトリ（例: image）")
+    parser.add_argument("dataset", type=Path, help="参照を書き換えるデータセットのJSON（例: data/sns_grids.json）")
+    parser.add_argument("--recursive", action="store_true", help="サブディレクトリの画像も対象にします（_ で始まるディレクトリは除く）。")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_IMAGE_UPLOAD_CONCURRENCY,
+        help=f"同時にアップロードするファイルの数（既定: {DEFAULT_IMAGE_UPLOAD_CONCURRENCY}）",
+    )
+    parser.add_argument("--manifest", type=Path, help=f"マニフェストのパス（既定: {UPLOAD_MANIFEST.path}）")
+    parser.add_argument(
+        "--preprocess",
+        action="store_true",
+        help="アップロード前に縮小・メタデータ削除・WebP/AVIFへの再エンコードを行います（Pillow が必要）。",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="アップロードはしますが、JSONは保存しません。")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if not os.environ.get("CLOUDFLARE_IMAGES_ACCOUNT_ID") or not os.environ.get("CLOUDFLARE_IMAGES_API_TOKEN"):
+        print("[ERROR] 環境変数 CLOUDFLARE_IMAGES_ACCOUNT_ID と CLOUDFLARE_IMAGES_API_TOKEN を設定してください", file=sys.stderr)
+        sys.exit(1)
+    if not args.image_dir.is_dir():
+        print(f"[ERROR] 画像ディレクトリが見つかりません: {args.image_dir}", file=sys.stderr)
+        sys.exit(1)
+    if not args.dataset.exists():
+        print(f"[ERROR] JSONファイルが見つかりません: {args.dataset}", file=sys.stderr)
+        sys.exit(1)
+    if args.preprocess:
+        enable_preprocessing()
+
+    manifest = UploadManifest(args.manifest) if args.manifest else UPLOAD_MANIFEST
+    upload_directory(
+        args.image_dir,
+        args.dataset,
+        recursive=args.recursive,
+        concurrency=args.concurrency,
+        dry_run=args.dry_run,
+        manifest=manifest,
+    )
+    print(f"[DONE] {DEDUP_STATS.summary()}")
+
+
+if __name__ == "__main__":
+    main()
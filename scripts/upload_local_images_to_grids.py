@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
-"""ローカルの画像ファイルをCloudflare Imagesにアップロードしてグリッドに追加"""
+"""ローカルの画像ファイルをCloudflare Imagesにアップロードしてグリッドに追加（並列・アップロード済みのファイルはスキップ）"""
 import json
 import os
 import sys
 from pathlib import Path
+from typing import Optional, Tuple
 
 sys.path.insert(0, str(Path(__file__).parent))
-from utils.cloudflare_images import upload_to_cloudflare_images
+from utils.cloudflare_images import DEFAULT_IMAGE_UPLOAD_CONCURRENCY
+from utils.image_dedup import DEDUP_STATS
+from utils.responsive_images import responsive_image_entry
+from utils.upload_manifest import upload_local_files
 
 # ファイル名からグリッド名へのマッピング
 FILENAME_TO_GRID = {
@@ -17,25 +21,15 @@ FILENAME_TO_GRID = {
     "Jpan.GIF": "This is Japanese Quality",
 }
 
-def upload_local_image(image_path: Path, image_id: str) -> str:
-    """ローカル画像ファイルをCloudflare Imagesにアップロード"""
-    try:
-        with open(image_path, 'rb') as f:
-            image_data = f.read()
-        
-        permanent_url = upload_to_cloudflare_images(image_data, image_id=image_id)
-        if permanent_url:
-            print(f"    ✅ アップロード成功: {permanent_url[:80]}...")
-            return permanent_url
-        else:
-            print(f"    ❌ アップロード失敗")
-            return None
-    except Exception as e:
-        print(f"    ❌ エラー: {e}")
-        return None
+def update_grids_with_local_images(
+    json_path: Path, image_dir: Path, concurrency: int = DEFAULT_IMAGE_UPLOAD_CONCURRENCY
+) -> Optional[Tuple[int, int]]:
+    """
+    ローカル画像をCloudflare Imagesにアップロードしてグリッドを更新
 
-def update_grids_with_local_images(json_path: Path, image_dir: Path):
-    """ローカル画像をCloudflare Imagesにアップロードしてグリッドを更新"""
+    Returns:
+        (更新した画像の数, アップロードに失敗したファイルの数)。画像ファイルがない場合はNone
+    """
     
     # JSONファイルを読み込み
     with open(json_path, 'r', encoding='utf-8') as f:
@@ -54,16 +48,15 @@ def update_grids_with_local_images(json_path: Path, image_dir: Path):
     
     if not image_files:
         print("❌ 画像ファイルが見つかりませんでした")
-        return
+        return None
     
     print(f"見つかった画像ファイル: {len(image_files)}個")
     print()
     
-    updated_count = 0
-    
+    # 画像ごとの対象グリッドを先に決め、まとめて並列にアップロードする
+    targets = {}
     for image_file in image_files:
         filename = image_file.name
-        print(f"処理中: {filename}")
         
         # ファイル名からグリッド名を推測
         grid_name = FILENAME_TO_GRID.get(filename)
@@ -77,46 +70,70 @@ def update_grids_with_local_images(json_path: Path, image_dir: Path):
                     break
         
         if not grid_name:
-            print(f"  ⚠️ 対応するグリッドが見つかりません。スキップします")
+            print(f"⚠️ {filename}: 対応するグリッドが見つかりません。スキップします")
             continue
         
-        print(f"  → グリッド: {grid_name}")
-        
         if grid_name not in grids_by_name:
-            print(f"  ⚠️ グリッド '{grid_name}' がJSONファイルに存在しません。スキップします")
+            print(f"⚠️ {filename}: グリッド '{grid_name}' がJSONファイルに存在しません。スキップします")
             continue
         
-        grid = grids_by_name[grid_name]
+        targets[image_file] = grid_name
+    
+    # Cloudflare Imagesにアップロード（マニフェストに記録済みで変更のないファイルはスキップ）
+    result = upload_local_files(
+        {
+            image_file: f"grid-{grid_name.lower().replace(' ', '-')}-{image_file.stem}"
+            for image_file, grid_name in targets.items()
+        },
+        concurrency=concurrency,
+    )
+    print(f"📤 {result.summary()}")
+    print()
+    
+    updated_count = 0
+    
+    for image_file, grid_name in targets.items():
+        filename = image_file.name
+        permanent_url = result.urls.get(image_file)
+        print(f"処理中: {filename} → グリッド: {grid_name}")
         
-        # 画像IDを生成
-        image_id = f"grid-{grid_name.lower().replace(' ', '-')}-{image_file.stem}"
+        if not permanent_url:
+            print(f"  ❌ アップロード失敗")
+            print()
+            continue
+        
+        grid = grids_by_name[grid_name]
         
-        # Cloudflare Imagesにアップロード
-        permanent_url = upload_local_image(image_file, image_id)
+        # グリッドのgrid_imageに追加（既に同じファイル名があれば更新、なければ追加）
+        grid_images = grid.get('grid_image', [])
         
-        if permanent_url:
-            # グリッドのgrid_imageに追加（既に同じファイル名があれば更新、なければ追加）
-            grid_images = grid.get('grid_image', [])
-            
-            # 同じファイル名の画像を探す
-            updated = False
-            for img in grid_images:
-                if img.get('name') == filename:
-                    img['url'] = permanent_url
+        # 同じファイル名の画像を探す
+        updated = False
+        for img in grid_images:
+            if img.get('name') == filename:
+                if img.get('url') == permanent_url:
                     updated = True
-                    print(f"  ✅ 画像URLを更新しました")
+                    print(f"  ⏭️ 更新不要")
                     break
-            
-            if not updated:
-                # 新規追加
-                grid_images.append({
-                    "name": filename,
-                    "url": permanent_url
-                })
-                grid['grid_image'] = grid_images
-                print(f"  ✅ 画像を追加しました")
-            
+                img['url'] = permanent_url
+                # ローカル画像の縮小版の srcset は使えなくなるため作り直す
+                img.pop('srcset', None)
+                img.update(responsive_image_entry(permanent_url))
+                updated = True
+                updated_count += 1
+                print(f"  ✅ 画像URLを更新しました")
+                break
+        
+        if not updated:
+            # 新規追加
+            grid_images.append({
+                "name": filename,
+                "url": permanent_url,
+                **responsive_image_entry(permanent_url),
+            })
+            grid['grid_image'] = grid_images
             updated_count += 1
+            print(f"  ✅ 画像を追加しました")
         
         print()
     
@@ -128,8 +145,9 @@ def update_grids_with_local_images(json_path: Path, image_dir: Path):
         print(f"📁 JSONファイルを保存しました: {json_path}")
     else:
         print("ℹ️ 更新された画像はありませんでした")
+    print(f"📊 {DEDUP_STATS.summary()}")
     
-    return updated_count
+    return updated_count, result.failed
 
 
 if __name__ == "__main__":
@@ -150,6 +168,7 @@ if __name__ == "__main__":
         print(f"❌ 画像ディレクトリが見つかりません: {image_dir}", file=sys.stderr)
         sys.exit(1)
     
-    updated_count = update_grids_with_local_images(json_path, image_dir)
-    sys.exit(0 if updated_count > 0 else 1)
+    outcome = update_grids_with_local_images(json_path, image_dir)
+    # すべてマニフェストでスキップされた再実行は成功とし、アップロードに失敗したファイルがあれば失敗とする
+    sys.exit(0 if outcome is not None and outcome[1] == 0 else 1)
 
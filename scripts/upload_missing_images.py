@@ -1,14 +1,15 @@
 #!/usr/bin/env python3
-"""記事内のNotion一時URL画像をCloudflare ImagesにアップロードしてJSONファイルを更新"""
+"""記事内のNotion一時URL画像をCloudflare ImagesにアップロードしてJSONファイルを更新（全記事の画像をまとめて並列にアップロード）"""
 import json
 import re
 import sys
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent))
-from utils.cloudflare_images import upload_image_from_url, is_permanent_url
+from utils.cloudflare_images import DEFAULT_IMAGE_UPLOAD_CONCURRENCY, is_permanent_url
+from utils.image_resolver import IMAGE_RESOLVER, print_resolver_stats
 
-def find_and_upload_images(json_path: Path):
+def find_and_upload_images(json_path: Path, concurrency: int = DEFAULT_IMAGE_UPLOAD_CONCURRENCY):
     """JSONファイル内の画像URLを検索してCloudflare Imagesにアップロード"""
     
     # JSONファイルを読み込み
@@ -18,9 +19,9 @@ def find_and_upload_images(json_path: Path):
     print(f"記事数: {len(articles)}")
     print()
     
-    updated_count = 0
-    upload_count = 0
-    
+    # 1. 全記事のNotion一時URLを集める（元のURL → 画像ID）
+    pending = {}
+    article_urls = {}
     for article_idx, article in enumerate(articles):
         title = article.get('title', '')
         content = article.get('content', '')
@@ -36,9 +37,6 @@ def find_and_upload_images(json_path: Path):
         print(f"記事: {title[:50]}...")
         print(f"  画像タグ数: {len(img_tags)}")
         
-        new_content = content
-        article_updated = False
-        
         for img_tag in img_tags:
             url_match = re.search(r'src=["\']([^"\']+)["\']', img_tag)
             if not url_match:
@@ -51,38 +49,41 @@ def find_and_upload_images(json_path: Path):
                 print(f"    ✅ 既にCloudflare Images: {original_url[:80]}...")
                 continue
             
-            # Notionの一時URLの場合はアップロード
+            # Notionの一時URLの場合はアップロード対象
             if not is_permanent_url(original_url):
                 print(f"    ⚠️ Notion一時URLを検出: {original_url[:100]}...")
-                
-                try:
-                    # 画像IDを生成
-                    page_id = article.get('id', '')[:16] if article.get('id') else f'article-{article_idx}'
-                    image_id = f"affiling-{page_id}-img"
-                    
-                    # Cloudflare Imagesにアップロード
-                    permanent_url = upload_image_from_url(original_url, image_id=image_id)
-                    
-                    if permanent_url and permanent_url != original_url:
-                        print(f"    ✅ アップロード成功: {permanent_url[:80]}...")
-                        # URLを置き換え
-                        new_content = new_content.replace(original_url, permanent_url)
-                        article_updated = True
-                        upload_count += 1
-                    else:
-                        print(f"    ❌ アップロード失敗（元のURLを使用）")
-                except Exception as e:
-                    print(f"    ❌ エラー: {e}")
+                page_id = article.get('id', '')[:16] if article.get('id') else f'article-{article_idx}'
+                pending.setdefault(original_url, f"affiling-{page_id}-img")
+                article_urls.setdefault(article_idx, []).append(original_url)
+        print()
+    
+    if not pending:
+        print("ℹ️ 更新が必要な画像はありませんでした")
+        return 0, 0
+    
+    # 2. まとめて並列にアップロード（失敗した画像は元のURLのまま）
+    print(f"📤 {len(pending)}個の画像をアップロード中（同時実行数: {concurrency}）...")
+    resolved = IMAGE_RESOLVER.resolve_many(pending, concurrency=concurrency)
+    upload_count = sum(1 for url, permanent_url in resolved.items() if permanent_url != url)
+    failed_count = len(pending) - upload_count
+    if failed_count:
+        print(f"    ❌ {failed_count}個の画像のアップロードに失敗しました（元のURLを使用）")
+    print()
+    
+    # 3. URLを置き換え
+    updated_count = 0
+    for article_idx, urls in article_urls.items():
+        article = articles[article_idx]
+        new_content = article['content']
+        for original_url in urls:
+            if resolved.get(original_url, original_url) != original_url:
+                new_content = new_content.replace(original_url, resolved[original_url])
         
         # コンテンツが更新された場合は保存
-        if article_updated:
+        if new_content != article['content']:
             article['content'] = new_content
             updated_count += 1
-            print(f"  ✅ 記事を更新しました")
-        else:
-            print(f"  ⏭️ 更新不要")
-        
-        print()
+            print(f"  ✅ 記事を更新しました: {article.get('title', '')[:50]}...")
     
     # JSONファイルを保存
     if updated_count > 0:
@@ -111,5 +112,6 @@ if __name__ == "__main__":
         sys.exit(1)
     
     upload_count, updated_count = find_and_upload_images(json_path)
+    print_resolver_stats()
     sys.exit(0 if upload_count > 0 or updated_count == 0 else 1)
 
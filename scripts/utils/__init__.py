@@ -1,5 +1,8 @@
 # Utils package
+from pathlib import Path
 
 
-
-
+# リポジトリのルート（ローカル画像の image/... などはここからの相対パス）
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+# 同期処理のキャッシュ・状態ファイルを置くディレクトリ（リポジトリの data/.sync）
+SYNC_CACHE_DIR = PROJECT_ROOT / "data" / ".sync"
@@ -0,0 +1,104 @@
+"""
+Notionブロックツリーのローカルキャッシュ
+ページ（ルートブロック）IDごとに、子ブロックを展開済みのブロックツリーを
+data/.sync/blocks/<ページID>.json に保存します。
+ページの last_edited_time が保存時と同じであれば、ブロックAPIを呼ばずにキャッシュから描画できます。
+合計サイズが上限を超えた場合は、最後に使われた時刻（mtime）が古いものから削除します。
+画像ブロックの署名付きURLは期限が切れるため、キャッシュから読み込んだツリーの画像は
+呼び出し元（sync_affiling_articles.refresh_file_images）で取り直します。
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from . import SYNC_CACHE_DIR
+
+
+DEFAULT_BLOCK_CACHE_DIR = SYNC_CACHE_DIR / "blocks"
+MAX_BLOCK_CACHE_BYTES = 100 * 1024 * 1024
+# last_edited_time は分単位に丸められるため、編集直後に取得したツリーは同じ分の再編集を見逃す可能性がある
+EDIT_TIME_MARGIN = timedelta(minutes=2)
+
+
+def _parse_time(value: str) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return None
+
+
+class BlockCache:
+    def __init__(self, directory: Path, max_bytes: int = MAX_BLOCK_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _path(self, block_id: str) -> Path:
+        return self.directory / f"{block_id.replace('-', '')}.json"
+
+    def get(self, block_id: str, last_edited_time: Optional[str]) -> Optional[List[Dict]]:
+        """last_edited_time が一致し、編集から十分に時間が経ってから保存されたツリーを返す"""
+        if not last_edited_time:
+            return None
+        path = self._path(block_id)
+        try:
+            with path.open("r", encoding="utf-8") as fp:
+                entry = json.load(fp)
+        except (OSError, ValueError):
+            return None
+        if entry.get("last_edited_time") != last_edited_time or not entry.get("settled"):
+            return None
+        try:
+            # LRU のため、参照した時刻を mtime に記録する
+            os.utime(path)
+        except OSError:
+            pass
+        return entry.get("blocks")
+
+    def put(self, block_id: str, last_edited_time: Optional[str], blocks: List[Dict]) -> None:
+        if not last_edited_time:
+            return
+        edited_at = _parse_time(last_edited_time)
+        fetched_at = time.time()
+        entry = {
+            "last_edited_time": last_edited_time,
+            "fetched_at": int(fetched_at),
+            "settled": edited_at is not None and fetched_at >= (edited_at + EDIT_TIME_MARGIN).timestamp(),
+            "blocks": blocks,
+        }
+        path = self._path(block_id)
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            with tmp_path.open("w", encoding="utf-8") as fp:
+                json.dump(entry, fp, ensure_ascii=False)
+            tmp_path.replace(path)
+            self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        total = 0
+        for path in self.directory.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+
+
+# affiling の pull で共有するキャッシュ
+BLOCK_CACHE = BlockCache(DEFAULT_BLOCK_CACHE_DIR)
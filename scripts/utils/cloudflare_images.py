@@ -1,20 +1,54 @@
 """
 Cloudflare Images API統合モジュール
 Notionの一時URLから画像をダウンロードし、Cloudflare Imagesにアップロードして永続URLを取得します。
+大きな画像はダウンロードしながらアップロードし、画像全体をメモリに保持しません。
+
+アップロードには呼び出し元の画像ID（affiling-block-<id> など）に、画像の内容
+（内容が分からないストリーミングでは取得元のNotionファイル）のハッシュを付けた決定的なIDを使います。
+同じIDの画像がCloudflare Imagesにあれば、画像を転送せずにその永続URLを使います。
+
+CLOUDFLARE_IMAGES_UPLOAD_BY_URL=1（または enable_upload_by_url()）の場合は、Notionの一時URLを
+Cloudflare Imagesに渡して取得させ（URLを指定したアップロード）、画像がこのマシンを経由しないようにします。
+失敗した場合は、これまでどおりダウンロードしてからアップロードします。
 """
 import hashlib
-import io
 import json
 import os
+import re
 import sys
 import urllib.error
-import urllib.request
-from typing import Optional
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+from urllib.parse import quote
+
+from .http_pool import HTTP_POOL, StreamingResponse
+from .image_cache import IMAGE_CACHE, content_hash, source_key
+from .image_dedup import DEDUP_STATS, perceptual_hash
+from .image_preprocess import (
+    IMAGE_HEADER_BYTES,
+    file_extension,
+    image_dimensions,
+    preprocess_image,
+    preprocessing_enabled,
+)
 
 
 CLOUDFLARE_IMAGES_API_BASE = "https://api.cloudflare.com/client/v4"
 CLOUDFLARE_IMAGES_ACCOUNT_ID = os.environ.get("CLOUDFLARE_IMAGES_ACCOUNT_ID", "84c63b21ee19071dcfac86d195478443")
 CLOUDFLARE_IMAGES_API_TOKEN = os.environ.get("CLOUDFLARE_IMAGES_API_TOKEN", "a2sdidwH8aFyQc04TkVMJhVxxik_MycgrRMfuLQe")
+# 1記事（1バッチ）あたりの画像のダウンロード・アップロードの同時実行数
+DEFAULT_IMAGE_UPLOAD_CONCURRENCY = 4
+# Content-Length がこれ以上の画像は、ダウンロードしながらアップロードする
+# （小さい画像は先に読み込み、内容のハッシュでアップロード済みの画像を再利用する）
+STREAM_UPLOAD_MIN_BYTES = 2 * 1024 * 1024
+# 画像IDに内容のハッシュを付けるか（0 の場合は呼び出し元の画像IDをそのまま使う。
+# 同じ画像IDを別の画像に使っている呼び出し元があるため、通常は付けたままにすること）
+IMAGE_ID_HASH_SUFFIX = os.environ.get("CLOUDFLARE_IMAGES_ID_HASH_SUFFIX", "1") != "0"
+IMAGE_ID_HASH_LENGTH = 16
+# Cloudflare Imagesで「同じIDの画像が既に存在する」ことを示すエラーコード
+ALREADY_EXISTS_ERROR_CODE = 5409
+_UNSAFE_ID_CHARS = re.compile(r"[^A-Za-z0-9._-]+")
+
+_upload_by_url_enabled = os.environ.get("CLOUDFLARE_IMAGES_UPLOAD_BY_URL") == "1"
 
 
 def is_cloudflare_url(url: str) -> bool:
@@ -48,84 +82,261 @@ def is_permanent_url(url: str) -> bool:
     return True
 
 
+def custom_image_id(image_id: Optional[str], fingerprint: Optional[str] = None) -> Optional[str]:
+    """
+    Cloudflare Imagesに送る決定的な画像ID
+    呼び出し元の画像IDを英数字と . _ - に揃え、fingerprint（内容のSHA-256や取得元のキー）のハッシュを付けます。
+    """
+    if not image_id:
+        return None
+    base = _UNSAFE_ID_CHARS.sub("-", image_id).strip("-") or "image"
+    if not IMAGE_ID_HASH_SUFFIX or not fingerprint:
+        # 日本語のファイル名などで元の画像IDと変わった場合は、別の画像と同じIDにならないようにする
+        if base != image_id:
+            return f"{base}-{hashlib.sha256(image_id.encode()).hexdigest()[:8]}"
+        return base
+    digest = fingerprint if re.fullmatch(r"[0-9a-f]{64}", fingerprint) else hashlib.sha256(fingerprint.encode()).hexdigest()
+    return f"{base}-{digest[:IMAGE_ID_HASH_LENGTH]}"
+
+
+def enable_upload_by_url(enabled: bool = True) -> bool:
+    """URLを指定したアップロードを切り替え、実際に有効になったかを返す"""
+    global _upload_by_url_enabled
+    if enabled and preprocessing_enabled():
+        # 前処理（縮小・再エンコード）には画像のバイナリが必要なため、前処理が優先される
+        print("[WARNING] 画像の前処理が有効なため、URLを指定したアップロードは行いません。", file=sys.stderr)
+        enabled = False
+    _upload_by_url_enabled = enabled
+    return enabled
+
+
+def upload_by_url_enabled() -> bool:
+    return _upload_by_url_enabled and not preprocessing_enabled()
+
+
+def open_image(url: str) -> Optional[StreamingResponse]:
+    """URLの画像を本文を読み込まずに開く"""
+    try:
+        return HTTP_POOL.stream("GET", url, headers={"User-Agent": "Mozilla/5.0"}, timeout=30)
+    except Exception as e:
+        print(f"[WARNING] 画像のダウンロードに失敗しました: {url[:100]}... - {e}", file=sys.stderr)
+        return None
+
+
+def read_image(response: StreamingResponse) -> Optional[bytes]:
+    try:
+        return response.read()
+    except Exception as e:
+        print(f"[WARNING] 画像のダウンロードに失敗しました: {response.url[:100]}... - {e}", file=sys.stderr)
+        return None
+
+
 def download_image(url: str) -> Optional[bytes]:
     """URLから画像をダウンロード"""
+    response = open_image(url)
+    if response is None:
+        return None
+    return read_image(response)
+
+
+def _form_field(boundary: str, name: str, value: str) -> str:
+    return f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+
+
+def _multipart_head(boundary: str, mime_type: Optional[str] = None, image_id: Optional[str] = None) -> bytes:
+    # id フィールドがあると、Cloudflare Imagesはその値を画像IDとして使う
+    id_part = _form_field(boundary, "id", image_id) if image_id else ""
+    return (
+        id_part + f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="image.{file_extension(mime_type)}"\r\n'
+        f"Content-Type: {mime_type or 'application/octet-stream'}\r\n\r\n"
+    ).encode()
+
+
+def _multipart_tail(boundary: str) -> bytes:
+    return f"\r\n--{boundary}--\r\n".encode()
+
+
+def _multipart_body(
+    boundary: str, chunks: Iterable[bytes], mime_type: Optional[str] = None, image_id: Optional[str] = None
+) -> Iterable[bytes]:
+    """画像のチャンクをそのまま流す multipart/form-data の本文（画像全体を連結したコピーを作らない）"""
+    if isinstance(chunks, (list, tuple)):
+        # メモリ上の画像は送り直せるようリストのまま渡す（接続の再利用が可能になる）
+        return [_multipart_head(boundary, mime_type, image_id), *chunks, _multipart_tail(boundary)]
+    return _streaming_multipart_body(boundary, chunks, mime_type, image_id)
+
+
+def _streaming_multipart_body(
+    boundary: str, chunks: Iterable[bytes], mime_type: Optional[str] = None, image_id: Optional[str] = None
+) -> Iterator[bytes]:
+    yield _multipart_head(boundary, mime_type, image_id)
+    yield from chunks
+    yield _multipart_tail(boundary)
+
+
+def _hashing_chunks(
+    chunks: Iterable[bytes], hasher, expected_size: Optional[int], head: Optional[bytearray] = None
+) -> Iterator[bytes]:
+    """チャンクを流しながらハッシュを計算し、途中で途切れたダウンロードはエラーにする（head には画像の先頭を残す）"""
+    received = 0
+    for chunk in chunks:
+        hasher.update(chunk)
+        if head is not None and len(head) < IMAGE_HEADER_BYTES:
+            head.extend(chunk[:IMAGE_HEADER_BYTES - len(head)])
+        received += len(chunk)
+        yield chunk
+    if expected_size is not None and received != expected_size:
+        raise IOError(f"画像のダウンロードが途中で終了しました（{received} / {expected_size} バイト）")
+
+
+def _parse_upload_result(result: Dict) -> Optional[str]:
+    if not result.get("success"):
+        print(f"[WARNING] Cloudflare Imagesアップロードに失敗: {result}", file=sys.stderr)
+        return None
+    return _delivery_url(result.get("result", {}))
+
+
+def _delivery_url(image_result: Dict) -> Optional[str]:
+    """画像の詳細（アップロード・取得APIの result）から永続URLを取得"""
+    variants = image_result.get("variants", [])
+    if variants:
+        # public variantを探す
+        public_url = [v for v in variants if "/public" in v]
+        if public_url:
+            return public_url[0]
+        # なければ最初のvariantを使用
+        return variants[0]
+    
+    # フォールバック: 手動でURLを構築
+    image_id_from_result = image_result.get("id")
+    if image_id_from_result:
+        # アカウントハッシュを計算（実際にはAPIから取得する必要があるが、簡易的に）
+        account_hash = hashlib.md5(CLOUDFLARE_IMAGES_ACCOUNT_ID.encode()).hexdigest()[:16]
+        return f"https://imagedelivery.net/{account_hash}/{image_id_from_result}/public"
+    
+    print("[WARNING] 画像IDが取得できませんでした。", file=sys.stderr)
+    return None
+
+
+def _images_api_url(image_id: Optional[str] = None) -> str:
+    url = f"{CLOUDFLARE_IMAGES_API_BASE}/accounts/{CLOUDFLARE_IMAGES_ACCOUNT_ID}/images/v1"
+    return f"{url}/{quote(image_id, safe='')}" if image_id else url
+
+
+def lookup_cloudflare_image(image_id: Optional[str]) -> Optional[str]:
+    """同じIDの画像がCloudflare Imagesにあれば永続URLを返す（画像を転送する前の存在確認）"""
+    if not image_id or not CLOUDFLARE_IMAGES_ACCOUNT_ID or not CLOUDFLARE_IMAGES_API_TOKEN:
+        return None
+    DEDUP_STATS.record_lookup()
     try:
-        req = urllib.request.Request(url)
-        req.add_header("User-Agent", "Mozilla/5.0")
-        with urllib.request.urlopen(req, timeout=30) as response:
-            return response.read()
+        response = HTTP_POOL.request(
+            "GET", _images_api_url(image_id), headers={"Authorization": f"Bearer {CLOUDFLARE_IMAGES_API_TOKEN}"}, timeout=30
+        )
+        result = json.loads(response.body.decode("utf-8"))
+    except urllib.error.HTTPError as e:
+        if e.code != 404:
+            print(f"[WARNING] Cloudflare Imagesの画像を確認できませんでした: {image_id} - {e.code} {e.reason}", file=sys.stderr)
+        return None
     except Exception as e:
-        print(f"[WARNING] 画像のダウンロードに失敗しました: {url[:100]}... - {e}", file=sys.stderr)
+        print(f"[WARNING] Cloudflare Imagesの画像を確認できませんでした: {image_id} - {e}", file=sys.stderr)
+        return None
+    if not result.get("success"):
         return None
+    return _delivery_url(result.get("result", {}))
 
 
-def upload_to_cloudflare_images(image_data: bytes, image_id: Optional[str] = None) -> Optional[str]:
+def _already_exists(error_body: str) -> bool:
+    try:
+        errors = json.loads(error_body).get("errors") or []
+    except ValueError:
+        return False
+    return any(error.get("code") == ALREADY_EXISTS_ERROR_CODE for error in errors if isinstance(error, dict))
+
+
+def upload_stream_to_cloudflare_images(
+    chunks: Iterable[bytes],
+    image_id: Optional[str] = None,
+    size: Optional[int] = None,
+    mime_type: Optional[str] = None,
+) -> Optional[str]:
     """
-    Cloudflare Imagesに画像をアップロードして永続URLを取得
+    画像のチャンクを受け取りながらCloudflare Imagesにアップロードして永続URLを取得
     
     Args:
-        image_data: 画像のバイナリデータ
-        image_id: オプションの画像ID（指定しない場合は自動生成）
+        chunks: 画像のバイナリデータのチャンク
+        image_id: オプションの画像ID（Cloudflare Imagesの画像IDとして送信。指定しない場合は自動生成）
+        size: 画像の合計サイズ（不明な場合は chunked で送信）
+        mime_type: 画像のMIMEタイプ（不明な場合は application/octet-stream）
     
     Returns:
-        永続URL、失敗時はNone
+        永続URL（同じIDの画像が既にある場合はその画像のURL）、失敗時はNone
     """
     if not CLOUDFLARE_IMAGES_ACCOUNT_ID or not CLOUDFLARE_IMAGES_API_TOKEN:
         print("[WARNING] Cloudflare Imagesの認証情報が設定されていません。", file=sys.stderr)
         return None
     
+    image_id = custom_image_id(image_id)
+    # multipart/form-dataでアップロード
+    boundary = _multipart_boundary(image_id)
+    headers = _upload_headers(boundary)
+    if size is not None:
+        head_size = len(_multipart_head(boundary, mime_type, image_id))
+        headers["Content-Length"] = str(head_size + size + len(_multipart_tail(boundary)))
+    body = _multipart_body(boundary, chunks, mime_type, image_id)
+    return _post_upload(body, headers, image_id)
+
+
+def upload_url_to_cloudflare_images(image_url: str, image_id: Optional[str] = None) -> Optional[str]:
+    """
+    画像のURLをCloudflare Imagesに渡し、Cloudflare側で取得させて永続URLを取得
+    画像はこのマシンを経由しないため、内容のハッシュや幅と高さは分かりません。
+
+    Args:
+        image_url: 画像のURL（Notionの一時URLは期限が切れる前に渡すこと）
+        image_id: オプションの画像ID（Cloudflare Imagesの画像IDとして送信。指定しない場合は自動生成）
+
+    Returns:
+        永続URL（同じIDの画像が既にある場合はその画像のURL）、失敗時はNone
+    """
+    if not CLOUDFLARE_IMAGES_ACCOUNT_ID or not CLOUDFLARE_IMAGES_API_TOKEN:
+        print("[WARNING] Cloudflare Imagesの認証情報が設定されていません。", file=sys.stderr)
+        return None
+
+    image_id = custom_image_id(image_id)
+    boundary = _multipart_boundary(image_id)
+    fields = _form_field(boundary, "url", image_url)
+    if image_id:
+        fields += _form_field(boundary, "id", image_id)
+    body = (fields + f"--{boundary}--\r\n").encode()
+    headers = _upload_headers(boundary)
+    headers["Content-Length"] = str(len(body))
+    return _post_upload(body, headers, image_id)
+
+
+def _multipart_boundary(image_id: Optional[str]) -> str:
+    return "----WebKitFormBoundary" + hashlib.md5(str(image_id or "").encode()).hexdigest()[:16]
+
+
+def _upload_headers(boundary: str) -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {CLOUDFLARE_IMAGES_API_TOKEN}",
+        "Content-Type": f"multipart/form-data; boundary={boundary}",
+    }
+
+
+def _post_upload(body, headers: Dict[str, str], image_id: Optional[str]) -> Optional[str]:
+    """Cloudflare Images API（直接アップロード）に送信し、永続URLを返す"""
     try:
-        # Cloudflare Images API: 直接アップロード
-        url = f"{CLOUDFLARE_IMAGES_API_BASE}/accounts/{CLOUDFLARE_IMAGES_ACCOUNT_ID}/images/v1"
-        
-        # multipart/form-dataでアップロード
-        boundary = "----WebKitFormBoundary" + hashlib.md5(str(image_id or "").encode()).hexdigest()[:16]
-        
-        # multipart/form-dataの構築
-        body_parts = []
-        body_parts.append(f"--{boundary}\r\n".encode())
-        body_parts.append(b'Content-Disposition: form-data; name="file"; filename="image"\r\n')
-        body_parts.append(b'Content-Type: image/jpeg\r\n\r\n')
-        body_parts.append(image_data)
-        body_parts.append(f"\r\n--{boundary}--\r\n".encode())
-        
-        body = b"".join(body_parts)
-        
-        req = urllib.request.Request(url, data=body, method="POST")
-        req.add_header("Authorization", f"Bearer {CLOUDFLARE_IMAGES_API_TOKEN}")
-        req.add_header("Content-Type", f"multipart/form-data; boundary={boundary}")
-        
-        with urllib.request.urlopen(req, timeout=60) as response:
-            result = json.loads(response.read().decode("utf-8"))
-            
-            if not result.get("success"):
-                print(f"[WARNING] Cloudflare Imagesアップロードに失敗: {result}", file=sys.stderr)
-                return None
-            
-            # 永続URLを取得
-            image_result = result.get("result", {})
-            variants = image_result.get("variants", [])
-            if variants:
-                # public variantを探す
-                public_url = [v for v in variants if "/public" in v]
-                if public_url:
-                    return public_url[0]
-                # なければ最初のvariantを使用
-                return variants[0]
-            
-            # フォールバック: 手動でURLを構築
-            image_id_from_result = image_result.get("id")
-            if image_id_from_result:
-                # アカウントハッシュを計算（実際にはAPIから取得する必要があるが、簡易的に）
-                account_hash = hashlib.md5(CLOUDFLARE_IMAGES_ACCOUNT_ID.encode()).hexdigest()[:16]
-                return f"https://imagedelivery.net/{account_hash}/{image_id_from_result}/public"
-            
-            print("[WARNING] 画像IDが取得できませんでした。", file=sys.stderr)
-            return None
+        response = HTTP_POOL.request("POST", _images_api_url(), body=body, headers=headers, timeout=60)
+        return _parse_upload_result(json.loads(response.body.decode("utf-8")))
     
     except urllib.error.HTTPError as e:
         error_body = e.read().decode("utf-8") if hasattr(e, 'read') else ""
+        if _already_exists(error_body):
+            # 同じIDで（並行して、または以前の同期で）アップロード済みの画像
+            print(f"[INFO] 同じIDの画像がCloudflare Imagesに存在するため、既存の画像を使用します: {image_id}", file=sys.stderr)
+            return lookup_cloudflare_image(image_id)
         print(f"[WARNING] Cloudflare Images API エラー: {e.code} {e.reason}", file=sys.stderr)
         if error_body:
             print(f"[WARNING] {error_body}", file=sys.stderr)
@@ -135,6 +346,88 @@ def upload_to_cloudflare_images(image_data: bytes, image_id: Optional[str] = Non
         return None
 
 
+def _upload_prepared(image_data: bytes, image_id: Optional[str]) -> Tuple[Optional[str], Optional[Tuple[int, int]]]:
+    """前処理してからアップロードし、(永続URL, アップロードした画像の幅と高さ) を返す"""
+    upload_data, mime_type = preprocess_image(image_data)
+    if upload_data is not image_data:
+        print(
+            f"[INFO] 画像を最適化しました: {len(image_data) / 1024:.0f} KB → {len(upload_data) / 1024:.0f} KB（{mime_type}）",
+            file=sys.stderr,
+        )
+    permanent_url = upload_stream_to_cloudflare_images([upload_data], image_id, size=len(upload_data), mime_type=mime_type)
+    return permanent_url, image_dimensions(upload_data[:IMAGE_HEADER_BYTES])
+
+
+def upload_to_cloudflare_images(image_data: bytes, image_id: Optional[str] = None) -> Optional[str]:
+    """
+    Cloudflare Imagesに画像をアップロードして永続URLを取得
+    実際の画像形式を判定し、前処理が有効なら縮小・再エンコードしてから送信します。
+    
+    Args:
+        image_data: 画像のバイナリデータ
+        image_id: オプションの画像ID（内容のハッシュを付けて送信。指定しない場合は自動生成）
+    
+    Returns:
+        永続URL、失敗時はNone
+    """
+    # 同じIDで内容の違う画像を送った場合に、既存の画像（5409）が返らないようにする
+    return _upload_prepared(image_data, custom_image_id(image_id, content_hash(image_data)))[0]
+
+
+def upload_image_bytes(
+    image_data: bytes,
+    image_id: Optional[str] = None,
+    source: Optional[str] = None,
+    cloudflare_id: Optional[str] = None,
+) -> Optional[str]:
+    """
+    画像をアップロードして永続URLを取得（同じ内容の画像がアップロード済みならそのURLを再利用）
+    
+    Args:
+        image_data: 画像のバイナリデータ
+        image_id: オプションの画像ID（内容のハッシュを付けてCloudflare Imagesの画像IDにする）
+        source: キャッシュに記録する画像の取得元（source_key など）
+        cloudflare_id: 存在確認済みのCloudflare Imagesの画像ID（指定した場合は image_id より優先）
+    
+    Returns:
+        永続URL、失敗時はNone
+    """
+    size = len(image_data)
+    sha256 = content_hash(image_data)
+    cached_url = IMAGE_CACHE.lookup_hash(sha256)
+    if cached_url:
+        DEDUP_STATS.record_reuse("sha256", size)
+        IMAGE_CACHE.record(cached_url, source=source, sha256=sha256, image_id=image_id, size=size)
+        return cached_url
+    
+    # 再エンコードなどでバイト列だけが違う画像の候補（知覚ハッシュが有効な場合のみ）
+    # dHash は別の画像でも一致することがあるため、報告するだけで既存のURLは使わない
+    phash = perceptual_hash(image_data)
+    similar_url = IMAGE_CACHE.lookup_perceptual(phash)
+    if similar_url:
+        DEDUP_STATS.record_phash_candidate()
+        print(f"[INFO] 見た目が同じ可能性のある画像がアップロード済みです（別の画像としてアップロードします）: {similar_url}", file=sys.stderr)
+    
+    if cloudflare_id is None:
+        # 同じ画像IDと内容の画像が（キャッシュを消した後などに）Cloudflare Imagesにあれば転送しない
+        cloudflare_id = custom_image_id(image_id, sha256)
+        existing_url = lookup_cloudflare_image(cloudflare_id)
+        if existing_url:
+            DEDUP_STATS.record_reuse("existing", size)
+            IMAGE_CACHE.record(existing_url, source=source, sha256=sha256, image_id=cloudflare_id, phash=phash, size=size)
+            return existing_url
+    
+    # Cloudflare Imagesにアップロード
+    permanent_url, dimensions = _upload_prepared(image_data, cloudflare_id)
+    if permanent_url:
+        print(f"[INFO] 画像をCloudflare Imagesにアップロードしました: {permanent_url}", file=sys.stderr)
+        DEDUP_STATS.record_upload(size)
+        IMAGE_CACHE.record(
+            permanent_url, source=source, sha256=sha256, image_id=cloudflare_id, phash=phash, size=size, dimensions=dimensions
+        )
+    return permanent_url
+
+
 def upload_image_from_url(notion_url: str, image_id: Optional[str] = None) -> Optional[str]:
     """
     Notionの一時URLから画像をダウンロードし、Cloudflare Imagesにアップロードして永続URLを取得
@@ -153,16 +446,67 @@ def upload_image_from_url(notion_url: str, image_id: Optional[str] = None) -> Op
     if is_permanent_url(notion_url):
         return notion_url
     
+    # 同じNotionファイルを処理済みならダウンロードもアップロードも行わない
+    source = source_key(notion_url)
+    cached_url = IMAGE_CACHE.lookup_source(source)
+    if cached_url:
+        DEDUP_STATS.record_reuse("source", IMAGE_CACHE.size_of(cached_url))
+        return cached_url
+    
+    # 画像IDは取得元のNotionファイルから決める（同じファイルなら内容を読まなくても同じIDになる）
+    cloudflare_id = custom_image_id(image_id, source)
+    existing_url = lookup_cloudflare_image(cloudflare_id)
+    if existing_url:
+        DEDUP_STATS.record_reuse("existing", None)
+        IMAGE_CACHE.record(existing_url, source=source, image_id=cloudflare_id)
+        return existing_url
+    
+    if upload_by_url_enabled():
+        # Cloudflare側で一時URLから取得させる（失敗した場合はダウンロードしてアップロードする）
+        permanent_url = upload_url_to_cloudflare_images(notion_url, cloudflare_id)
+        if permanent_url:
+            print(f"[INFO] 画像をURLからCloudflare Imagesにアップロードしました: {permanent_url}", file=sys.stderr)
+            DEDUP_STATS.record_upload(None, by_url=True)
+            IMAGE_CACHE.record(permanent_url, source=source, image_id=cloudflare_id)
+            return permanent_url
+        print(f"[INFO] URLを指定したアップロードに失敗したため、ダウンロードしてアップロードします: {notion_url[:100]}...", file=sys.stderr)
+    
     # 画像をダウンロード
-    image_data = download_image(notion_url)
-    if not image_data:
+    response = open_image(notion_url)
+    if response is None:
         print(f"[WARNING] 画像のダウンロードに失敗したため、元のURLを使用します: {notion_url[:100]}...", file=sys.stderr)
         return notion_url
     
-    # Cloudflare Imagesにアップロード
-    permanent_url = upload_to_cloudflare_images(image_data, image_id)
+    with response:
+        size = response.content_length
+        # 前処理（縮小・再エンコード）には画像全体が必要なため、有効な場合はストリーミングしない
+        if size is not None and size >= STREAM_UPLOAD_MIN_BYTES and not preprocessing_enabled():
+            # 大きな画像はダウンロードしながらアップロードする（ハッシュは流しながら計算して記録）
+            hasher = hashlib.sha256()
+            head = bytearray()
+            content_type = (response.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+            mime_type = content_type if content_type.startswith("image/") else None
+            chunks = _hashing_chunks(response.iter_chunks(), hasher, size, head)
+            permanent_url = upload_stream_to_cloudflare_images(chunks, cloudflare_id, size, mime_type=mime_type)
+            if permanent_url:
+                print(f"[INFO] 画像をCloudflare Imagesにアップロードしました: {permanent_url}", file=sys.stderr)
+                DEDUP_STATS.record_upload(size)
+                IMAGE_CACHE.record(
+                    permanent_url,
+                    source=source,
+                    sha256=hasher.hexdigest(),
+                    image_id=cloudflare_id,
+                    size=size,
+                    dimensions=image_dimensions(bytes(head)),
+                )
+        else:
+            image_data = read_image(response)
+            if not image_data:
+                print(f"[WARNING] 画像のダウンロードに失敗したため、元のURLを使用します: {notion_url[:100]}...", file=sys.stderr)
+                return notion_url
+            permanent_url = upload_image_bytes(image_data, image_id, source=source, cloudflare_id=cloudflare_id)
+    
     if permanent_url:
-        print(f"[INFO] 画像をCloudflare Imagesにアップロードしました: {permanent_url}", file=sys.stderr)
         return permanent_url
     else:
         print(f"[WARNING] Cloudflare Imagesへのアップロードに失敗したため、元のURLを使用します: {notion_url[:100]}...", file=sys.stderr)
@@ -0,0 +1,107 @@
+"""
+NotionデータベースIDのローカルレジストリ
+ensure_database が毎回 /search を呼ばないよう、データベース名 → ID を
+data/.sync/notion_databases.json に保存します。
+保存済みのIDでデータベース自体の取得・クエリが 403/404 になった場合はエントリを破棄し、
+検索からやり直します。
+"""
+import functools
+import json
+import sys
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from . import SYNC_CACHE_DIR
+from .notion_client import NotionAPIError, forget_property_ids
+
+
+DEFAULT_REGISTRY_PATH = SYNC_CACHE_DIR / "notion_databases.json"
+# データベースが削除された・インテグレーションの共有が外れた場合のステータス
+STALE_DATABASE_STATUS_CODES = {403, 404}
+
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _load(path: Path) -> Dict[str, str]:
+    if not path.exists():
+        return {}
+    try:
+        with path.open("r", encoding="utf-8") as fp:
+            data = json.load(fp)
+            return data if isinstance(data, dict) else {}
+    except ValueError:
+        return {}
+
+
+def _save(data: Dict[str, str], path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with tmp_path.open("w", encoding="utf-8") as fp:
+        json.dump(data, fp, ensure_ascii=False, indent=2)
+    tmp_path.replace(path)
+
+
+def lookup_database_id(database_name: str, path: Path = DEFAULT_REGISTRY_PATH) -> Optional[str]:
+    with _REGISTRY_LOCK:
+        return _load(path).get(database_name)
+
+
+def remember_database_id(database_name: str, database_id: str, path: Path = DEFAULT_REGISTRY_PATH) -> None:
+    with _REGISTRY_LOCK:
+        data = _load(path)
+        if data.get(database_name) == database_id:
+            return
+        data[database_name] = database_id
+        _save(data, path)
+
+
+def forget_database_id(database_name: str, path: Path = DEFAULT_REGISTRY_PATH) -> None:
+    with _REGISTRY_LOCK:
+        data = _load(path)
+        if data.pop(database_name, None) is not None:
+            _save(data, path)
+
+
+def _normalize_id(object_id: str) -> str:
+    return object_id.replace("-", "").lower()
+
+
+def is_stale_database_error(error: NotionAPIError, database_id: str) -> bool:
+    """
+    データベース自体（GET /databases/{id}・/databases/{id}/query）への呼び出しが 403/404 で失敗したか
+    ブロックの取得や個別ページの更新など、データベース以外の 403/404 は対象外です。
+    """
+    if error.status not in STALE_DATABASE_STATUS_CODES:
+        return False
+    parts = error.path.split("?", 1)[0].strip("/").split("/")
+    if len(parts) < 2 or parts[0] != "databases" or _normalize_id(parts[1]) != _normalize_id(database_id):
+        return False
+    if len(parts) == 2:
+        return error.method.upper() == "GET"
+    return len(parts) == 3 and parts[2] == "query"
+
+
+def revalidate_on_failure(database_name: str) -> Callable:
+    """
+    保存済みのデータベースIDを使う処理をラップするデコレータ
+    保存済みのIDでデータベース自体の取得・クエリが 403/404 で失敗した場合だけ、
+    レジストリのエントリとキャッシュしたプロパティIDを破棄し、IDを解決し直して1回だけ再実行します。
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cached_id = lookup_database_id(database_name)
+            try:
+                return func(*args, **kwargs)
+            except NotionAPIError as error:
+                if cached_id is None or not is_stale_database_error(error, cached_id):
+                    raise
+                print(f"[INFO] 保存済みのデータベースID（{database_name}）が無効なため、再検索します。", file=sys.stderr)
+                forget_database_id(database_name)
+                forget_property_ids(cached_id)
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
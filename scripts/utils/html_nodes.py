@@ -0,0 +1,118 @@
+"""
+HTMLの中間ノードツリー
+ブロックの描画結果を文字列ではなくノードとして組み立て、画像URLの置き換えや
+トラッキング画像の削除などをノード上で行ったうえで、serialize で1回だけHTML文字列にします。
+rich_text の描画結果やHTMLコードブロックの中身など、すでにHTMLになっている断片は Raw として保持します。
+"""
+import html
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Union
+
+
+VOID_TAGS = {"br", "hr", "img", "input"}
+BLANK_LINES_PATTERN = re.compile(r"\n\s*\n\s*\n+")
+
+
+@dataclass
+class Raw:
+    """エスケープ済みのHTML断片（そのまま出力する）"""
+
+    html: str
+
+
+@dataclass
+class Element:
+    tag: str
+    # 値が None の属性は値なし（checked など）で出力する
+    attrs: Dict[str, Optional[str]] = field(default_factory=dict)
+    children: List["Node"] = field(default_factory=list)
+    # 描画側が付ける補助情報（元のブロックIDなど）。HTMLには出力しない
+    meta: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class Fragment:
+    """ブロックの並び（トグルやカラムの中身）。子要素を改行区切りで出力する"""
+
+    children: List["Node"] = field(default_factory=list)
+
+
+Node = Union[Raw, Element, Fragment]
+
+
+def text(value: str) -> Raw:
+    return Raw(html.escape(value))
+
+
+def _serialize_attrs(attrs: Dict[str, Optional[str]]) -> str:
+    parts = []
+    for name, value in attrs.items():
+        if value is None:
+            parts.append(f" {name}")
+        else:
+            parts.append(f' {name}="{html.escape(value)}"')
+    return "".join(parts)
+
+
+def _write(node: Node, out: List[str]) -> None:
+    if isinstance(node, Raw):
+        out.append(node.html)
+    elif isinstance(node, Fragment):
+        for index, child in enumerate(node.children):
+            if index:
+                out.append("\n")
+            _write(child, out)
+    else:
+        out.append(f"<{node.tag}{_serialize_attrs(node.attrs)}>")
+        if node.tag in VOID_TAGS:
+            return
+        for child in node.children:
+            _write(child, out)
+        out.append(f"</{node.tag}>")
+
+
+def serialize(nodes: List[Node]) -> str:
+    """ブロックの並びをHTMLにする（トップレベルのノードは改行区切り）"""
+    out: List[str] = []
+    _write(Fragment(nodes), out)
+    return "".join(out)
+
+
+def iter_raw(nodes: List[Node]) -> Iterator[Raw]:
+    for node in nodes:
+        if isinstance(node, Raw):
+            yield node
+        else:
+            yield from iter_raw(node.children)
+
+
+def is_tracking_pixel(element: Element) -> bool:
+    """1x1 のトラッキング画像、または 0.gif の画像"""
+    if element.tag != "img":
+        return False
+    attrs = element.attrs
+    if attrs.get("width") == "1" and attrs.get("height") == "1":
+        return True
+    return "0.gif" in (attrs.get("src") or "").lower()
+
+
+def add_lazy_loading(element: Element) -> None:
+    if element.tag == "img" and "loading" not in element.attrs:
+        element.attrs["loading"] = "lazy"
+
+
+def trim_paragraph(element: Element) -> None:
+    """<p> の先頭と末尾の空白を削除"""
+    if element.tag != "p" or not element.children:
+        return
+    first, last = element.children[0], element.children[-1]
+    if isinstance(first, Raw):
+        first.html = first.html.lstrip()
+    if isinstance(last, Raw):
+        last.html = last.html.rstrip()
+
+
+def collapse_blank_lines(raw: Raw) -> None:
+    if "\n" in raw.html:
+        raw.html = BLANK_LINES_PATTERN.sub("\n\n", raw.html)
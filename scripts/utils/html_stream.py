@@ -0,0 +1,89 @@
+"""
+HTMLの1パス後処理
+各ルールが扱うタグ（<img> など）だけを区切りにしてHTMLを一度だけ分割し、
+登録されたルールを1回の走査の中で順に適用します。文書全体に正規表現を何度もかける代わりに、
+区切りのタグだけを処理し、最後に1回だけ連結します。
+
+ルールは Rule のサブクラスで、次の2つを定義します。
+- tag_pattern: 区切りにするタグの正規表現（キャプチャグループは使わないこと）
+- tag:         区切りのタグ1つを書き換える（None を返すと削除。前後のテキストは1つにつながる）
+tag には他のルールが区切りにしたタグも渡されるため、対象外のタグはそのまま返します。
+ルールは登録順に適用されます。
+"""
+import re
+from typing import List, Optional, Sequence
+
+
+IMG_TAG_SOURCE = r"<[iI][mM][gG][^>]*>"
+IMG_TAG_PATTERN = re.compile(r"<img[^>]+>", re.IGNORECASE)
+_TRACKING_PIXEL_PATTERNS = (
+    re.compile(r'<img[^>]+width=["\']1["\'][^>]+height=["\']1["\'][^>]*>', re.IGNORECASE),
+    re.compile(r'<img[^>]+src=["\'][^"\']*0\.gif[^"\']*["\'][^>]*>', re.IGNORECASE),
+)
+
+
+def is_img_tag(tag: str) -> bool:
+    return tag[:4].lower() == "<img"
+
+
+class Rule:
+    tag_pattern: Optional[str] = None
+
+    def tag(self, tag: str) -> Optional[str]:
+        return tag
+
+
+def _split_pattern(rules: Sequence[Rule]) -> Optional["re.Pattern"]:
+    sources: List[str] = []
+    for rule in rules:
+        if rule.tag_pattern and rule.tag_pattern not in sources:
+            sources.append(rule.tag_pattern)
+    if not sources:
+        return None
+    # 同じ位置から他のルールのタグ（汎用的なパターンなど）にも一致する場合は、<img> として扱うため先に照合する
+    sources.sort(key=lambda source: source != IMG_TAG_SOURCE)
+    return re.compile("(" + "|".join(f"(?:{source})" for source in sources) + ")")
+
+
+def transform(html: str, rules: Sequence[Rule]) -> str:
+    pattern = _split_pattern(rules)
+    if pattern is None:
+        return html
+    # 分割結果はテキストとタグが交互に並ぶ（奇数番目がタグ）
+    parts = pattern.split(html)
+    for index in range(1, len(parts), 2):
+        tag: Optional[str] = parts[index]
+        for rule in rules:
+            tag = rule.tag(tag)
+            if tag is None:
+                break
+        parts[index] = tag or ""
+    return "".join(parts)
+
+
+class SubImgTags(Rule):
+    """<img> タグに正規表現の置換を適用するルール（パターンは "<img" から ">" までに収まること）"""
+
+    tag_pattern = IMG_TAG_SOURCE
+
+    def __init__(self, pattern: "re.Pattern", repl):
+        self.pattern = pattern
+        self.repl = repl
+
+    def tag(self, tag: str) -> Optional[str]:
+        if is_img_tag(tag):
+            return self.pattern.sub(self.repl, tag)
+        return tag
+
+
+class RemoveTrackingPixels(Rule):
+    """1x1 のトラッキング画像と 0.gif の画像を削除"""
+
+    tag_pattern = IMG_TAG_SOURCE
+
+    def tag(self, tag: str) -> Optional[str]:
+        if not is_img_tag(tag):
+            return tag
+        for pattern in _TRACKING_PIXEL_PATTERNS:
+            tag = pattern.sub("", tag)
+        return tag or None
@@ -0,0 +1,281 @@
+"""
+ホストごとのKeep-Alive接続プール
+api.notion.com / api.cloudflare.com / S3 などの接続を使い回し、
+リクエストごとのTCP+TLSハンドシェイクを省きます。
+urllib.request.urlopen と同じく、4xx/5xx は urllib.error.HTTPError、
+接続エラー・タイムアウトは urllib.error.URLError（RequestError）として送出します。
+送り直しは、アイドル中にサーバー側で切断された接続（応答を受け取る前の切断）に限ります。
+大きな本文は stream() で少しずつ読み、リクエストの本文にはバイト列のイテレータも渡せます。
+"""
+import http.client
+import io
+import sys
+import threading
+import urllib.error
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Tuple, Union
+from urllib.parse import urljoin, urlsplit
+
+
+DEFAULT_TIMEOUT = 60
+MAX_IDLE_PER_HOST = 8
+MAX_REDIRECTS = 5
+REDIRECT_STATUS_CODES = {301, 302, 303, 307, 308}
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# バイト列、またはバイト列のリスト・イテレータ（Content-Length を指定しなければ chunked で送信）
+Body = Union[bytes, Iterable[bytes]]
+
+
+# アイドル中に切断されたKeep-Alive接続で、リクエストの送信時に起きるエラー
+_STALE_SEND_ERRORS = (ConnectionResetError, BrokenPipeError)
+
+
+class RequestError(urllib.error.URLError):
+    """
+    接続・送受信の失敗
+    sent が True の場合はリクエストを送り終えた後の失敗で、サーバーが処理した可能性があります。
+    """
+
+    def __init__(self, reason: BaseException, sent: bool):
+        super().__init__(reason)
+        self.sent = sent
+
+
+class PooledResponse:
+    """読み込み済みのレスポンス（接続はプールへ返却済み）"""
+
+    def __init__(self, status: int, reason: str, headers: http.client.HTTPMessage, body: bytes, url: str):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.url = url
+
+
+class StreamingResponse:
+    """
+    本文を読み込む前のレスポンス
+    本文を最後まで読むと接続をプールへ返却します。途中で close した場合は接続を破棄します。
+    """
+
+    def __init__(self, pool: "HostPool", conn: http.client.HTTPConnection, response: http.client.HTTPResponse, url: str):
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+        self.url = url
+        self._pool = pool
+        self._conn: Optional[http.client.HTTPConnection] = conn
+        self._response = response
+
+    @property
+    def content_length(self) -> Optional[int]:
+        try:
+            return int(self.headers["Content-Length"])
+        except (TypeError, ValueError):
+            return None
+
+    def iter_chunks(self, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        try:
+            while True:
+                chunk = self._response.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            self.close()
+
+    def read(self) -> bytes:
+        try:
+            return self._response.read()
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self._conn is None:
+            return
+        if self._response.isclosed() and not self._response.will_close:
+            self._pool.release(self._conn)
+        else:
+            self._conn.close()
+        self._conn = None
+
+    def __enter__(self) -> "StreamingResponse":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class HostPool:
+    """1ホスト分のアイドル接続と再利用カウンタ"""
+
+    def __init__(self, scheme: str, netloc: str):
+        self.scheme = scheme
+        self.netloc = netloc
+        self.new_connections = 0
+        self.reused_connections = 0
+        self._idle: List[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float, reuse: bool = True) -> Tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            if reuse and self._idle:
+                conn = self._idle.pop()
+                self.reused_connections += 1
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                conn.timeout = timeout
+                return conn, True
+            self.new_connections += 1
+        if self.scheme == "https":
+            conn = http.client.HTTPSConnection(self.netloc, timeout=timeout)
+        else:
+            conn = http.client.HTTPConnection(self.netloc, timeout=timeout)
+        return conn, False
+
+    def release(self, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            if len(self._idle) < MAX_IDLE_PER_HOST:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+class ConnectionPool:
+    """スキーム+ホストごとに HostPool を持つ接続プール"""
+
+    def __init__(self):
+        self._hosts: Dict[Tuple[str, str], HostPool] = {}
+        self._lock = threading.Lock()
+
+    def _host_pool(self, scheme: str, netloc: str) -> HostPool:
+        key = (scheme, netloc)
+        with self._lock:
+            pool = self._hosts.get(key)
+            if pool is None:
+                pool = HostPool(scheme, netloc)
+                self._hosts[key] = pool
+            return pool
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        body: Optional[Body] = None,
+        headers: Optional[Mapping[str, str]] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+    ) -> PooledResponse:
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self._send(method, url, body, headers or {}, timeout)
+            if response.status not in REDIRECT_STATUS_CODES or "Location" not in response.headers:
+                break
+            url = urljoin(url, response.headers["Location"])
+            if response.status == 303:
+                method, body = "GET", None
+
+        if response.status >= 400:
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, io.BytesIO(response.body))
+        return response
+
+    def stream(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[Mapping[str, str]] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+    ) -> StreamingResponse:
+        """本文を読み込まずにレスポンスを返す（with 文で使い、iter_chunks / read で読み進める）"""
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self._send(method, url, None, headers or {}, timeout, stream=True)
+            if response.status not in REDIRECT_STATUS_CODES or "Location" not in response.headers:
+                break
+            # 接続を再利用できるよう、リダイレクトの本文は読み捨てる
+            response.read()
+            url = urljoin(url, response.headers["Location"])
+            if response.status == 303:
+                method = "GET"
+
+        if response.status >= 400:
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, io.BytesIO(response.read()))
+        return response
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        body: Optional[Body],
+        headers: Mapping[str, str],
+        timeout: float,
+        stream: bool = False,
+    ) -> Union[PooledResponse, StreamingResponse]:
+        parts = urlsplit(url)
+        pool = self._host_pool(parts.scheme, parts.netloc)
+        path = parts.path or "/"
+        if parts.query:
+            path += f"?{parts.query}"
+        # イテレータの本文は送り直せないため、切断されている可能性があるアイドル接続は使わない
+        replayable = body is None or isinstance(body, (bytes, bytearray, str, list, tuple))
+
+        while True:
+            conn, reused = pool.acquire(timeout, reuse=replayable)
+            sent = False
+            try:
+                conn.request(method, path, body=body, headers=dict(headers))
+                sent = True
+                response = conn.getresponse()
+                data = b"" if stream else response.read()
+            except (http.client.HTTPException, OSError) as error:
+                conn.close()
+                # アイドル中にサーバー側で切断された接続なら新しい接続でやり直す
+                # （送信中の切断か、応答を1バイトも受け取らないうちの切断だけ。タイムアウトは呼び出し元に任せる）
+                if reused and (
+                    isinstance(error, http.client.RemoteDisconnected)
+                    or (not sent and isinstance(error, _STALE_SEND_ERRORS))
+                ):
+                    continue
+                raise RequestError(error, sent) from error
+            except BaseException:
+                conn.close()
+                raise
+
+            if stream:
+                return StreamingResponse(pool, conn, response, url)
+            if response.will_close:
+                conn.close()
+            else:
+                pool.release(conn)
+            return PooledResponse(response.status, response.reason, response.headers, data, url)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """ホストごとの新規接続数・再利用数"""
+        with self._lock:
+            pools = list(self._hosts.values())
+        return {
+            pool.netloc: {"new": pool.new_connections, "reused": pool.reused_connections}
+            for pool in pools
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            pools = list(self._hosts.values())
+        for pool in pools:
+            pool.close()
+
+
+# すべての同期モジュールで共有する接続プール
+HTTP_POOL = ConnectionPool()
+
+
+def connection_stats() -> Dict[str, Dict[str, int]]:
+    return HTTP_POOL.stats()
+
+
+def print_connection_stats(file=None) -> None:
+    for host, counters in sorted(connection_stats().items()):
+        print(f"[INFO] 接続 {host}: 新規 {counters['new']} / 再利用 {counters['reused']}", file=file or sys.stderr)
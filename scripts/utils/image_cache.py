@@ -0,0 +1,168 @@
+"""
+Cloudflare Imagesアップロード済み画像のキャッシュ
+Notionの一時URL（署名付きS3 URL）は取得のたびに変わるため、
+署名を除いたファイルパス（NotionのファイルID）と画像バイト列のSHA-256を
+キーにして、永続URL（imagedelivery.net）への対応をJSONLに保存します。
+同じ画像（SHA-256が一致するもの）に複数の永続URLが
+記録されている場合は、最初に記録されたURLを正規のURLとして扱います。
+srcset や width / height 属性を出力できるよう、画像の縦横のピクセル数も記録します。
+"""
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from . import SYNC_CACHE_DIR
+
+
+DEFAULT_CACHE_PATH = SYNC_CACHE_DIR / "image_cache.jsonl"
+
+
+def source_key(url: str) -> Optional[str]:
+    """URLから署名・有効期限などのクエリを除いた安定したキーを作る"""
+    if not url:
+        return None
+    parts = urlsplit(url)
+    if not parts.netloc:
+        return None
+    return f"{parts.netloc}{parts.path}"
+
+
+def content_hash(image_data: bytes) -> str:
+    return hashlib.sha256(image_data).hexdigest()
+
+
+class ImageCache:
+    """追記専用のJSONLインデックス。source_key・sha256から永続URLを、知覚ハッシュから見た目が同じ候補を引けます。"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._by_source: Dict[str, str] = {}
+        self._by_hash: Dict[str, str] = {}
+        self._by_phash: Dict[str, str] = {}
+        self._sizes: Dict[str, int] = {}
+        self._dimensions: Dict[str, Tuple[int, int]] = {}
+        # 幅と高さを読めなかった画像 → 記録した時刻（しばらくは読み直さない）
+        self._dimensions_failed: Dict[str, int] = {}
+        # 永続URL → 同じ画像の正規URL（別のURLで重複してアップロードされていたもの）
+        self._canonical: Dict[str, str] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _index(self, entry: Dict) -> None:
+        url = entry["url"]
+        canonical = self._canonical.get(url, url)
+        # 同じ画像とみなすのは内容のハッシュが一致した場合だけ（知覚ハッシュは候補の検索にのみ使う）
+        if entry.get("sha256"):
+            canonical = self._by_hash.setdefault(entry["sha256"], canonical)
+        if entry.get("phash"):
+            self._by_phash.setdefault(entry["phash"], canonical)
+        if canonical != url:
+            self._canonical[url] = canonical
+        if entry.get("source"):
+            self._by_source[entry["source"]] = canonical
+        if entry.get("size"):
+            self._sizes.setdefault(canonical, entry["size"])
+        if entry.get("width") and entry.get("height"):
+            self._dimensions.setdefault(canonical, (entry["width"], entry["height"]))
+        if entry.get("dimensions_failed"):
+            self._dimensions_failed[canonical] = entry.get("recorded_at") or 0
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.path.exists():
+            return
+        with self.path.open("r", encoding="utf-8") as fp:
+            for line in fp:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("url"):
+                    self._index(entry)
+
+    def lookup_source(self, source: Optional[str]) -> Optional[str]:
+        if not source:
+            return None
+        with self._lock:
+            self._load()
+            return self._by_source.get(source)
+
+    def lookup_hash(self, sha256: Optional[str]) -> Optional[str]:
+        if not sha256:
+            return None
+        with self._lock:
+            self._load()
+            return self._by_hash.get(sha256)
+
+    def lookup_perceptual(self, phash: Optional[str]) -> Optional[str]:
+        if not phash:
+            return None
+        with self._lock:
+            self._load()
+            return self._by_phash.get(phash)
+
+    def size_of(self, url: str) -> Optional[int]:
+        """記録済みの画像のバイト数（不明な場合は None）"""
+        with self._lock:
+            self._load()
+            return self._sizes.get(self._canonical.get(url, url))
+
+    def dimensions_of(self, url: str) -> Optional[Tuple[int, int]]:
+        """記録済みの画像の (幅, 高さ)（不明な場合は None）"""
+        with self._lock:
+            self._load()
+            return self._dimensions.get(self._canonical.get(url, url))
+
+    def dimensions_failed_since(self, url: str, since: float) -> bool:
+        """since 以降に幅と高さを読めなかったことが記録されているか"""
+        with self._lock:
+            self._load()
+            return self._dimensions_failed.get(self._canonical.get(url, url), 0) >= since
+
+    def canonical_url(self, url: str) -> str:
+        """同じ画像に対して最初に記録された永続URL（重複がなければ url のまま）"""
+        with self._lock:
+            self._load()
+            return self._canonical.get(url, url)
+
+    def record(
+        self,
+        url: str,
+        source: Optional[str] = None,
+        sha256: Optional[str] = None,
+        image_id: Optional[str] = None,
+        phash: Optional[str] = None,
+        size: Optional[int] = None,
+        dimensions: Optional[Tuple[int, int]] = None,
+        dimensions_failed: bool = False,
+    ) -> None:
+        width, height = dimensions or (None, None)
+        entry = {
+            "source": source,
+            "sha256": sha256,
+            "phash": phash,
+            "size": size,
+            "width": width,
+            "height": height,
+            "url": url,
+            "image_id": image_id,
+            "recorded_at": int(time.time()),
+        }
+        if dimensions_failed:
+            entry["dimensions_failed"] = True
+        with self._lock:
+            self._load()
+            self._index(entry)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as fp:
+                fp.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+# すべての同期モジュールで共有するキャッシュ
+IMAGE_CACHE = ImageCache(DEFAULT_CACHE_PATH)
@@ -0,0 +1,118 @@
+"""
+データセットをまたいだ画像の重複排除
+同じロゴや商品画像がグリッド・アフィリエイト記事・ECプロジェクトなどに何度も出てくるため、
+アップロード前に画像キャッシュ（utils.image_cache）で同じ画像を探し、1回だけアップロードします。
+ここでは任意の知覚ハッシュと、重複排除で省いた通信量・API呼び出し数の集計を扱います。
+
+知覚ハッシュ（dHash）は Pillow がインストールされていて、IMAGE_DEDUP_PERCEPTUAL=1
+（または enable_perceptual_hash()）のときだけ使います。再エンコードなどでバイト列だけが違う画像の
+候補として集計に数えますが、アイコンや単色に近いバナーなどは別の画像でもハッシュが一致しやすいため、
+参照の置き換えには使いません（同一とみなすのは内容の SHA-256 が一致した場合だけです）。
+"""
+import io
+import os
+import sys
+import threading
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Optional
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow は任意
+    Image = None
+
+
+_perceptual_enabled = os.environ.get("IMAGE_DEDUP_PERCEPTUAL") == "1"
+
+
+def enable_perceptual_hash(enabled: bool = True) -> bool:
+    """知覚ハッシュによる重複候補の集計を切り替え、実際に有効になったかを返す"""
+    global _perceptual_enabled
+    if enabled and Image is None:
+        print("[WARNING] Pillow がインストールされていないため、知覚ハッシュによる重複候補の集計は無効です。", file=sys.stderr)
+        enabled = False
+    _perceptual_enabled = enabled
+    return enabled
+
+
+def perceptual_hash(image_data: bytes) -> Optional[str]:
+    """画像の dHash（64bit、16進数）。無効な場合や画像として読めない場合は None"""
+    if not _perceptual_enabled or Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            pixels = list(image.convert("L").resize((9, 8)).getdata())
+    except Exception:
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+@dataclass
+class DedupStats:
+    uploaded: int = 0
+    uploaded_bytes: int = 0
+    # uploaded のうち、URLを渡してCloudflare側で取得させたもの（転送量は uploaded_bytes に含まれない）
+    uploaded_by_url: int = 0
+    # どのキーで既存の永続URLを再利用できたか（source / sha256 / existing）
+    # existing は同じ画像IDの画像がCloudflare Imagesに既にあったもの
+    reused: Dict[str, int] = field(default_factory=lambda: {"source": 0, "sha256": 0, "existing": 0})
+    # 知覚ハッシュが一致したが、別の画像としてアップロードしたもの（見た目が同じ可能性がある候補）
+    phash_candidates: int = 0
+    saved_bytes: int = 0
+    saved_api_calls: int = 0
+    # Cloudflare Imagesへの存在確認（GET）の回数。転送を省けた場合も呼び出しは発生している
+    lookup_calls: int = 0
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+
+    def record_upload(self, size: Optional[int], by_url: bool = False) -> None:
+        with self._lock:
+            self.uploaded += 1
+            self.uploaded_bytes += size or 0
+            if by_url:
+                self.uploaded_by_url += 1
+
+    def record_reuse(self, key: str, size: Optional[int]) -> None:
+        """
+        既存の永続URLを再利用した
+        source が一致した場合はダウンロードとアップロード、内容が一致した場合はアップロードを省いています。
+        existing は存在確認の呼び出しと引き換えに転送を省いたため、省いたAPI呼び出しには数えません。
+        """
+        with self._lock:
+            self.reused[key] += 1
+            if key != "existing":
+                self.saved_api_calls += 2 if key == "source" else 1
+            self.saved_bytes += (size or 0) * (2 if key == "source" else 1)
+
+    def record_lookup(self) -> None:
+        with self._lock:
+            self.lookup_calls += 1
+
+    def record_phash_candidate(self) -> None:
+        with self._lock:
+            self.phash_candidates += 1
+
+    def summary(self) -> str:
+        reused = sum(self.reused.values())
+        return (
+            f"{self.uploaded} 件をアップロード（{self.uploaded_bytes / 1024:.0f} KB、URL指定 {self.uploaded_by_url} 件）、"
+            f"{reused} 件は既存の画像を再利用"
+            f"（URL {self.reused['source']} / 内容 {self.reused['sha256']} / 画像ID {self.reused['existing']}）、"
+            f"見た目が同じ候補 {self.phash_candidates} 件（置き換えなし）、"
+            f"省いた通信 {self.saved_bytes / 1024:.0f} KB・API呼び出し {self.saved_api_calls} 回"
+            f"（存在確認 {self.lookup_calls} 回）"
+        )
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            data = asdict(self)
+        return data
+
+
+# プロセス内のすべてのアップロードで共有する集計
+DEDUP_STATS = DedupStats()
@@ -0,0 +1,224 @@
+"""
+アップロード前の画像の前処理
+画像の先頭バイトから実際の形式（MIMEタイプ）と縦横のピクセル数を判定します。
+IMAGE_PREPROCESS=1（または enable_preprocessing()）で前処理を有効にすると、Pillow を使って
+最大幅（IMAGE_MAX_WIDTH、既定 1920px）までの縮小・EXIFなどのメタデータの削除・
+WebP / AVIF（IMAGE_OUTPUT_FORMAT）への再エンコードを行い、元の画像より小さくなった場合だけ置き換えます。
+Pillow がない環境や、SVG・アニメーションGIFなど変換しない形式では元の画像をそのまま使います。
+"""
+import io
+import os
+import struct
+import sys
+from typing import Optional, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow は任意
+    Image = None
+    ImageOps = None
+
+
+DEFAULT_MAX_WIDTH = 1920
+# 縦横のピクセル数の判定に読む先頭のバイト数
+# （JPEGはEXIFやC2PAなどのメタデータの後ろにSOFがあるため、余裕を持たせる）
+IMAGE_HEADER_BYTES = 256 * 1024
+DEFAULT_OUTPUT_FORMAT = "webp"
+DEFAULT_QUALITY = 82
+OUTPUT_MIME_TYPES = {"webp": "image/webp", "avif": "image/avif"}
+# 再エンコードしない形式（ベクター・アニメーションを含みうるもの）
+PASSTHROUGH_MIME_TYPES = {"image/svg+xml", "image/gif"}
+FILE_EXTENSIONS = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/gif": "gif",
+    "image/webp": "webp",
+    "image/avif": "avif",
+    "image/svg+xml": "svg",
+    "image/bmp": "bmp",
+    "image/x-icon": "ico",
+}
+
+_preprocess_enabled = os.environ.get("IMAGE_PREPROCESS") == "1"
+
+
+def sniff_mime_type(head: bytes) -> Optional[str]:
+    """先頭バイトから画像の形式を判定する（判定できない場合は None）"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"avif", b"avis"):
+        return "image/avif"
+    if head.startswith(b"BM"):
+        return "image/bmp"
+    if head.startswith(b"\x00\x00\x01\x00"):
+        return "image/x-icon"
+    text = head[:256].lstrip().lower()
+    if text.startswith(b"<svg") or (text.startswith(b"<?xml") and b"<svg" in head[:1024].lower()):
+        return "image/svg+xml"
+    return None
+
+
+def _exif_orientation(segment: bytes) -> int:
+    """JPEGのAPP1（Exif）セグメントから向き（1〜8）を読む"""
+    if not segment.startswith(b"Exif\x00\x00") or len(segment) < 14:
+        return 1
+    tiff = segment[6:]
+    endian = {b"II": "<", b"MM": ">"}.get(tiff[:2])
+    if endian is None:
+        return 1
+    try:
+        offset = struct.unpack(endian + "I", tiff[4:8])[0]
+        count = struct.unpack(endian + "H", tiff[offset:offset + 2])[0]
+        for index in range(count):
+            entry = offset + 2 + index * 12
+            tag, _, _, value = struct.unpack(endian + "HHIH", tiff[entry:entry + 10])
+            if tag == 0x0112:
+                return value
+    except struct.error:
+        pass
+    return 1
+
+
+def _jpeg_dimensions(head: bytes) -> Optional[Tuple[int, int]]:
+    orientation = 1
+    offset = 2
+    while offset + 4 <= len(head):
+        if head[offset] != 0xFF:
+            return None
+        marker = head[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        length = struct.unpack(">H", head[offset + 2:offset + 4])[0]
+        if marker == 0xE1:
+            orientation = _exif_orientation(head[offset + 4:offset + 2 + length])
+        elif 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            if offset + 9 > len(head):
+                return None
+            height, width = struct.unpack(">HH", head[offset + 5:offset + 9])
+            # 向きが 5〜8 の画像はブラウザで90度回転して表示される
+            return (height, width) if orientation >= 5 else (width, height)
+        offset += 2 + length
+    return None
+
+
+def _webp_dimensions(head: bytes) -> Optional[Tuple[int, int]]:
+    chunk = head[12:16]
+    if chunk == b"VP8 " and head[23:26] == b"\x9d\x01\x2a":
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and head[20:21] == b"\x2f":
+        bits = struct.unpack("<I", head[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X":
+        return int.from_bytes(head[24:27], "little") + 1, int.from_bytes(head[27:30], "little") + 1
+    return None
+
+
+def image_dimensions(head: bytes) -> Optional[Tuple[int, int]]:
+    """
+    画像の先頭バイト（ヘッダー）から表示時の (幅, 高さ) を読む（判定できない場合は None）
+    画像全体をデコードしないため Pillow は不要です。JPEGはEXIFの向きを反映します。
+    """
+    mime_type = sniff_mime_type(head)
+    try:
+        if mime_type == "image/jpeg":
+            size = _jpeg_dimensions(head)
+        elif mime_type == "image/png" and head[12:16] == b"IHDR":
+            size = struct.unpack(">II", head[16:24])
+        elif mime_type == "image/gif":
+            size = struct.unpack("<HH", head[6:10])
+        elif mime_type == "image/webp":
+            size = _webp_dimensions(head)
+        elif mime_type == "image/avif":
+            # 主画像の ispe ボックス（version/flags の後に幅と高さ）
+            index = head.find(b"ispe")
+            size = struct.unpack(">II", head[index + 8:index + 16]) if index >= 0 else None
+        elif mime_type == "image/bmp":
+            width, height = struct.unpack("<ii", head[18:26])
+            size = (width, abs(height))
+        else:
+            size = None
+    except struct.error:
+        return None
+    if not size or not size[0] or not size[1]:
+        return None
+    return int(size[0]), int(size[1])
+
+
+def file_extension(mime_type: Optional[str]) -> str:
+    return FILE_EXTENSIONS.get(mime_type or "", "bin")
+
+
+def enable_preprocessing(enabled: bool = True) -> bool:
+    """前処理を切り替え、実際に有効になったかを返す"""
+    global _preprocess_enabled
+    if enabled and Image is None:
+        print("[WARNING] Pillow がインストールされていないため、画像の前処理は無効です。", file=sys.stderr)
+        enabled = False
+    _preprocess_enabled = enabled
+    return enabled
+
+
+def preprocessing_enabled() -> bool:
+    return _preprocess_enabled and Image is not None
+
+
+def _max_width() -> int:
+    try:
+        return int(os.environ.get("IMAGE_MAX_WIDTH", DEFAULT_MAX_WIDTH))
+    except ValueError:
+        return DEFAULT_MAX_WIDTH
+
+
+def _encode(image, output_format: str) -> Optional[bytes]:
+    buffer = io.BytesIO()
+    try:
+        # exif などを渡さずに保存するため、メタデータは書き出されない
+        image.save(buffer, format=output_format.upper(), quality=DEFAULT_QUALITY)
+    except (KeyError, OSError, ValueError):
+        return None
+    return buffer.getvalue()
+
+
+def preprocess_image(image_data: bytes) -> Tuple[bytes, Optional[str]]:
+    """
+    アップロードする画像の (バイナリデータ, MIMEタイプ) を返す
+    前処理が無効な場合・変換しない形式の場合・変換後の方が大きい場合は元の画像を返します。
+    """
+    mime_type = sniff_mime_type(image_data[:1024])
+    if not preprocessing_enabled() or mime_type is None or mime_type in PASSTHROUGH_MIME_TYPES:
+        return image_data, mime_type
+
+    output_format = os.environ.get("IMAGE_OUTPUT_FORMAT", DEFAULT_OUTPUT_FORMAT).lower()
+    if output_format not in OUTPUT_MIME_TYPES:
+        output_format = DEFAULT_OUTPUT_FORMAT
+    try:
+        with Image.open(io.BytesIO(image_data)) as source:
+            if getattr(source, "is_animated", False):
+                return image_data, mime_type
+            # EXIFの向きを画素に反映してから、メタデータなしで保存する
+            image = ImageOps.exif_transpose(source)
+            max_width = _max_width()
+            if image.width > max_width:
+                image = image.resize((max_width, round(image.height * max_width / image.width)), Image.LANCZOS)
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+            encoded = _encode(image, output_format)
+            if encoded is None and output_format != DEFAULT_OUTPUT_FORMAT:
+                # AVIF に対応していない Pillow では WebP にする
+                output_format = DEFAULT_OUTPUT_FORMAT
+                encoded = _encode(image, output_format)
+    except Exception as e:
+        print(f"[WARNING] 画像の前処理に失敗したため、元の画像を使用します: {e}", file=sys.stderr)
+        return image_data, mime_type
+
+    if encoded is None or len(encoded) >= len(image_data):
+        return image_data, mime_type
+    return encoded, OUTPUT_MIME_TYPES[output_format]
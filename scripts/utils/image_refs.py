@@ -0,0 +1,101 @@
+"""
+データセットのJSONに含まれる画像の参照
+グリッド・プロジェクトの画像リスト（*_image の要素の url）、記事のアイキャッチ（image など）、
+本文HTML（content）の<img>から画像URLを列挙し、対応表に従って書き換えます。
+URLを書き換えた画像に srcset があれば、新しいURLで作り直します。
+"""
+import html
+import re
+from typing import Dict, Iterator, Optional, Tuple
+
+from .responsive_images import build_srcset
+
+
+# 画像URLそのものが入るキー（grid_image / project_image の要素の url など）
+IMAGE_URL_KEYS = {"image", "thumbnail", "cover"}
+IMAGE_LIST_SUFFIX = "_image"
+HTML_KEYS = {"content"}
+IMG_SRC_PATTERN = re.compile(r'(<img[^>]*?\ssrc=["\'])([^"\']+)(["\'])', re.IGNORECASE)
+IMG_TAG_PATTERN = re.compile(r"<img[^>]*>", re.IGNORECASE)
+SRCSET_ATTR_PATTERN = re.compile(r'\ssrcset="[^"]*"')
+WIDTH_ATTR_PATTERN = re.compile(r'\swidth="(\d+)"')
+# (URLのキー, srcset のキー, 幅のキー)。画像リストの要素と記事のアイキャッチ画像
+SRCSET_KEYS = (("url", "srcset", "width"), ("image", "imageSrcset", "imageWidth"))
+
+
+def iter_image_refs(value, key: Optional[str] = None, in_image_list: bool = False) -> Iterator[str]:
+    """JSONの中の画像URLを列挙する"""
+    if isinstance(value, dict):
+        for child_key, child in value.items():
+            if in_image_list and child_key == "url" and isinstance(child, str):
+                yield child
+            else:
+                yield from iter_image_refs(child, child_key)
+    elif isinstance(value, list):
+        for item in value:
+            yield from iter_image_refs(item, key, in_image_list=bool(key and key.endswith(IMAGE_LIST_SUFFIX)))
+    elif isinstance(value, str) and value:
+        if key in IMAGE_URL_KEYS:
+            yield value
+        elif key in HTML_KEYS:
+            for match in IMG_SRC_PATTERN.finditer(value):
+                yield match.group(2)
+
+
+def refresh_srcset(entry: Dict) -> None:
+    """URLを書き換えた要素の srcset を新しいURLで作り直す（作れない場合は None）"""
+    for url_key, srcset_key, width_key in SRCSET_KEYS:
+        if entry.get(srcset_key) and entry.get(url_key):
+            entry[srcset_key] = build_srcset(entry[url_key], entry.get(width_key))
+
+
+def _refresh_srcset_attr(img_tag: str, url: str) -> str:
+    if not SRCSET_ATTR_PATTERN.search(img_tag):
+        return img_tag
+    width = WIDTH_ATTR_PATTERN.search(img_tag)
+    srcset = build_srcset(url, int(width.group(1)) if width else None)
+    replacement = f' srcset="{html.escape(srcset)}"' if srcset else ""
+    return SRCSET_ATTR_PATTERN.sub(lambda _: replacement, img_tag)
+
+
+def rewrite_refs(value, mapping: Dict[str, str], key: Optional[str] = None, in_image_list: bool = False) -> Tuple[object, int]:
+    """画像URLの参照を mapping に従って書き換え、(新しい値, 書き換えた参照数) を返す"""
+    if isinstance(value, dict):
+        count = 0
+        for child_key, child in value.items():
+            if in_image_list and child_key == "url" and isinstance(child, str):
+                if mapping.get(child, child) != child:
+                    value[child_key] = mapping[child]
+                    count += 1
+            else:
+                value[child_key], child_count = rewrite_refs(child, mapping, child_key)
+                count += child_count
+        if count:
+            refresh_srcset(value)
+        return value, count
+    if isinstance(value, list):
+        count = 0
+        nested_in_image_list = bool(key and key.endswith(IMAGE_LIST_SUFFIX))
+        for index, item in enumerate(value):
+            value[index], item_count = rewrite_refs(item, mapping, key, nested_in_image_list)
+            count += item_count
+        return value, count
+    if isinstance(value, str) and value:
+        if key in IMAGE_URL_KEYS and mapping.get(value, value) != value:
+            return mapping[value], 1
+        if key in HTML_KEYS:
+            count = 0
+
+            def replace(match: "re.Match") -> str:
+                nonlocal count
+                img_tag = match.group(0)
+                src_match = IMG_SRC_PATTERN.match(img_tag)
+                if not src_match or mapping.get(src_match.group(2), src_match.group(2)) == src_match.group(2):
+                    return img_tag
+                count += 1
+                url = mapping[src_match.group(2)]
+                img_tag = img_tag[:src_match.start(2)] + url + img_tag[src_match.end(2):]
+                return _refresh_srcset_attr(img_tag, url)
+
+            return IMG_TAG_PATTERN.sub(replace, value), count
+    return value, 0
@@ -0,0 +1,145 @@
+"""
+同期の実行ごとの画像の解決（Notionの一時URL → 永続URL）
+記事の本文・アイキャッチ・各データセットの画像・upload_missing_images など、一時URLを永続URLに
+置き換える処理はすべて IMAGE_RESOLVER を通し、同じ画像を1回の実行で1回だけ処理します。
+- 同じ画像（取得元のNotionファイル）を別のスレッドが処理中なら、その結果を待って使う
+  （並列に処理している記事どうしで、同じ画像を同時にダウンロード・アップロードしない）
+- 解決できた永続URLは実行中ずっと覚えておき、2回目以降は画像キャッシュも見ずに返す
+- 失敗した画像は覚えず、次に出てきたときに改めて処理する
+画像キャッシュ（utils.image_cache）が実行をまたいだ再利用を、ここでは1回の実行の中での共有を扱います。
+管理画面（notion_grid_admin）ではジョブごとに reset() し、ジョブをまたいで結果を持ち越しません。
+"""
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional
+
+from .cloudflare_images import DEFAULT_IMAGE_UPLOAD_CONCURRENCY, is_permanent_url, upload_image_from_url
+from .image_cache import source_key
+
+
+@dataclass
+class ResolverStats:
+    # 永続URLへの置き換えを求められた一時URLの数
+    requested: int = 0
+    # 実際に処理した（画像キャッシュの確認・ダウンロード・アップロードを行った）数
+    resolved: int = 0
+    # この実行で解決済みの結果を返した数
+    memoized: int = 0
+    # 別のスレッドが処理中の画像の結果を待って使った数
+    joined: int = 0
+    failed: int = 0
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+
+    def record(self, key: str) -> None:
+        with self._lock:
+            setattr(self, key, getattr(self, key) + 1)
+
+    def summary(self) -> str:
+        return (
+            f"画像 {self.requested} 件のうち {self.resolved} 件を処理（失敗 {self.failed} 件）、"
+            f"解決済みの再利用 {self.memoized} 件・処理中の画像との共有 {self.joined} 件"
+            f"（省いたダウンロード・アップロード {self.memoized + self.joined} 件）"
+        )
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            data = asdict(self)
+        return data
+
+
+class ImageResolver:
+    """取得元のNotionファイルごとに、解決中・解決済みの永続URLを Future で共有します。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results: Dict[str, Future] = {}
+        self.stats = ResolverStats()
+
+    def resolve(self, url: str, image_id: Optional[str] = None) -> str:
+        """
+        一時URLを永続URLに置き換える（永続URLはそのまま。失敗した場合は元のURL）
+
+        Args:
+            url: 画像のURL
+            image_id: オプションの画像ID（同じ画像を最初に処理した呼び出しのものを使う）
+        """
+        if not url or is_permanent_url(url):
+            return url
+        key = source_key(url) or url
+        with self._lock:
+            self.stats.record("requested")
+            future = self._results.get(key)
+            owner = future is None
+            if owner:
+                future = self._results[key] = Future()
+            elif future.done():
+                self.stats.record("memoized")
+            else:
+                self.stats.record("joined")
+        if not owner:
+            # 署名だけが違う一時URLでも、同じファイルなら同じ永続URLになる
+            return future.result() or url
+
+        self.stats.record("resolved")
+        permanent_url = None
+        try:
+            permanent_url = upload_image_from_url(url, image_id=image_id)
+        except Exception as e:
+            print(f"[WARNING] 画像のアップロードに失敗したため、元のURLを使用します: {url[:100]}... - {e}", file=sys.stderr)
+        finally:
+            # KeyboardInterrupt などで中断した場合も、待っている呼び出しを止めたままにしない
+            if not permanent_url or permanent_url == url:
+                # 失敗は覚えない（待っていた呼び出しはそれぞれ元のURLを使う）
+                self.stats.record("failed")
+                permanent_url = None
+                with self._lock:
+                    if self._results.get(key) is future:
+                        del self._results[key]
+            future.set_result(permanent_url)
+        return permanent_url or url
+
+    def reset(self) -> None:
+        """解決済みの結果と集計を破棄する（管理画面のように長く動くプロセスで、ジョブの開始ごとに呼ぶ）"""
+        with self._lock:
+            self._results = {}
+            self.stats = ResolverStats()
+
+    def resolve_many(
+        self, images: Dict[str, Optional[str]], concurrency: int = DEFAULT_IMAGE_UPLOAD_CONCURRENCY
+    ) -> Dict[str, str]:
+        """
+        複数の画像をまとめて並列に解決し、元のURL → 置き換え先URL の対応を返す
+
+        Args:
+            images: 元のURL → 画像ID（None可）
+            concurrency: 同時に処理する画像の数
+
+        Returns:
+            すべての元のURLを含む対応表。失敗した画像は元のURLのまま
+        """
+        # 永続URLは処理が不要なので、スレッドに渡さずに解決する
+        resolved = {url: url for url in images if not url or is_permanent_url(url)}
+        pending = [(url, image_id) for url, image_id in images.items() if url not in resolved]
+        if len(pending) <= 1 or concurrency <= 1:
+            resolved.update((url, self.resolve(url, image_id)) for url, image_id in pending)
+            return resolved
+
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(pending)), thread_name_prefix="image-upload") as executor:
+            futures = [(url, executor.submit(self.resolve, url, image_id)) for url, image_id in pending]
+            for url, future in futures:
+                resolved[url] = future.result()
+        return resolved
+
+
+# 1回の実行（プロセス、管理画面では1ジョブ）のすべての画像の解決で共有する
+IMAGE_RESOLVER = ImageResolver()
+
+
+def print_resolver_stats(file=None) -> None:
+    """画像の解決の集計を表示（画像を扱わなかった場合は何もしない）"""
+    if IMAGE_RESOLVER.stats.requested:
+        print(f"[INFO] {IMAGE_RESOLVER.stats.summary()}", file=file or sys.stderr)
@@ -0,0 +1,142 @@
+"""
+管理者ページ用のバックグラウンドジョブ
+pull / push をリクエストハンドラの外で実行し、ジョブIDごとに
+データセット単位・ページ単位の進捗とキャンセル要求を保持します。
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+# 完了済みジョブを保持する件数（古いものから破棄）
+MAX_FINISHED_JOBS = 50
+
+
+class JobCancelled(Exception):
+    """キャンセル要求を受けたジョブの処理を中断するための例外"""
+
+
+class Job:
+    def __init__(self, action: str, dataset_keys: Iterable[str]):
+        self.id = uuid.uuid4().hex[:12]
+        self.action = action
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.datasets: Dict[str, Dict] = {
+            key: {"status": "queued", "pages": 0, "seconds": None, "error": None}
+            for key in dataset_keys
+        }
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    def cancel(self) -> None:
+        self._cancel_event.set()
+
+    def check_cancelled(self) -> None:
+        if self.cancelled:
+            raise JobCancelled(f"ジョブ {self.id} はキャンセルされました")
+
+    def page_progress(self, key: str) -> Callable[[int], None]:
+        """データセットの処理済みページ数を進めるコールバック（キャンセル確認を兼ねる）"""
+        def advance(count: int = 1) -> None:
+            self.check_cancelled()
+            with self._lock:
+                self.datasets[key]["pages"] += count
+
+        return advance
+
+    def update_dataset(self, key: str, **fields) -> None:
+        with self._lock:
+            self.datasets[key].update(fields)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "id": self.id,
+                "action": self.action,
+                "status": self.status,
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "cancel_requested": self.cancelled,
+                "datasets": {key: dict(progress) for key, progress in self.datasets.items()},
+            }
+
+
+class JobRunner:
+    """
+    ジョブを1件ずつ順番に実行するランナー
+    同じJSONファイルへの書き込みが重ならないよう、ジョブ同士は直列に処理します
+    （1ジョブ内のデータセットは perform_pull 側で並列化されます）。
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="admin-job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, action: str, dataset_keys: Iterable[str], func: Callable[[Job], None]) -> Job:
+        job = Job(action, dataset_keys)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, func)
+        return job
+
+    def _run(self, job: Job, func: Callable[[Job], None]) -> None:
+        if job.cancelled:
+            job.status = "cancelled"
+            job.finished_at = time.time()
+            return
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            func(job)
+            if job.cancelled:
+                job.status = "cancelled"
+            elif any(progress["status"] == "failed" for progress in job.datasets.values()):
+                job.status = "failed"
+            else:
+                job.status = "succeeded"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self) -> None:
+        finished = [job for job in self._jobs.values() if job.finished]
+        finished.sort(key=lambda job: job.created_at)
+        for job in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job.id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self.get(job_id)
+        if job is not None and not job.finished:
+            job.cancel()
+        return job
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return sorted(jobs, key=lambda job: job.created_at, reverse=True)
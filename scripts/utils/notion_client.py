@@ -0,0 +1,276 @@
+"""
+Notion API共通クライアント
+各同期スクリプトから共有されるレート制限付きのリクエスト関数を提供します。
+Notionの平均 3 req/s の制限に合わせたトークンバケットで送信ペースを制御し、
+接続は utils.http_pool のKeep-Aliveプールを使い回します。
+429 / 5xx は Retry-After またはジッター付き指数バックオフで再試行します。
+ただしページ・データベースを作成する POST は、Notion側で作成済みのまま失敗が返ることがあるため、
+429 と送信前の接続エラーだけを再試行します（重複して作成しないため）。
+データベースのクエリは query_database で行い、1回に取得するページ数を上限の100件にしたうえで、
+呼び出し元が使うプロパティだけを取得できます（filter_properties）。
+次のページは、呼び出し元が現在のページのレコードを処理している間にバックグラウンドで先読みします。
+"""
+import json
+import random
+import sys
+import threading
+import time
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+from .http_pool import HTTP_POOL
+
+
+NOTION_API_BASE = "https://api.notion.com/v1"
+NOTION_VERSION = "2022-06-28"
+
+# Notionの公式レート制限は平均 3 req/s（短時間のバーストは許容）
+NOTION_RATE_LIMIT_PER_SEC = 3.0
+NOTION_RATE_LIMIT_BURST = 3
+
+MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# 送り直すと重複して作成される（冪等でない）POST の送信先
+CREATE_PATHS = {"/pages", "/databases", "/comments"}
+# データベースのクエリ1回で取得できるページ数の上限（既定値も100だが、明示して往復を最小にする）
+QUERY_PAGE_SIZE = 100
+
+
+class NotionAPIError(RuntimeError):
+    """Notion APIがエラーを返した（または再試行を使い切った）ことを表す例外"""
+
+    def __init__(self, status: int, reason: str, body: str = "", method: str = "", path: str = ""):
+        super().__init__(f"Notion API 呼び出しに失敗しました: {status} {reason}")
+        self.status = status
+        self.reason = reason
+        self.body = body
+        # 失敗したリクエスト（呼び出し元がどのAPIの失敗かを判別するため）
+        self.method = method
+        self.path = path
+
+
+class TokenBucket:
+    """スレッドセーフなトークンバケット。acquire() は送信可能になるまでブロックします。"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    elapsed = now - self._updated_at
+                    self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+                    self._updated_at = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Retry-After を受け取った場合など、全スレッドの送信を一時停止する"""
+        with self._lock:
+            resume_at = time.monotonic() + seconds
+            if resume_at > self._paused_until:
+                self._paused_until = resume_at
+                self._tokens = 0.0
+                self._updated_at = resume_at
+
+
+# すべての同期モジュール・スレッドで共有するレート制限
+RATE_LIMITER = TokenBucket(NOTION_RATE_LIMIT_PER_SEC, NOTION_RATE_LIMIT_BURST)
+
+
+def _retry_delay(attempt: int, retry_after: Optional[str]) -> float:
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+    backoff = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt))
+    # フルジッター: 複数スレッドが同時に再試行しないよう待ち時間を散らす
+    return random.uniform(backoff / 2, backoff)
+
+
+def _creates_resource(method: str, path: str) -> bool:
+    return method.upper() == "POST" and path.split("?", 1)[0].rstrip("/") in CREATE_PATHS
+
+
+def notion_request(method: str, path: str, token: str, payload: Optional[Dict]) -> Dict:
+    url = f"{NOTION_API_BASE}{path}"
+    # 作成のリクエストは、Notionが処理していないと分かる失敗（429・送信前の接続エラー）だけを再試行する
+    idempotent = not _creates_resource(method, path)
+    data = None
+    if payload is not None:
+        data = json.dumps(payload).encode("utf-8")
+
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Notion-Version": NOTION_VERSION,
+    }
+    if data is not None:
+        headers["Content-Type"] = "application/json"
+
+    attempt = 0
+    while True:
+        RATE_LIMITER.acquire()
+        try:
+            response = HTTP_POOL.request(method, url, body=data, headers=headers)
+            body = response.body.decode("utf-8")
+            if not body:
+                return {}
+            return json.loads(body)
+        except urllib.error.HTTPError as error:
+            error_body = error.read().decode("utf-8")
+            retryable = error.code == 429 or (idempotent and error.code in RETRYABLE_STATUS_CODES)
+            if retryable and attempt < MAX_RETRIES:
+                retry_after = error.headers.get("Retry-After") if error.headers else None
+                delay = _retry_delay(attempt, retry_after)
+                if error.code == 429:
+                    RATE_LIMITER.pause(delay)
+                print(
+                    f"[WARNING] Notion API {error.code} {error.reason}: {delay:.1f}秒後に再試行します（{attempt + 1}/{MAX_RETRIES}）",
+                    file=sys.stderr,
+                )
+                time.sleep(delay)
+                attempt += 1
+                continue
+            print(f"[ERROR] Notion API 呼び出しに失敗しました: {error.code} {error.reason}", file=sys.stderr)
+            if error_body:
+                print(error_body, file=sys.stderr)
+            raise NotionAPIError(error.code, str(error.reason), error_body, method, path) from error
+        except urllib.error.URLError as error:
+            # 接続リセット・タイムアウトなどのネットワークエラーも再試行対象
+            # （送信後のタイムアウトなどはNotionが処理した可能性があるため、作成のリクエストは再試行しない）
+            sent = getattr(error, "sent", True)
+            if (idempotent or not sent) and attempt < MAX_RETRIES:
+                delay = _retry_delay(attempt, None)
+                print(f"[WARNING] Notion API への接続に失敗しました（{error.reason}）: {delay:.1f}秒後に再試行します", file=sys.stderr)
+                time.sleep(delay)
+                attempt += 1
+                continue
+            raise
+
+
+# データベースID → プロパティ名 → プロパティID（プロセス内でキャッシュ。forget_property_ids で破棄する）
+_PROPERTY_IDS: Dict[str, Dict[str, str]] = {}
+_PROPERTY_IDS_LOCK = threading.Lock()
+
+
+def property_ids(database_id: str, token: str) -> Dict[str, str]:
+    """データベースのプロパティ名 → プロパティID"""
+    with _PROPERTY_IDS_LOCK:
+        cached = _PROPERTY_IDS.get(database_id)
+    if cached is not None:
+        return cached
+    database = notion_request("GET", f"/databases/{database_id}", token, None)
+    ids = {name: prop["id"] for name, prop in database.get("properties", {}).items() if prop.get("id")}
+    with _PROPERTY_IDS_LOCK:
+        _PROPERTY_IDS[database_id] = ids
+    return ids
+
+
+def forget_property_ids(database_id: Optional[str] = None) -> None:
+    """
+    キャッシュしたプロパティIDを破棄する（database_id を省略した場合はすべて）
+    データベースを解決し直したときや、管理画面でジョブを始めるときに呼び、
+    プロパティの名前変更・作り直しの後に古いIDで filter_properties を組み立てないようにします。
+    """
+    with _PROPERTY_IDS_LOCK:
+        if database_id is None:
+            _PROPERTY_IDS.clear()
+            return
+        normalized = database_id.replace("-", "").lower()
+        for key in [key for key in _PROPERTY_IDS if key.replace("-", "").lower() == normalized]:
+            del _PROPERTY_IDS[key]
+
+
+def _filter_properties_query(database_id: str, token: str, properties: Iterable[str]) -> str:
+    ids = property_ids(database_id, token)
+    # データベースにないプロパティは取得できないため除く（1つも残らなければ全プロパティを取得する）
+    selected: List[str] = [ids[name] for name in dict.fromkeys(properties) if name in ids]
+    # プロパティIDはURLエンコード済みの文字列で返される
+    return "&".join(f"filter_properties={quote(prop_id, safe='%')}" for prop_id in selected)
+
+
+def query_database(
+    database_id: str,
+    token: str,
+    query_filter: Optional[Dict] = None,
+    properties: Optional[Iterable[str]] = None,
+    sorts: Optional[List[Dict]] = None,
+) -> Iterator[Dict]:
+    """
+    データベースのページをすべて（カーソルをたどって）返す
+    next_cursor が分かった時点で次のページの取得を始めるため、一覧の通信待ちと
+    呼び出し元のレコードごとの処理（本文の取得・画像のアップロードなど）が重なります。
+
+    Args:
+        query_filter: クエリの filter
+        properties: 取得するプロパティ名（None の場合はすべて）。タイトルだけが必要な件数の確認などでは、
+            大きな rich_text を含む他のプロパティを取得しないため、応答が小さくなる
+        sorts: クエリの sorts
+    """
+    path = f"/databases/{database_id}/query"
+    if properties is not None:
+        query = _filter_properties_query(database_id, token, properties)
+        if query:
+            path = f"{path}?{query}"
+
+    def fetch(cursor: Optional[str]) -> Dict:
+        payload: Dict = {"page_size": QUERY_PAGE_SIZE}
+        if cursor:
+            payload["start_cursor"] = cursor
+        if query_filter:
+            payload["filter"] = query_filter
+        if sorts:
+            payload["sorts"] = sorts
+        return notion_request("POST", path, token, payload)
+
+    # 先読みは1ページ分だけ（送信ペースは共有のレート制限で抑えられる）
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="notion-query")
+    try:
+        response = fetch(None)
+        while True:
+            cursor = response.get("next_cursor")
+            prefetch = executor.submit(fetch, cursor) if response.get("has_more") and cursor else None
+            yield from response.get("results", [])
+            if prefetch is None:
+                break
+            response = prefetch.result()
+    finally:
+        # 呼び出し元が途中でやめた場合は、未着手の先読みを破棄する
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_titled_pages(
+    database_id: str,
+    token: str,
+    title_property: str,
+    query_filter: Optional[Dict] = None,
+    properties: Optional[Iterable[str]] = None,
+) -> Iterator[Tuple[str, Dict]]:
+    """
+    (タイトル, ページ) を取得した順に返す（タイトルが空のページは除く）
+    properties を指定した場合は、タイトルとそのプロパティだけを取得します。
+    """
+    if properties is not None:
+        properties = [title_property, *properties]
+    for page in query_database(database_id, token, query_filter=query_filter, properties=properties):
+        title_items = page.get("properties", {}).get(title_property, {}).get("title", [])
+        title = title_items[0].get("plain_text", "").strip() if title_items else ""
+        if title:
+            yield title, page
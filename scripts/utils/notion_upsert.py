@@ -0,0 +1,220 @@
+"""
+Notionデータベースへの一括upsert
+取得済みの既存ページのプロパティと書き込み予定のペイロードを比較し、
+内容が変わらないページへの PATCH を省略したうえで、残りの作成・更新・アーカイブを並列に送信します。
+送信ペースは utils.notion_client の共有レート制限で抑えられるため、
+並列化しても 3 req/s を超えることはありません。
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .notion_client import notion_request
+
+
+# 書き込みの同時実行数（レート制限待ちの間に応答待ちを重ねる程度で十分）
+DEFAULT_WRITE_CONCURRENCY = 3
+
+_DEFAULT_ANNOTATIONS = {
+    "bold": False,
+    "italic": False,
+    "strikethrough": False,
+    "underline": False,
+    "code": False,
+    "color": "default",
+}
+
+
+@dataclass
+class UpsertResult:
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    archived: int = 0
+
+    def summary(self) -> str:
+        text = f"{self.created} 件を新規作成、{self.updated} 件を更新、{self.unchanged} 件は変更なし"
+        if self.archived:
+            text += f"、{self.archived} 件をアーカイブ"
+        return text
+
+    def to_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+def _rich_text_value(items: List[Dict]) -> Tuple[str, bool]:
+    text = ""
+    formatted = False
+    for item in items or []:
+        if "plain_text" in item:
+            text += item.get("plain_text") or ""
+        else:
+            text += (item.get("text") or {}).get("content", "")
+        annotations = item.get("annotations") or {}
+        link = item.get("href") or (item.get("text") or {}).get("link")
+        # 太字・リンクなどNotion側で付けた装飾は、プレーンテキストで上書きすると失われるため差分として扱う
+        if link or any(annotations.get(key, default) != default for key, default in _DEFAULT_ANNOTATIONS.items()):
+            formatted = True
+    return text, formatted
+
+
+def _file_value(file_obj: Dict) -> Tuple[str, str, str]:
+    file_type = file_obj.get("type") or ("external" if "external" in file_obj else "file")
+    url = (file_obj.get(file_type) or {}).get("url", "")
+    return file_type, file_obj.get("name", ""), url
+
+
+def normalize_property(prop: Dict) -> Optional[Tuple]:
+    """
+    プロパティ値を比較用の形に揃える
+    書き込み用ペイロード（{"select": {"name": ...}}）と取得したページのプロパティ
+    （{"id": ..., "type": "select", "select": {...}}）のどちらも受け付けます。
+    比較方法が定まらない型は None を返します（常に更新対象）。
+    """
+    prop_type = prop.get("type")
+    if prop_type is None:
+        prop_type = next((key for key in prop if key != "id"), None)
+    if prop_type is None:
+        return None
+    value = prop.get(prop_type)
+
+    if prop_type in ("title", "rich_text"):
+        return (prop_type, _rich_text_value(value))
+    if prop_type in ("select", "status"):
+        return (prop_type, value.get("name") if value else None)
+    if prop_type == "multi_select":
+        return (prop_type, tuple(option.get("name") for option in value or []))
+    if prop_type == "number":
+        return (prop_type, float(value) if value is not None else None)
+    if prop_type in ("url", "email", "phone_number", "checkbox"):
+        return (prop_type, value or None)
+    if prop_type == "date":
+        return (prop_type, (value.get("start"), value.get("end")) if value else None)
+    if prop_type == "files":
+        return (prop_type, tuple(_file_value(file_obj) for file_obj in value or []))
+    return None
+
+
+def properties_changed(desired: Dict[str, Dict], existing: Dict[str, Dict]) -> bool:
+    """desired のプロパティのうち、既存ページと値が異なるものがあれば True"""
+    for name, prop in desired.items():
+        if name not in existing:
+            return True
+        desired_value = normalize_property(prop)
+        if desired_value is None or desired_value != normalize_property(existing[name]):
+            return True
+    return False
+
+
+def written_properties(records: Iterable[Tuple[str, Dict[str, Dict]]]) -> List[str]:
+    """
+    レコードが書き込むプロパティ名（upsert_records の比較に必要なもの）
+    既存ページの取得をこのプロパティだけに絞ると（query_database の properties）、応答が小さくなります。
+    """
+    names: Dict[str, None] = {}
+    for _, properties in records:
+        names.update(dict.fromkeys(properties))
+    return list(names)
+
+
+_RESULT_LABELS = {"created": "CREATE", "updated": "UPDATE", "unchanged": "SKIP"}
+
+
+def _print_result(action: str, key: str) -> None:
+    print(f"[{_RESULT_LABELS[action]}] {key}")
+
+
+def _run_writes(
+    tasks: List[Tuple[str, Callable[[], None]]],
+    concurrency: int,
+    on_done: Callable[[str], None],
+) -> None:
+    if not tasks:
+        return
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="notion-write")
+    try:
+        futures: List[Tuple[str, Future]] = [(key, executor.submit(task)) for key, task in tasks]
+        for key, future in futures:
+            future.result()
+            on_done(key)
+    except BaseException:
+        # 失敗・キャンセル時は未着手の書き込みを破棄する
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+
+
+def upsert_records(
+    database_id: str,
+    token: str,
+    records: Iterable[Tuple[str, Dict[str, Dict]]],
+    existing_pages: Dict[str, Dict],
+    update_fields: Optional[Dict] = None,
+    concurrency: int = DEFAULT_WRITE_CONCURRENCY,
+    progress: Optional[Callable[[int], None]] = None,
+    report: Callable[[str, str], None] = _print_result,
+) -> UpsertResult:
+    """
+    レコードをデータベースに作成・更新する
+
+    Args:
+        records: (キー, プロパティのペイロード) の列。キーは existing_pages と同じ（タイトルなど）。
+        existing_pages: fetch_existing_pages で取得したキー → ページ
+        update_fields: PATCH 時にプロパティと一緒に送るフィールド（{"archived": False} など）
+        report: (created / updated / unchanged, キー) を受け取るログ出力
+    """
+    result = UpsertResult()
+    tasks: List[Tuple[str, Callable[[], None]]] = []
+    actions: Dict[str, str] = {}
+
+    for key, properties in records:
+        page = existing_pages.get(key)
+        if page is None:
+            payload = {"parent": {"database_id": database_id}, "properties": properties}
+            tasks.append((key, lambda payload=payload: notion_request("POST", "/pages", token, payload)))
+            actions[key] = "created"
+        elif properties_changed(properties, page.get("properties", {})):
+            payload = {"properties": properties, **(update_fields or {})}
+            path = f"/pages/{page['id']}"
+            tasks.append((key, lambda path=path, payload=payload: notion_request("PATCH", path, token, payload)))
+            actions[key] = "updated"
+        else:
+            result.unchanged += 1
+            report("unchanged", key)
+            if progress:
+                progress(1)
+
+    def on_done(key: str) -> None:
+        action = actions[key]
+        setattr(result, action, getattr(result, action) + 1)
+        report(action, key)
+        if progress:
+            progress(1)
+
+    _run_writes(tasks, concurrency, on_done)
+    return result
+
+
+def archive_pages(
+    token: str,
+    pages: Iterable[Dict],
+    payload: Optional[Dict] = None,
+    concurrency: int = DEFAULT_WRITE_CONCURRENCY,
+) -> int:
+    """
+    ページをまとめてアーカイブし、実際に書き込んだ件数を返す
+    payload を省略するとページ自体をアーカイブ（archived: true）します。
+    Statusプロパティで論理削除する場合など payload にプロパティを渡したときは、
+    すでにその値になっているページへの書き込みを省略します。
+    """
+    payload = payload or {"archived": True}
+    tasks: List[Tuple[str, Callable[[], None]]] = []
+    for page in pages:
+        if "properties" in payload and not properties_changed(payload["properties"], page.get("properties", {})):
+            continue
+        path = f"/pages/{page['id']}"
+        tasks.append((page["id"], lambda path=path: notion_request("PATCH", path, token, payload)))
+
+    archived: List[str] = []
+    _run_writes(tasks, concurrency, archived.append)
+    return len(archived)
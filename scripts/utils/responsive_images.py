@@ -0,0 +1,207 @@
+"""
+レスポンシブ画像の属性（srcset / sizes / width / height）
+Cloudflare Imagesの画像は幅ごとのバリアントのURLから srcset を作り、モバイルでは小さい画像を読み込ませます。
+バリアントはアカウント側の設定がないと 404 になるため、srcset は次のどちらかを設定した場合だけ付けます。
+- CLOUDFLARE_IMAGES_SRCSET_VARIANTS="small=480,medium=768,large=1200" のように名前付きバリアントと
+  その幅を指定した場合は、そのバリアントを使います
+- CLOUDFLARE_IMAGES_FLEXIBLE_VARIANTS=1 の場合は flexible variants（.../<画像ID>/w=480）を使います
+  （アカウントで flexible variants を有効にしておくこと）
+ローカル画像（image/...）は、Pillow がある場合に image/_srcset/ 以下へ縮小版を作って srcset に使います。
+width / height は画像キャッシュ、または画像のヘッダー（先頭のバイト）だけを読んで求め、
+読み込み中のレイアウトのずれを防ぎます。読めなかった画像は記録し、しばらくは読み直しません。
+"""
+import os
+import sys
+import time
+from pathlib import PurePosixPath
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from . import PROJECT_ROOT
+from .cloudflare_images import is_permanent_url
+from .http_pool import HTTP_POOL
+from .image_cache import IMAGE_CACHE
+from .image_preprocess import (
+    DEFAULT_QUALITY,
+    IMAGE_HEADER_BYTES,
+    PASSTHROUGH_MIME_TYPES,
+    Image,
+    ImageOps,
+    image_dimensions,
+    sniff_mime_type,
+)
+
+
+LOCAL_IMAGE_PREFIX = "image/"
+# ローカル画像の縮小版の置き場所（add_local_images_to_* が走査する image/ 直下とは分ける）
+LOCAL_SRCSET_DIR = "image/_srcset"
+DEFAULT_SRCSET_WIDTHS = (480, 768, 1200)
+# 幅と高さを読めなかった画像を読み直すまでの間隔
+DIMENSION_RETRY_SECONDS = 7 * 24 * 60 * 60
+# 記事本文の画像の表示幅（本文カラムの最大幅 800px）
+ARTICLE_IMAGE_SIZES = "(max-width: 800px) 100vw, 800px"
+
+
+def _srcset_widths() -> List[int]:
+    value = os.environ.get("IMAGE_SRCSET_WIDTHS")
+    if not value:
+        return list(DEFAULT_SRCSET_WIDTHS)
+    return sorted(int(width) for width in value.split(",") if width.strip().isdigit())
+
+
+def srcset_variants() -> List[Tuple[int, str]]:
+    """srcset に使う (幅, Cloudflare Imagesのバリアント名) の一覧（幅の昇順。設定がなければ空）"""
+    named = os.environ.get("CLOUDFLARE_IMAGES_SRCSET_VARIANTS")
+    if named:
+        variants = []
+        for item in named.split(","):
+            name, _, width = item.strip().partition("=")
+            if name and width.isdigit():
+                variants.append((int(width), name))
+        return sorted(variants)
+    if os.environ.get("CLOUDFLARE_IMAGES_FLEXIBLE_VARIANTS") == "1":
+        return [(width, f"w={width}") for width in _srcset_widths()]
+    return []
+
+
+def cloudflare_variant_url(url: str, variant: str) -> Optional[str]:
+    """imagedelivery.net のURL（/<アカウントハッシュ>/<画像ID>/<バリアント>）のバリアントを差し替える"""
+    parts = urlsplit(url)
+    if parts.netloc != "imagedelivery.net":
+        return None
+    segments = parts.path.strip("/").split("/")
+    if len(segments) != 3:
+        return None
+    return f"{parts.scheme}://{parts.netloc}/{segments[0]}/{segments[1]}/{variant}"
+
+
+def local_variant_path(path: str, width: int) -> str:
+    """ローカル画像の縮小版のパス（image/hero/a.jpg → image/_srcset/hero/a-480w.jpg）"""
+    relative = PurePosixPath(path).relative_to(LOCAL_IMAGE_PREFIX.rstrip("/"))
+    return str(PurePosixPath(LOCAL_SRCSET_DIR) / relative.parent / f"{relative.stem}-{width}w{relative.suffix}")
+
+
+def _ensure_local_variant(path: str, width: int) -> bool:
+    """縮小版がなければ作る（Pillow がない場合や作れない場合は False）"""
+    target = PROJECT_ROOT / local_variant_path(path, width)
+    if target.exists():
+        return True
+    if Image is None:
+        return False
+    try:
+        with Image.open(PROJECT_ROOT / path) as source:
+            image = ImageOps.exif_transpose(source)
+            image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+            if target.suffix.lower() in (".jpg", ".jpeg") and image.mode != "RGB":
+                image = image.convert("RGB")
+            target.parent.mkdir(parents=True, exist_ok=True)
+            image.save(target, quality=DEFAULT_QUALITY)
+    except Exception as e:
+        print(f"[WARNING] 縮小版の画像を作成できませんでした（{path}, {width}px）: {e}", file=sys.stderr)
+        return False
+    return True
+
+
+def _read_local_head(path: str) -> bytes:
+    try:
+        with (PROJECT_ROOT / path).open("rb") as fp:
+            return fp.read(IMAGE_HEADER_BYTES)
+    except OSError:
+        return b""
+
+
+def _fetch_dimensions(url: str) -> Optional[Tuple[int, int]]:
+    """画像の先頭だけを Range リクエストで取得し、ヘッダーから幅と高さを読む"""
+    headers = {"User-Agent": "Mozilla/5.0", "Range": f"bytes=0-{IMAGE_HEADER_BYTES - 1}"}
+    head = bytearray()
+    try:
+        with HTTP_POOL.stream("GET", url, headers=headers, timeout=30) as response:
+            for chunk in response.iter_chunks():
+                head.extend(chunk)
+                dimensions = image_dimensions(bytes(head))
+                if dimensions or len(head) >= IMAGE_HEADER_BYTES:
+                    return dimensions
+    except Exception as e:
+        print(f"[WARNING] 画像のサイズを取得できませんでした: {url[:100]}... - {e}", file=sys.stderr)
+        return None
+    return image_dimensions(bytes(head))
+
+
+def image_size(url: str) -> Optional[Tuple[int, int]]:
+    """
+    画像の表示時の (幅, 高さ)（不明な場合は None）
+    ローカル画像はファイルの先頭を読み、永続URLは画像キャッシュになければ先頭だけをダウンロードして記録します。
+    """
+    if not url:
+        return None
+    if url.startswith(LOCAL_IMAGE_PREFIX):
+        return image_dimensions(_read_local_head(url))
+    # Notionの一時URLは期限切れになるため記録しない
+    if not url.startswith(("http://", "https://")) or not is_permanent_url(url):
+        return None
+    dimensions = IMAGE_CACHE.dimensions_of(url)
+    if dimensions is None:
+        if IMAGE_CACHE.dimensions_failed_since(url, time.time() - DIMENSION_RETRY_SECONDS):
+            return None
+        dimensions = _fetch_dimensions(url)
+        if dimensions:
+            IMAGE_CACHE.record(url, dimensions=dimensions)
+        else:
+            IMAGE_CACHE.record(url, dimensions_failed=True)
+    return dimensions
+
+
+def build_srcset(url: str, width: Optional[int]) -> Optional[str]:
+    """
+    画像の srcset（作れない場合は None）
+    元の画像の幅より小さいバリアント（縮小版）を並べ、最後に元の画像を元の幅で加えます。
+    元の幅が不明な場合は、拡大されたバリアントを選ばせないよう srcset を作りません。
+    """
+    if not url or not width:
+        return None
+    candidates = []
+    if url.startswith(LOCAL_IMAGE_PREFIX):
+        # アニメーションを含みうるGIFやSVGは縮小版を作らない
+        if sniff_mime_type(_read_local_head(url)) in PASSTHROUGH_MIME_TYPES:
+            return None
+        for variant_width in _srcset_widths():
+            if variant_width < width and _ensure_local_variant(url, variant_width):
+                candidates.append(f"{local_variant_path(url, variant_width)} {variant_width}w")
+    else:
+        for variant_width, variant in srcset_variants():
+            variant_url = cloudflare_variant_url(url, variant)
+            if variant_url is None:
+                return None
+            if variant_width < width:
+                candidates.append(f"{variant_url} {variant_width}w")
+    if not candidates:
+        return None
+    candidates.append(f"{url} {width}w")
+    return ", ".join(candidates)
+
+
+def responsive_attrs(url: str, sizes: Optional[str] = None) -> Dict[str, str]:
+    """<img> に付ける width / height / srcset / sizes 属性（分かるものだけ）"""
+    dimensions = image_size(url)
+    if dimensions is None:
+        return {}
+    width, height = dimensions
+    attrs = {"width": str(width), "height": str(height)}
+    srcset = build_srcset(url, width)
+    if srcset:
+        attrs["srcset"] = srcset
+        if sizes:
+            attrs["sizes"] = sizes
+    return attrs
+
+
+def responsive_image_entry(url: str) -> Dict:
+    """画像リスト（grid_image / project_image）の要素に追加する width / height / srcset"""
+    attrs = responsive_attrs(url)
+    entry: Dict = {}
+    if attrs:
+        entry["width"] = int(attrs["width"])
+        entry["height"] = int(attrs["height"])
+    if attrs.get("srcset"):
+        entry["srcset"] = attrs["srcset"]
+    return entry
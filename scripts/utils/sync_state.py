@@ -0,0 +1,128 @@
+"""
+差分同期（incremental pull）の状態管理
+エクスポート先ごとに last_edited_time のウォーターマークと、
+Notionページ ID → JSONレコードのキーの対応を data/.sync/sync_state.json に保存します。
+差分モードでは前回以降に編集されたページだけを取得して既存JSONにマージし、
+一定間隔ごとに全件取得（削除・アーカイブの反映）を行います。
+"""
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from . import SYNC_CACHE_DIR
+
+
+DEFAULT_STATE_PATH = SYNC_CACHE_DIR / "sync_state.json"
+
+# 全件取得による突き合わせ（削除・アーカイブ検出）の間隔
+FULL_RECONCILE_INTERVAL_SECONDS = 24 * 60 * 60
+# Notionの last_edited_time は分単位に丸められるため、ウォーターマークを余裕をもって巻き戻す
+WATERMARK_MARGIN = timedelta(minutes=2)
+
+_STATE_LOCK = threading.Lock()
+
+
+def _load_all(path: Path) -> Dict[str, Dict]:
+    if not path.exists():
+        return {}
+    try:
+        with path.open("r", encoding="utf-8") as fp:
+            data = json.load(fp)
+            return data if isinstance(data, dict) else {}
+    except ValueError:
+        return {}
+
+
+def load_state(key: str, path: Path = DEFAULT_STATE_PATH) -> Dict:
+    with _STATE_LOCK:
+        return _load_all(path).get(key, {})
+
+
+def save_state(key: str, state: Dict, path: Path = DEFAULT_STATE_PATH) -> None:
+    # 複数データセットを並列にpullしても他のキーを上書きしないよう、読み直してから書き込む
+    with _STATE_LOCK:
+        data = _load_all(path)
+        data[key] = state
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with tmp_path.open("w", encoding="utf-8") as fp:
+            json.dump(data, fp, ensure_ascii=False, indent=2)
+        tmp_path.replace(path)
+
+
+def load_records(output_path: Path) -> List[Dict]:
+    if not output_path.exists():
+        return []
+    try:
+        with output_path.open("r", encoding="utf-8") as fp:
+            data = json.load(fp)
+            return data if isinstance(data, list) else []
+    except ValueError:
+        return []
+
+
+class IncrementalExport:
+    """1回のエクスポート処理における差分/全件の判定とマージ"""
+
+    def __init__(self, output_path: Path, incremental: bool, key_field: str):
+        self.output_path = output_path
+        self.key_field = key_field
+        self.state_key = str(output_path)
+        self.state = load_state(self.state_key)
+        self.started_at = datetime.now(timezone.utc)
+
+        last_full = self.state.get("last_full", 0)
+        self.full = (
+            not incremental
+            or not self.state.get("watermark")
+            or not output_path.exists()
+            or time.time() - last_full >= FULL_RECONCILE_INTERVAL_SECONDS
+        )
+
+    def query_filter(self) -> Optional[Dict]:
+        """差分モードなら last_edited_time のフィルタを返す（全件取得なら None）"""
+        if self.full:
+            return None
+        return {
+            "timestamp": "last_edited_time",
+            "last_edited_time": {"on_or_after": self.state["watermark"]},
+        }
+
+    def merge(self, changes: Iterable[Tuple[str, Optional[Dict]]]) -> List[Dict]:
+        """
+        取得したページをJSONレコードに反映する
+
+        Args:
+            changes: (NotionページID, レコード) の列。レコードが None のページは
+                     公開対象外になったものとして既存JSONから取り除きます。
+        """
+        if self.full:
+            records: Dict[str, Dict] = {}
+            page_keys: Dict[str, str] = {}
+        else:
+            records = {record.get(self.key_field): record for record in load_records(self.output_path)}
+            page_keys = dict(self.state.get("pages", {}))
+
+        for page_id, record in changes:
+            # タイトル変更に備え、以前のキーで保存されていたレコードを先に取り除く
+            previous_key = page_keys.pop(page_id, None)
+            if previous_key is not None:
+                records.pop(previous_key, None)
+            if record is None:
+                continue
+            key = record.get(self.key_field)
+            records[key] = record
+            page_keys[page_id] = key
+
+        self.state["pages"] = page_keys
+        return list(records.values())
+
+    def commit(self) -> None:
+        """エクスポートの成功後にウォーターマークを進める"""
+        self.state["watermark"] = (self.started_at - WATERMARK_MARGIN).isoformat(timespec="seconds")
+        if self.full:
+            self.state["last_full"] = int(self.started_at.timestamp())
+        save_state(self.state_key, self.state)
@@ -0,0 +1,177 @@
+"""
+ローカル画像の一括アップロードと、再開可能なマニフェスト
+ローカルの画像ファイルをワーカープールで並列にCloudflare Imagesへアップロードし、
+ファイルごとの (パス, サイズ, 更新時刻, SHA-256) → 永続URL をJSONLのマニフェストに1件ずつ追記します。
+- サイズと更新時刻がマニフェストと同じファイルは、読み込まずにスキップ
+- 更新時刻だけが変わったファイル（チェックアウトし直した場合など）は、内容のハッシュが同じならスキップ
+- 途中で中断しても、完了したファイルはマニフェストに残っているため、再実行すると続きから処理する
+"""
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from . import PROJECT_ROOT, SYNC_CACHE_DIR
+from .cloudflare_images import DEFAULT_IMAGE_UPLOAD_CONCURRENCY, upload_image_bytes
+from .image_cache import content_hash
+
+
+DEFAULT_MANIFEST_PATH = SYNC_CACHE_DIR / "upload_manifest.jsonl"
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".avif", ".svg"}
+
+
+def manifest_key(path: Path) -> str:
+    """マニフェストのキー（リポジトリ内のファイルは image/... のような相対パス）"""
+    path = path.resolve()
+    try:
+        return path.relative_to(PROJECT_ROOT).as_posix()
+    except ValueError:
+        return path.as_posix()
+
+
+class UploadManifest:
+    """追記専用のJSONL。同じパスの記録が複数ある場合は最後のものを使います。"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._entries: Dict[str, Dict] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.path.exists():
+            return
+        with self.path.open("r", encoding="utf-8") as fp:
+            for line in fp:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("path") and entry.get("url"):
+                    self._entries[entry["path"]] = entry
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            self._load()
+            return self._entries.get(key)
+
+    def record(self, key: str, size: int, mtime_ns: int, sha256: str, url: str, image_id: Optional[str] = None) -> None:
+        entry = {
+            "path": key,
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "sha256": sha256,
+            "url": url,
+            "image_id": image_id,
+            "uploaded_at": int(time.time()),
+        }
+        with self._lock:
+            self._load()
+            self._entries[key] = entry
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as fp:
+                fp.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+# すべてのスクリプトで共有するマニフェスト
+UPLOAD_MANIFEST = UploadManifest(DEFAULT_MANIFEST_PATH)
+
+
+@dataclass
+class UploadResult:
+    # ファイル → 永続URL（失敗したファイルは含まない）
+    urls: Dict[Path, str]
+    uploaded: int = 0
+    skipped: int = 0
+    failed: int = 0
+
+    def summary(self) -> str:
+        return f"アップロード {self.uploaded} 件、アップロード済みのためスキップ {self.skipped} 件、失敗 {self.failed} 件"
+
+
+def iter_local_images(directory: Path, recursive: bool = False) -> List[Path]:
+    """ディレクトリ内の画像ファイル（recursive の場合、_srcset などの "_" で始まるディレクトリは除く）"""
+    pattern = "**/*" if recursive else "*"
+    images = []
+    for path in sorted(directory.glob(pattern)):
+        if not path.is_file() or path.suffix.lower() not in IMAGE_SUFFIXES:
+            continue
+        if any(part.startswith("_") for part in path.relative_to(directory).parts[:-1]):
+            continue
+        images.append(path)
+    return images
+
+
+def _upload_file(path: Path, image_id: Optional[str], manifest: UploadManifest) -> Optional[Tuple[str, bool]]:
+    """(永続URL, スキップしたか) を返す。失敗した場合は None"""
+    key = manifest_key(path)
+    stat = path.stat()
+    entry = manifest.get(key)
+    if entry and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+        return entry["url"], True
+
+    image_data = path.read_bytes()
+    sha256 = content_hash(image_data)
+    if entry and entry.get("sha256") == sha256:
+        manifest.record(key, stat.st_size, stat.st_mtime_ns, sha256, entry["url"], entry.get("image_id"))
+        return entry["url"], True
+
+    # 同じ内容の画像が別のパスでアップロード済みなら、画像キャッシュのURLが再利用される
+    permanent_url = upload_image_bytes(image_data, image_id=image_id or f"local-{path.stem}", source=key)
+    if not permanent_url:
+        return None
+    manifest.record(key, stat.st_size, stat.st_mtime_ns, sha256, permanent_url, image_id)
+    return permanent_url, False
+
+
+def upload_local_files(
+    files: Dict[Path, Optional[str]],
+    concurrency: int = DEFAULT_IMAGE_UPLOAD_CONCURRENCY,
+    manifest: UploadManifest = UPLOAD_MANIFEST,
+) -> UploadResult:
+    """
+    ローカルの画像ファイルを並列にアップロードする（マニフェストに記録済みのファイルはスキップ）
+
+    Args:
+        files: ファイル → 画像ID（None の場合は local-<ファイル名>）
+        concurrency: 同時にアップロードするファイルの数
+        manifest: 記録先のマニフェスト
+
+    Returns:
+        ファイルごとの永続URLと、アップロード・スキップ・失敗の件数
+    """
+    result = UploadResult(urls={})
+
+    def upload(path: Path, image_id: Optional[str]) -> Optional[Tuple[str, bool]]:
+        try:
+            return _upload_file(path, image_id, manifest)
+        except Exception as e:
+            print(f"[WARNING] ローカル画像のアップロードに失敗しました: {path} - {e}", file=sys.stderr)
+            return None
+
+    items = list(files.items())
+    if len(items) <= 1 or concurrency <= 1:
+        outcomes = [upload(path, image_id) for path, image_id in items]
+    else:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(items)), thread_name_prefix="local-upload") as executor:
+            outcomes = list(executor.map(lambda item: upload(*item), items))
+
+    # 集計は呼び出し元のスレッドでまとめて行う
+    for (path, _), outcome in zip(items, outcomes):
+        if outcome is None:
+            result.failed += 1
+            continue
+        url, skipped = outcome
+        result.urls[path] = url
+        if skipped:
+            result.skipped += 1
+        else:
+            result.uploaded += 1
+    return result
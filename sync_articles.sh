@@ -6,6 +6,8 @@
 # 例: export NOTION_API_TOKEN="your_token_here"
 #     export CLOUDFLARE_IMAGES_ACCOUNT_ID="your_account_id_here"
 #     export CLOUDFLARE_IMAGES_API_TOKEN="your_token_here"
+# 回線が遅い環境では、画像をCloudflare側でNotionから取得させるとダウンロード・アップロードを省けます
+#     export CLOUDFLARE_IMAGES_UPLOAD_BY_URL=1
 
 # 環境変数が設定されているか確認
 if [ -z "$NOTION_API_TOKEN" ]; then
@@ -32,4 +34,4 @@ echo "   - Cloudflare Account ID: $CLOUDFLARE_IMAGES_ACCOUNT_ID"
 echo ""
 
 cd "$(dirname "$0")"
-python3 scripts/sync_affiling_articles.py pull --output data/affiling_articles.json
+python3 scripts/sync_affiling_articles.py pull --output data/affiling_articles.json --incremental